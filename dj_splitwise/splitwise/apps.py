@@ -0,0 +1,13 @@
+from django.apps import AppConfig
+from django.conf import settings
+
+
+class SplitwiseConfig(AppConfig):
+    name = 'splitwise'
+
+    # Overridden
+    def ready(self):
+        # logging is configured (settings.LOGGING) by now: moving the handlers behind a queue if opted in
+        if settings.LOGGING_QUEUE['ENABLED']:
+            from .instrumentation import QueueLogging
+            QueueLogging.start(settings.LOGGING_QUEUE['LOGGERS'])
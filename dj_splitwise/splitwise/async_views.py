@@ -0,0 +1,255 @@
+"""
+Async (ASGI native) variants of the read heavy endpoints, served under 'async/' with the same responses as
+their DRF counterparts in viewsets.py.
+
+DRF views are sync only: under ASGI, every request to them is run in a thread (sync_to_async). These are plain
+Django async views: the authentication (JWT), the permissions and the rendering are done here, and the database
+is read with the async ORM (aget, async for, ...), hence a worker process can hold many more requests in flight.
+- The middlewares of the project are async capable: the stack never switches to sync for these views
+- NOTE: Django still runs the async ORM queries in a single thread (sync_to_async, thread_sensitive),
+the queries of a request awaited together (asyncio.gather) overlap with the other requests, not with each other
+
+Ref: https://docs.djangoproject.com/en/5.1/topics/async/
+Ref: https://docs.djangoproject.com/en/5.1/topics/db/queries/#asynchronous-queries
+"""
+
+import asyncio
+import functools
+import logging
+from typing import Optional, Tuple
+from django.db.models import aprefetch_related_objects
+from django.http import Http404, HttpRequest, HttpResponse
+from rest_framework import status
+from rest_framework.exceptions import APIException, NotAuthenticated, PermissionDenied, ValidationError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.urls import replace_query_param
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+from .caches import SettlementCache
+from .conditionals import ConditionalGet
+from .enums import Query, SettlementType
+from .executors import ProcessPoolSettlementStrategy, fell_back
+from .factories import SettlementStrategyFactory
+from .instrumentation import Trace
+from .ledgers import GroupBalanceLedger
+from .models import Group, User
+from .queries import ExpenseFeedQuery, GroupMemberQuery
+from .serializers import GroupExpenseListReader, GroupSerializer, QueryExpenseFeedSerializer
+from .serializers import QueryGroupExpenseSerializer, QueryUserExpenseSerializer
+from .viewsets import QueryExpenseViewSet
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication reading the user with the async ORM: the token itself is validated in memory
+    """
+
+    async def aauthenticate(self, request: HttpRequest) -> Optional[Tuple[User, object]]:
+        header = self.get_header(request)
+        if header is None:
+            return None
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+        validated_token = self.get_validated_token(raw_token)
+        return await self.aget_user(validated_token), validated_token
+
+    async def aget_user(self, validated_token) -> User:
+        """
+        The async twin of 'get_user()'
+        """
+        try:
+            user_id = validated_token[jwt_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken('Token contained no recognizable user identification')
+        try:
+            user = await self.user_model.objects.aget(**{jwt_settings.USER_ID_FIELD: user_id})
+        except self.user_model.DoesNotExist:
+            raise AuthenticationFailed('User not found', code='user_not_found')
+        if not user.is_active:
+            raise AuthenticationFailed('User is inactive', code='user_inactive')
+        if jwt_settings.CHECK_REVOKE_TOKEN and \
+                validated_token.get(jwt_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password):
+            raise AuthenticationFailed("The user's password has been changed.", code='password_changed')
+        return user
+
+
+def render(data, status_code: int = status.HTTP_200_OK, headers: dict = None) -> HttpResponse:
+    """
+    :return: The data rendered as by the DRF views (JSONRenderer)
+    """
+    return HttpResponse(JSONRenderer().render(data), status=status_code, headers=headers,
+                        content_type='application/json')
+
+
+def not_modified(etag: str) -> HttpResponse:
+    return HttpResponse(status=status.HTTP_304_NOT_MODIFIED, headers=ConditionalGet.get_headers(etag))
+
+
+def async_api_view(view):
+    """
+    Turns an async function into a GET only, JWT authenticated API view: the APIExceptions and Http404 are
+    rendered as DRF would. Any other exception is left to the middlewares (see ExceptionMiddleware).
+    """
+    authentication = AsyncJWTAuthentication()
+
+    @functools.wraps(view)
+    async def wrapper(request: HttpRequest, *args, **kwargs) -> HttpResponse:
+        if request.method != 'GET':
+            return render({'detail': f'Method "{request.method}" not allowed.'},
+                          status.HTTP_405_METHOD_NOT_ALLOWED, headers={'Allow': 'GET'})
+        try:
+            result = await authentication.aauthenticate(request)
+            if result is None:
+                raise NotAuthenticated()
+            request.user = result[0]
+            return await view(request, *args, **kwargs)
+        except APIException as exc:
+            headers = {}
+            if isinstance(exc, (NotAuthenticated, AuthenticationFailed)):
+                headers['WWW-Authenticate'] = authentication.authenticate_header(request)
+            data = exc.detail if isinstance(exc.detail, (list, dict)) else {'detail': exc.detail}
+            return render(data, exc.status_code, headers=headers)
+        except Http404 as exc:
+            return render({'detail': str(exc) or 'Not found.'}, status.HTTP_404_NOT_FOUND)
+
+    return wrapper
+
+
+async def get_group(group_id: int, user: User, *fields) -> Group:
+    """
+    The async counterpart of the IsGroupAdminOrMember / HasGroupAccess checks
+
+    :param fields: Loads only these fields of the group (and those needed for the check)
+    :return: The group, if the user is its admin or a member
+    """
+    # the ledger version keys the cached member ids (see GroupMemberQuery)
+    queryset = Group.objects.only('id', 'created_by', 'ledger_version', *fields) if fields else Group.objects.all()
+    try:
+        group = await queryset.aget(pk=group_id)
+    except Group.DoesNotExist:
+        raise Http404('No Group matches the given query.')
+    if user.id not in await GroupMemberQuery.aget_member_ids(group):
+        logger.info('async: access denied: user=%s group=%s', user.id, group_id)
+        raise PermissionDenied()
+    return group
+
+
+@async_api_view
+async def retrieve_group(request: HttpRequest, pk: int) -> HttpResponse:
+    """
+    The async variant of 'GroupViewSet.retrieve'
+    """
+    group = await get_group(pk, request.user)
+    etag = ConditionalGet.make_etag('group', group.id, group.updated_at, group.ledger_version)
+    if ConditionalGet.is_fresh(request, etag):
+        return not_modified(etag)
+    await aprefetch_related_objects([group], 'members')  # the serializer reads them from the prefetch cache
+    return render(GroupSerializer(group).data, headers=ConditionalGet.get_headers(etag))
+
+
+@async_api_view
+async def list_group_expenses(request: HttpRequest, group_id: int) -> HttpResponse:
+    """
+    The async variant of 'ListCreateGroupExpenseViewSet.list'
+    """
+    group = await get_group(group_id, request.user, 'ledger_version')
+    etag = ConditionalGet.make_etag('group-expenses', group.id, group.ledger_version)
+    if ConditionalGet.is_fresh(request, etag):
+        return not_modified(etag)
+    with Trace(logger, 'serialize', metric='serializer'):
+        data = await GroupExpenseListReader.aread(group.id)
+    return render(data, headers=ConditionalGet.get_headers(etag))
+
+
+@async_api_view
+async def settle_up(request: HttpRequest, group_id: int) -> HttpResponse:
+    """
+    The async variant of 'GroupSettleUpViewSet.settle_up'
+    """
+    query_strategy = request.GET.get('strategy', SettlementType.N_MINUS_1.value)
+    settlement_strategy = SettlementStrategyFactory.get_by_name(query_strategy)
+    query_strategy = query_strategy.strip().lower()
+    # NOTE: the version must be read before the ledger: a result is never cached under a newer version
+    group = await get_group(group_id, request.user, 'ledger_version')
+    etag = ConditionalGet.make_etag('settle-up', group.id, query_strategy, group.ledger_version)
+    if ConditionalGet.is_fresh(request, etag):
+        return not_modified(etag)
+    data = await SettlementCache.aget(group.id, query_strategy, group.ledger_version)
+    if data is None:
+        balance_sheet = await GroupBalanceLedger.aget_balance_sheet(group.id)
+        with Trace(logger, 'settle_up', metric='strategy', group=group.id, strategy=query_strategy,
+                   users=len(balance_sheet)) as trace:
+            if isinstance(settlement_strategy, ProcessPoolSettlementStrategy):
+                transactions = await settlement_strategy.asettle_up(balance_sheet)
+            else:
+                # CPU bound: run in a thread, the event loop keeps serving the other requests meanwhile
+                transactions = await asyncio.to_thread(settlement_strategy.settle_up, balance_sheet)
+            trace.fields['transactions'] = len(transactions)
+        data = [transaction.to_dict() for transaction in transactions]
+        if fell_back(settlement_strategy):
+            # not the result of the strategy (see ProcessPoolSettlementStrategy): neither cached nor validated
+            return render(data)
+        await SettlementCache.aset(group.id, query_strategy, group.ledger_version, data)
+    return render(data, headers=ConditionalGet.get_headers(etag))
+
+
+async def get_expense_page(request: HttpRequest, query_type: Query) -> HttpResponse:
+    """
+    The async variant of 'QueryExpenseViewSet.get_expense_page'
+    """
+    try:
+        limit = int(request.GET.get('limit', QueryExpenseViewSet.page_size))
+    except ValueError:
+        raise ValidationError('Invalid limit!')
+    limit = max(1, min(limit, QueryExpenseViewSet.max_page_size))
+    cursor = request.GET.get('cursor')
+    if cursor is not None:
+        cursor = ExpenseFeedQuery.decode_cursor(cursor)
+    rows = [row async for row in ExpenseFeedQuery.get_page_queryset(request.user, query_type, cursor=cursor,
+                                                                     limit=limit + 1)]
+    next_url = None
+    if len(rows) > limit:  # fetched one extra row to find out if there is a next page
+        rows = rows[:limit]
+        next_url = replace_query_param(request.build_absolute_uri(), 'cursor',
+                                       ExpenseFeedQuery.encode_cursor(rows[-1]))
+    with Trace(logger, 'serialize', metric='serializer'):
+        results = QueryExpenseFeedSerializer(rows, many=True).data
+    return render({'next': next_url, 'results': results})
+
+
+@async_api_view
+async def get_expense(request: HttpRequest) -> HttpResponse:
+    """
+    The async variant of 'QueryExpenseViewSet.get_expense': the (up to) three independent queries are awaited
+    together (asyncio.gather)
+    """
+    query_type = Query((request.GET.get('query', 'all')).strip().lower())
+    if 'limit' in request.GET or 'cursor' in request.GET:
+        return await get_expense_page(request, query_type)
+    user, view = request.user, QueryExpenseViewSet()
+    reads = []  # (serializer class, queryset, serializer context)
+    if query_type in (Query.ALL, Query.USER_EXPENSE):
+        # select_related: the creator is read by the serializer, a lazy query is not allowed in an async context
+        reads.append((QueryUserExpenseSerializer, view.query_user_expense(user).select_related('created_by')
+                      .order_by('created_at'), {'requested_by': user}))
+    if query_type in (Query.ALL, Query.GROUP_EXPENSE):
+        reads.append((QueryGroupExpenseSerializer, QueryGroupExpenseSerializer.prefetch(
+            view.query_group_expense_paid_by(user).order_by('expense__created_at')), {'is_owed': False}))
+        reads.append((QueryGroupExpenseSerializer, QueryGroupExpenseSerializer.prefetch(
+            view.query_group_expense_shared_by(user).order_by('expense__created_at')), {'is_owed': True}))
+
+    async def fetch(queryset) -> list:
+        return [obj async for obj in queryset]  # the prefetches run along with the query
+
+    results = await asyncio.gather(*(fetch(queryset) for _, queryset, _ in reads))
+    expense_data = []
+    with Trace(logger, 'serialize', metric='serializer'):
+        for (serializer_class, _, context), objs in zip(reads, results):
+            expense_data += serializer_class(objs, many=True, context=context).data
+    expense_data.sort(key=lambda data: data['created_at'], reverse=True)
+    return render(expense_data)
@@ -0,0 +1,123 @@
+import threading
+from collections import OrderedDict
+from typing import Any, Optional
+from django.conf import settings
+from django.core.cache import caches
+
+
+class LRUCache:
+    """
+    A thread safe, size bounded cache in the local memory of the process: the least recently used entry is evicted
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key) -> Optional[Any]:
+        with self.lock:
+            value = self.entries.get(key)
+            if value is not None:
+                self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value) -> None:
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    async def aget(self, key) -> Optional[Any]:
+        return self.get(key)  # in memory: never blocks
+
+    async def aset(self, key, value) -> None:
+        self.set(key, value)
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+
+
+class DjangoCache:
+    """
+    Adapts a Django cache (settings.CACHES) to the LRUCache interface: shared across the processes
+    if the cache is (e.g. redis, memcached)
+    """
+
+    def __init__(self, alias: str, timeout: int):
+        self.cache = caches[alias]
+        self.timeout = timeout
+
+    @staticmethod
+    def make_key(key: tuple) -> str:
+        return 'splitwise:' + ':'.join(str(part) for part in key)
+
+    def get(self, key) -> Optional[Any]:
+        return self.cache.get(self.make_key(key))
+
+    def set(self, key, value) -> None:
+        self.cache.set(self.make_key(key), value, self.timeout)
+
+    async def aget(self, key) -> Optional[Any]:
+        return await self.cache.aget(self.make_key(key))
+
+    async def aset(self, key, value) -> None:
+        await self.cache.aset(self.make_key(key), value, self.timeout)
+
+
+class SettlementCache:
+    """
+    The settle up results, keyed by (group_id, strategy, ledger_version) (see settings.SETTLEMENT_CACHE).
+
+    Group.ledger_version is bumped in the same transaction as every expense or membership change
+    (see GroupBalanceLedger.bump_version), hence a cached result is never stale: a change makes a new key,
+    the old entries are never read again and age out of the cache.
+    """
+    lru: Optional[LRUCache] = None
+
+    @classmethod
+    def get_backend(cls):
+        """
+        :return: The configured backend, or None if disabled
+        """
+        backend = settings.SETTLEMENT_CACHE['BACKEND']
+        if backend == 'lru':
+            if cls.lru is None:
+                cls.lru = LRUCache(settings.SETTLEMENT_CACHE['MAX_ENTRIES'])
+            return cls.lru
+        if backend == 'django':
+            return DjangoCache(settings.SETTLEMENT_CACHE['CACHE_ALIAS'], settings.SETTLEMENT_CACHE['TIMEOUT'])
+        return None
+
+    @classmethod
+    def get(cls, group_id: int, strategy: str, ledger_version: int) -> Optional[list]:
+        """
+        :return: The cached transactions (as dicts), or None on a miss
+        """
+        backend = cls.get_backend()
+        return backend.get(('settle_up', group_id, strategy, ledger_version)) if backend is not None else None
+
+    @classmethod
+    def set(cls, group_id: int, strategy: str, ledger_version: int, transactions: list) -> None:
+        """
+        :param transactions: The transactions as dicts; must not be mutated once cached
+        """
+        backend = cls.get_backend()
+        if backend is not None:
+            backend.set(('settle_up', group_id, strategy, ledger_version), transactions)
+
+    @classmethod
+    async def aget(cls, group_id: int, strategy: str, ledger_version: int) -> Optional[list]:
+        """
+        The async twin of 'get()', for the async views
+        """
+        backend = cls.get_backend()
+        return await backend.aget(('settle_up', group_id, strategy, ledger_version)) if backend is not None else None
+
+    @classmethod
+    async def aset(cls, group_id: int, strategy: str, ledger_version: int, transactions: list) -> None:
+        backend = cls.get_backend()
+        if backend is not None:
+            await backend.aset(('settle_up', group_id, strategy, ledger_version), transactions)
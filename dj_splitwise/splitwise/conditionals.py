@@ -0,0 +1,58 @@
+from datetime import datetime
+from django.utils.http import parse_etags
+from rest_framework import status
+from rest_framework.request import Request
+from rest_framework.response import Response
+
+
+class ConditionalGet:
+    """
+    Version based ETags for the read endpoints: the ETag is derived from a version (Group.ledger_version,
+    updated_at) read with a single cheap query, hence a poll seeing no change is answered with a 304
+    before the payload is queried or serialized.
+
+    Usage:
+        etag = ConditionalGet.make_etag('group', group.id, group.ledger_version)
+        if ConditionalGet.is_fresh(request, etag):
+            return ConditionalGet.not_modified(etag)
+        ...
+        return Response(data=data, headers=ConditionalGet.get_headers(etag))
+
+    NOTE: The permissions must be checked before: a 304 must not reveal anything to an unauthorized user.
+
+    Ref: https://developer.mozilla.org/en-US/docs/Web/HTTP/Headers/If-None-Match
+    """
+    # the response is specific to the authenticated user (private) and must be revalidated on every use (no-cache)
+    CACHE_CONTROL = 'private, no-cache'
+
+    @staticmethod
+    def make_etag(*parts) -> str:
+        """
+        :param parts: The resource & its version, e.g. ('group', 1, 7); datetimes are converted to microseconds
+        :return: A weak ETag: the payload is semantically the same but not byte for byte (e.g. the renderer)
+        """
+        parts = [int(part.timestamp() * 1_000_000) if isinstance(part, datetime) else part for part in parts]
+        return 'W/"' + '-'.join(str(part) for part in parts) + '"'
+
+    @staticmethod
+    def is_fresh(request: Request, etag: str) -> bool:
+        """
+        :return: True if the client's copy is up-to-date: the ETag is listed in its 'If-None-Match' header
+        (weak comparison, as required for If-None-Match)
+        """
+        if_none_match = request.headers.get('If-None-Match')
+        if not if_none_match:
+            return False
+        etags = parse_etags(if_none_match)
+        if etags == ['*']:
+            return True
+        opaque_tag = etag.removeprefix('W/')
+        return any(tag.removeprefix('W/') == opaque_tag for tag in etags)
+
+    @classmethod
+    def get_headers(cls, etag: str) -> dict:
+        return {'ETag': etag, 'Cache-Control': cls.CACHE_CONTROL}
+
+    @classmethod
+    def not_modified(cls, etag: str) -> Response:
+        return Response(status=status.HTTP_304_NOT_MODIFIED, headers=cls.get_headers(etag))
@@ -0,0 +1,78 @@
+from typing import Optional
+from django.shortcuts import get_object_or_404
+from rest_framework.request import Request
+from .ledgers import GroupBalanceLedger
+from .models import Group
+from .queries import GroupMemberQuery
+
+
+class GroupContext:
+    """
+    The group of the current request and its member ids, loaded at most once per request and shared by
+    the permission classes and the view through the request obj.
+    - Both are loaded lazily: a membership check served by the shared cache (see GroupMemberQuery)
+    does not even load the group
+    - Raises Http404 if the group does not exist
+    """
+    REQUEST_ATTR = '_group_contexts'
+
+    def __init__(self, group_id: int):
+        self.group_id = int(group_id)
+        self._group: Optional[Group] = None
+        self._member_ids: Optional[frozenset] = None
+        self._ledger_version: Optional[int] = None
+
+    @classmethod
+    def of(cls, request: Request, group_id: int) -> 'GroupContext':
+        """
+        :param request: The current request
+        :param group_id: The target group
+        :return: The context of the group, created on first use within the request
+        """
+        contexts = getattr(request, cls.REQUEST_ATTR, None)
+        if contexts is None:
+            contexts = {}
+            setattr(request, cls.REQUEST_ATTR, contexts)
+        group_id = int(group_id)
+        if group_id not in contexts:
+            contexts[group_id] = cls(group_id)
+        return contexts[group_id]
+
+    @property
+    def group(self) -> Group:
+        if self._group is None:
+            self._group = get_object_or_404(Group, pk=self.group_id)
+            if self._member_ids is not None:  # already known: sparing the query in GroupMemberQuery
+                setattr(self._group, GroupMemberQuery.CACHE_ATTR, self._member_ids)
+        return self._group
+
+    @property
+    def member_ids(self) -> frozenset:
+        """
+        :return: The ids of the group members, including the group admin
+        """
+        if self._member_ids is None:
+            if (self._group is None and GroupMemberQuery.get_shared_cache() is not None
+                    and self.ledger_version is not None):
+                self._member_ids = GroupMemberQuery.get_cached_member_ids(self.group_id, self.ledger_version)
+            if self._member_ids is None:
+                self._member_ids = GroupMemberQuery.get_member_ids(self.group)
+        return self._member_ids
+
+    @property
+    def ledger_version(self) -> int:
+        """
+        :return: The ledger version of the group (None if it does not exist): read from the group if already loaded,
+        otherwise read once in this request
+        """
+        if self._group is not None:
+            return self._group.ledger_version
+        if self._ledger_version is None:
+            self._ledger_version = GroupBalanceLedger.get_version(self.group_id)
+        return self._ledger_version
+
+    def is_member(self, user_id: int) -> bool:
+        return user_id in self.member_ids
+
+    def is_admin(self, user_id: int) -> bool:
+        return user_id == self.group.created_by_id
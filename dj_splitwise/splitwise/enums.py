@@ -1,12 +1,25 @@
-from enum import Enum
-
-
-class Query(Enum):
-    ALL = 'all'
-    USER_EXPENSE = 'user_expense'
-    GROUP_EXPENSE = 'group_expense'
-
-
-class SettlementType(Enum):
-    N_MINUS_1 = 'n_minus_1'
-    GREEDY = 'greedy'
+from enum import Enum
+
+
+class Query(Enum):
+    ALL = 'all'
+    USER_EXPENSE = 'user_expense'
+    GROUP_EXPENSE = 'group_expense'
+
+
+class SettlementType(Enum):
+    N_MINUS_1 = 'n_minus_1'
+    GREEDY = 'greedy'
+    MIN_TRANSACTIONS = 'min_transactions'
+
+
+class SettlementExecution(Enum):
+    IN_PROCESS = 'in_process'
+    PROCESS_POOL = 'process_pool'
+
+
+class JobStatus(Enum):
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
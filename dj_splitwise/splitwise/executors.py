@@ -0,0 +1,172 @@
+import asyncio
+import logging
+import multiprocessing
+import threading
+from array import array
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import List, Optional, Union
+from django.conf import settings
+from .strategies import GreedySettlementStrategy
+from .utils import Transaction, BalanceSheet
+from .utils import validate_balance_sheet
+
+logger = logging.getLogger(__name__)
+
+
+def settle_up_packed(strategy, packed_sheet: tuple) -> bytes:
+    """
+    Runs in a worker process of the pool: settles up the balance sheet with the given strategy
+
+    :param strategy: The settlement strategy (pickled along with its options, e.g. the time budget)
+    :param packed_sheet: See 'BalanceSheet.pack()'
+    :return: The transactions packed as the raw bytes of a flat array of (from, to, amount in minor units)
+    """
+    sheet = BalanceSheet.unpack(packed_sheet)
+    packed = array('q')
+    for transaction in strategy.settle_up(sheet):
+        packed.extend((transaction._from, transaction.to, sheet.to_minor_units(transaction.amount)))
+    return packed.tobytes()
+
+
+def unpack_transactions(packed_transactions: bytes, sheet: BalanceSheet) -> List[Transaction]:
+    """
+    :return: The transactions of the given 'settle_up_packed()' output
+    """
+    values = array('q')
+    values.frombytes(packed_transactions)
+    return [Transaction(values[i], values[i + 1], sheet.to_decimal(values[i + 2])) for i in range(0, len(values), 3)]
+
+
+class SettlementProcessPool:
+    """
+    The pool of processes settling up the large groups, shared by the requests (threads) of a process and started
+    on first use (see settings.SETTLEMENT['OFFLOAD_*']).
+
+    Bounded: at most (OFFLOAD_MAX_WORKERS + OFFLOAD_MAX_QUEUED) settlements are submitted at a time. A slot is
+    freed once the worker is done with the settlement, even if the request gave up waiting on it.
+    """
+    executor: Optional[ProcessPoolExecutor] = None
+    slots: Optional[threading.BoundedSemaphore] = None
+    lock = threading.Lock()
+
+    @classmethod
+    def submit(cls, strategy, sheet: BalanceSheet) -> Optional[Future]:
+        """
+        :return: The future of the packed transactions (see 'settle_up_packed()'), or None if the pool is saturated
+        """
+        with cls.lock:
+            if cls.executor is None:
+                config = settings.SETTLEMENT
+                cls.executor = ProcessPoolExecutor(
+                    max_workers=config['OFFLOAD_MAX_WORKERS'],
+                    mp_context=multiprocessing.get_context(config['OFFLOAD_MP_CONTEXT']))
+                cls.slots = threading.BoundedSemaphore(config['OFFLOAD_MAX_WORKERS'] + config['OFFLOAD_MAX_QUEUED'])
+            executor, slots = cls.executor, cls.slots
+        if not slots.acquire(blocking=False):
+            return None
+        try:
+            future = executor.submit(settle_up_packed, strategy, sheet.pack())
+        except BaseException:
+            slots.release()
+            raise
+        future.add_done_callback(lambda _: slots.release())
+        return future
+
+    @classmethod
+    def reset(cls) -> None:
+        """
+        Drops the pool (e.g. broken by a killed worker): the next submission starts a new one
+        """
+        with cls.lock:
+            executor, cls.executor, cls.slots = cls.executor, None, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+def fell_back(strategy) -> bool:
+    """
+    :return: Whether the settlement run by the given strategy fell back to greedy: a result not to be cached
+    """
+    return isinstance(strategy, ProcessPoolSettlementStrategy) and strategy.fell_back
+
+
+class ProcessPoolSettlementStrategy:
+    """
+    The 'process_pool' execution mode of a settlement strategy (see SettlementStrategyFactory):
+    - A balance sheet of less than 'min_group_size' users is settled up in-process, as by the strategy itself
+    - A larger one is sent (packed, see 'BalanceSheet.pack()') to SettlementProcessPool, to be settled up by the
+    pooled strategy (e.g. a larger exact search): the request thread waits for it without holding the GIL
+    - If the pool is saturated, broken, or the settlement takes longer than 'timeout', the balance sheet is settled up
+    in-process by the GreedySettlementStrategy: O(N log N), a valid (if not minimal) settlement
+
+    NOTE: A worker is not interrupted on a timeout: the exact strategy bounds itself (see its time budget)
+    NOTE: A fallback is transient (a busy pool, ...): its result is not the one of the strategy, hence must not be
+    cached as such (see 'fell_back')
+    """
+
+    def __init__(self, strategy, pooled_strategy, min_group_size: int, timeout: float):
+        """
+        :param strategy: The settlement strategy run in-process
+        :param pooled_strategy: The settlement strategy run in the pool; must be picklable
+        :param min_group_size: Min number of users of a balance sheet to offload
+        :param timeout: Max time (in seconds) to wait for the pool
+        """
+        self.strategy = strategy
+        self.pooled_strategy = pooled_strategy
+        self.min_group_size = min_group_size
+        self.timeout = timeout
+        self.fell_back = False  # whether a settlement fell back to greedy; the factory builds a strategy per call
+
+    def submit(self, sheet: BalanceSheet) -> Optional[Future]:
+        """
+        :return: The future of the packed transactions, or None if the pool is saturated
+        """
+        validate_balance_sheet(sheet)  # the validation errors are raised in the request, not in the worker
+        return SettlementProcessPool.submit(self.pooled_strategy, sheet)
+
+    def fallback(self, sheet: BalanceSheet, reason: Union[str, Exception]) -> List[Transaction]:
+        self.fell_back = True
+        logger.warning('ProcessPoolSettlementStrategy: falling back to greedy: %s (strategy=%s users=%d)',
+                       str(reason) or type(reason).__name__, type(self.strategy).__name__, len(sheet))
+        return GreedySettlementStrategy().settle_up(sheet)
+
+    def settle_up(self, balance_sheet: Union[dict, BalanceSheet]) -> List[Transaction]:
+        """
+        :param balance_sheet: A dict (or BalanceSheet) of user to balance amount mapping
+        :return: List[Transaction]
+        """
+        sheet = BalanceSheet.of(balance_sheet)
+        if len(sheet) < self.min_group_size:
+            return self.strategy.settle_up(sheet)
+        try:
+            future = self.submit(sheet)
+            if future is None:
+                return self.fallback(sheet, 'the pool is saturated')
+            return unpack_transactions(future.result(timeout=self.timeout), sheet)
+        except TimeoutError as e:
+            future.cancel()  # if still queued
+            return self.fallback(sheet, e)
+        except BrokenProcessPool as e:
+            SettlementProcessPool.reset()
+            return self.fallback(sheet, e)
+
+    async def asettle_up(self, balance_sheet: Union[dict, BalanceSheet]) -> List[Transaction]:
+        """
+        The async twin of 'settle_up()', for the async views: the event loop is never blocked, the settlements
+        not offloaded to the pool (small sheet, fallback) are run in a thread
+        """
+        sheet = BalanceSheet.of(balance_sheet)
+        if len(sheet) < self.min_group_size:
+            return await asyncio.to_thread(self.strategy.settle_up, sheet)
+        try:
+            future = self.submit(sheet)
+            if future is None:
+                return await asyncio.to_thread(self.fallback, sheet, 'the pool is saturated')
+            # NOTE: on a timeout, wait_for cancels the wrapped future, hence the pool's future if still queued
+            return unpack_transactions(await asyncio.wait_for(asyncio.wrap_future(future), self.timeout), sheet)
+        except TimeoutError as e:
+            return await asyncio.to_thread(self.fallback, sheet, e)
+        except BrokenProcessPool as e:
+            SettlementProcessPool.reset()
+            return await asyncio.to_thread(self.fallback, sheet, e)
@@ -0,0 +1,73 @@
+import csv
+import json
+from itertools import chain
+from typing import Iterator
+from .enums import Query
+from .models import User
+from .queries import ExpenseFeedQuery
+from .serializers import QueryExpenseFeedSerializer
+
+
+class Echo:
+    """
+    A file-like obj returning what is written to it: lets csv.writer format a row without buffering it
+    Ref: https://docs.djangoproject.com/en/5.1/howto/outputting-csv/#streaming-large-csv-files
+    """
+
+    def write(self, value: str) -> str:
+        return value
+
+
+class ExpenseHistoryExporter:
+    """
+    Streams the full expense history of a user, oldest first, as NDJSON or CSV.
+    - read: see 'ExpenseFeedQuery.iterate()', the rows are never all in memory
+    - write: the rows have the same keys as the feed ('QueryExpenseFeedSerializer') and are
+    written 'chunk_size' rows at a time
+    """
+    FORMATS = {
+        'ndjson': ('ndjson', 'application/x-ndjson'),
+        'csv': ('csv', 'text/csv'),
+    }
+
+    @classmethod
+    def iter_rows(cls, user: User, query: Query, chunk_size: int) -> Iterator[dict]:
+        """
+        :return: The rows as serialized by 'QueryExpenseFeedSerializer'
+        """
+        # NOTE: calling the fields directly: sparing the per row overhead of Serializer.to_representation()
+        fields = [(field_name, field.source, field.to_representation)
+                  for field_name, field in QueryExpenseFeedSerializer().fields.items()]
+        for row in ExpenseFeedQuery.iterate(user, query, chunk_size=chunk_size):
+            yield {field_name: None if row[source] is None else to_representation(row[source])
+                   for field_name, source, to_representation in fields}
+
+    @classmethod
+    def iter_lines(cls, user: User, query: Query, file_type: str, chunk_size: int) -> Iterator[str]:
+        """
+        :return: The lines of the file
+        """
+        rows = cls.iter_rows(user, query, chunk_size)
+        if file_type == 'ndjson':
+            return (json.dumps(row) + '\n' for row in rows)
+        writer = csv.writer(Echo())
+        header = writer.writerow(QueryExpenseFeedSerializer().fields.keys())
+        return chain([header], (writer.writerow(row.values()) for row in rows))
+
+    @classmethod
+    def stream(cls, user: User, query: Query, file_type: str, chunk_size: int) -> Iterator[str]:
+        """
+        :param user: The user whose history is exported
+        :param query: The type of the expenses to include
+        :param file_type: One of FORMATS
+        :param chunk_size: Num of rows fetched from the database and written to the response at a time
+        :return: The content of the file, in chunks of 'chunk_size' lines
+        """
+        chunk = []
+        for line in cls.iter_lines(user, query, file_type, chunk_size):
+            chunk.append(line)
+            if len(chunk) >= chunk_size:
+                yield ''.join(chunk)
+                chunk.clear()
+        if chunk:
+            yield ''.join(chunk)
@@ -1,13 +1,35 @@
-from .strategies import NMinusOneSettlementStrategy, GreedySettlementStrategy
-from .enums import SettlementType
-
-
-class SettlementStrategyFactory:
-    @classmethod
-    def get_by_name(cls, name: str):
-        name = name.strip().lower()
-        settlement_type = SettlementType(name)
-        if settlement_type == SettlementType.N_MINUS_1:
-            return NMinusOneSettlementStrategy()
-        elif settlement_type == SettlementType.GREEDY:
-            return GreedySettlementStrategy()
+from typing import Optional
+from django.conf import settings
+from .strategies import NMinusOneSettlementStrategy, GreedySettlementStrategy, MinTransactionSettlementStrategy
+from .executors import ProcessPoolSettlementStrategy
+from .enums import SettlementType, SettlementExecution
+
+
+class SettlementStrategyFactory:
+    @classmethod
+    def get_by_name(cls, name: str, execution: Optional[str] = None):
+        """
+        :param name: One of SettlementType
+        :param execution: One of SettlementExecution; defaults to settings.SETTLEMENT['EXECUTION']
+        :return: The settlement strategy
+        """
+        name = name.strip().lower()
+        settlement_type = SettlementType(name)
+        if settlement_type == SettlementType.N_MINUS_1:
+            strategy = NMinusOneSettlementStrategy()
+        elif settlement_type == SettlementType.GREEDY:
+            strategy = GreedySettlementStrategy()
+        elif settlement_type == SettlementType.MIN_TRANSACTIONS:
+            strategy = MinTransactionSettlementStrategy(
+                max_group_size=settings.SETTLEMENT['MIN_TRANSACTIONS_MAX_GROUP_SIZE'],
+                time_budget=settings.SETTLEMENT['MIN_TRANSACTIONS_TIME_BUDGET'])
+        if (settlement_type == SettlementType.MIN_TRANSACTIONS and
+                SettlementExecution(execution or settings.SETTLEMENT['EXECUTION']) == SettlementExecution.PROCESS_POOL):
+            # the workers run a larger exact search than the request thread could afford
+            pooled_strategy = MinTransactionSettlementStrategy(
+                max_group_size=settings.SETTLEMENT['OFFLOAD_MIN_TRANSACTIONS_MAX_GROUP_SIZE'],
+                time_budget=settings.SETTLEMENT['OFFLOAD_MIN_TRANSACTIONS_TIME_BUDGET'])
+            return ProcessPoolSettlementStrategy(strategy, pooled_strategy,
+                                                 min_group_size=settings.SETTLEMENT['OFFLOAD_MIN_GROUP_SIZE'],
+                                                 timeout=settings.SETTLEMENT['OFFLOAD_TIMEOUT'])
+        return strategy
@@ -0,0 +1,121 @@
+from typing import List, Tuple
+from django.db import connection, transaction
+from rest_framework.exceptions import ValidationError
+from .ledgers import GroupBalanceLedger
+from .models import User, Expense, Group, GroupExpense
+from .serializers import GroupExpenseSerializer, ParticipantListSerializer
+
+PARTICIPANT_FIELDS = ('paid_by', 'shared_by')
+
+
+class GroupExpenseImporter:
+    """
+    Imports a batch of group expenses: the same rules as 'GroupExpenseSerializer', applied to the whole batch at once.
+    - validation: the participants of every expense are resolved with a single query, and the group members too,
+    hence validating any num of expenses costs two queries
+    - write: every chunk of expenses is written with bulk INSERTs in its own transaction and applied to the
+    group balance ledger once
+    - the invalid expenses are skipped and reported by their index in the batch
+    """
+
+    @classmethod
+    def validate(cls, group: Group, items: list) -> Tuple[List[Tuple[int, dict]], List[dict]]:
+        """
+        :param group: The group to import into
+        :param items: The raw expense data
+        :return: (valid, errors)
+        - valid: A list of (index, validated_data)
+        - errors: A list of {'index': index, 'errors': ...} for every invalid expense
+        """
+        serializer = GroupExpenseSerializer()  # a single instance: the fields are built once for the whole batch
+        user_ids = set()
+        for item in items:
+            if isinstance(item, dict):
+                for field_name in PARTICIPANT_FIELDS:
+                    user_ids |= ParticipantListSerializer.get_user_ids(item.get(field_name))
+        users = User.objects.in_bulk(user_ids)
+        for field_name in PARTICIPANT_FIELDS:
+            serializer.fields[field_name].child.fields['user'].users = users
+        valid, errors = [], []
+        for index, item in enumerate(items):
+            try:
+                validated_data = serializer.run_validation(item)
+                serializer.check_expense(group, validated_data)  # the member ids are fetched once for the group
+            except ValidationError as e:
+                errors.append({'index': index, 'errors': e.detail})
+            else:
+                valid.append((index, validated_data))
+        return valid, errors
+
+    @classmethod
+    def create_expenses(cls, group: Group, created_by: User, expenses_data: List[dict]) -> List[GroupExpense]:
+        """
+        Writes the given expenses with their splits, using a constant number of statements.
+        Must be called inside a transaction.
+
+        ** NOTE: bulk_create() does not support multi-table inherited models (GroupExpense extends Expense):
+        - the parent rows are bulk created first and the child rows are then inserted with a single executemany(),
+        the table and the columns being read from the model meta
+
+        :param group: The group to import into
+        :param created_by: The user importing the expenses
+        :param expenses_data: The validated data of the expenses
+        :return: The created group expenses
+        """
+        group_expenses = [GroupExpense(group=group, created_by=created_by,
+                                       **{attr: value for attr, value in expense_data.items()
+                                          if attr not in PARTICIPANT_FIELDS})
+                          for expense_data in expenses_data]
+        if connection.features.can_return_rows_from_bulk_insert:
+            expense_fields = [field.attname for field in Expense._meta.concrete_fields if not field.primary_key]
+            expenses = Expense.objects.bulk_create([
+                Expense(**{attname: getattr(group_expense, attname) for attname in expense_fields})
+                for group_expense in group_expenses])
+            for group_expense, expense in zip(group_expenses, expenses):
+                group_expense.id = group_expense.expense_ptr_id = expense.id
+                group_expense.created_at, group_expense.updated_at = expense.created_at, expense.updated_at
+                group_expense._state.adding = False
+                group_expense._state.db = expense._state.db
+            # the child table: every column of its own, as described by the model (the pointer to the parent included)
+            fields = GroupExpense._meta.local_concrete_fields
+            quote_name = connection.ops.quote_name
+            sql = (f'INSERT INTO {quote_name(GroupExpense._meta.db_table)} '
+                   f'({", ".join(quote_name(field.column) for field in fields)}) '
+                   f'VALUES ({", ".join(["%s"] * len(fields))})')
+            with connection.cursor() as cursor:
+                cursor.executemany(sql, [
+                    [field.get_db_prep_save(getattr(group_expense, field.attname), connection) for field in fields]
+                    for group_expense in group_expenses])
+        else:
+            for group_expense in group_expenses:
+                group_expense.save()
+        GroupExpenseSerializer.create_splits([
+            (group_expense, expense_data['paid_by'], expense_data['shared_by'])
+            for group_expense, expense_data in zip(group_expenses, expenses_data)])
+        # a single ledger update for all the expenses
+        deltas = GroupBalanceLedger.get_deltas(
+            [(paid_by['user'].id, paid_by['amount']) for expense_data in expenses_data
+             for paid_by in expense_data['paid_by']],
+            [(shared_by['user'].id, shared_by['amount']) for expense_data in expenses_data
+             for shared_by in expense_data['shared_by']])
+        GroupBalanceLedger.apply(group.id, deltas)
+        return group_expenses
+
+    @classmethod
+    def run(cls, group: Group, created_by: User, items: list, chunk_size: int) -> dict:
+        """
+        :param group: The group to import into
+        :param created_by: The user importing the expenses
+        :param items: The raw expense data
+        :param chunk_size: Max num of expenses written in a single transaction
+        :return: A dict of the created expenses and the errors, both identified by their index in the batch
+        """
+        valid, errors = cls.validate(group, items)
+        created = []
+        for start in range(0, len(valid), chunk_size):
+            chunk = valid[start:start + chunk_size]
+            with transaction.atomic():
+                group_expenses = cls.create_expenses(group, created_by, [expense_data for _, expense_data in chunk])
+            created.extend({'index': index, 'id': group_expense.id}
+                           for (index, _), group_expense in zip(chunk, group_expenses))
+        return {'num_created': len(created), 'created': created, 'errors': errors}
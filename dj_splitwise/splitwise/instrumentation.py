@@ -0,0 +1,327 @@
+import atexit
+import logging
+import os
+import sys
+import threading
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from contextvars import ContextVar
+from logging.handlers import QueueHandler, QueueListener
+from queue import SimpleQueue
+from time import perf_counter
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+"""
+Logging & tracing:
+- Every module logs through its own logger: logging.getLogger(__name__), e.g. 'splitwise.strategies'
+  -- the levels and handlers are configured per subsystem in settings.LOGGING
+- Always pass the message args separately: logger.debug('users=%d', n)
+  -- the message is formatted only if the record is emitted
+  -- wrap an expensive arg in LazyStr: it is not even computed when the level is disabled
+
+Ref: https://docs.python.org/3/howto/logging.html#optimization
+Ref: https://docs.python.org/3/howto/logging-cookbook.html#dealing-with-handlers-that-block
+"""
+
+
+class LazyStr:
+    """
+    Defers an expensive message argument until the log record is actually formatted
+    """
+    __slots__ = ('func', 'args')
+
+    def __init__(self, func: Callable, *args):
+        self.func = func
+        self.args = args
+
+    def __str__(self) -> str:
+        return str(self.func(*self.args))
+
+
+def format_fields(fields: dict) -> str:
+    """
+    :param fields: The context of a log record
+    :return: The fields as space separated key=value pairs
+    """
+    return ' '.join(f'{key}={value}' for key, value in fields.items())
+
+
+class RequestMetrics:
+    """
+    The timings of the current request: collected by 'middlewares.InstrumentationMiddleware'
+    - total: wall time of the request
+    - db: num of queries and the time spent executing them
+    - timings: the time spent in the named parts of the request (e.g. serializer, strategy), see Trace
+    """
+    current: ContextVar[Optional['RequestMetrics']] = ContextVar('request_metrics', default=None)
+
+    def __init__(self):
+        self.total = 0.0  # seconds
+        self.num_queries = 0
+        self.db_time = 0.0  # seconds
+        self.timings: Dict[str, float] = defaultdict(float)  # name -> seconds
+
+    @classmethod
+    def get(cls) -> Optional['RequestMetrics']:
+        """
+        :return: The metrics of the current request; None outside an instrumented request
+        """
+        return cls.current.get()
+
+    def add(self, name: str, seconds: float) -> None:
+        self.timings[name] += seconds
+
+    def wrap_query(self, execute, sql, params, many, context):
+        """
+        A database execute wrapper counting and timing every query
+        Ref: https://docs.djangoproject.com/en/5.1/topics/db/instrumentation/
+        """
+        start = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.num_queries += 1
+            self.db_time += perf_counter() - start
+
+    def to_server_timing(self) -> str:
+        """
+        :return: The value of the 'Server-Timing' header
+        Ref: https://developer.mozilla.org/en-US/docs/Web/HTTP/Headers/Server-Timing
+        """
+        metrics = [f'total;dur={self.total * 1000:.2f}',
+                   f'db;dur={self.db_time * 1000:.2f};desc="{self.num_queries} queries"']
+        metrics.extend(f'{name};dur={seconds * 1000:.2f}' for name, seconds in self.timings.items())
+        return ', '.join(metrics)
+
+
+class Trace:
+    """
+    Times a block and logs its duration at DEBUG level along with the given fields.
+    If a metric name is given, the duration is also added to the timings of the current request (RequestMetrics).
+    When DEBUG is disabled for the logger and no request is instrumented, it is a no-op: not even the clock is read.
+
+    Usage:
+        with Trace(logger, 'settle_up', metric='strategy', strategy='greedy') as trace:
+            ...
+            trace.fields['transactions'] = len(transactions)  # fields can be added within the block
+    """
+    __slots__ = ('logger', 'operation', 'metric', 'fields', 'metrics', 'start')
+
+    def __init__(self, logger: logging.Logger, operation: str, metric: str = None, **fields):
+        self.logger = logger
+        self.operation = operation
+        self.metric = metric
+        self.fields = fields
+        self.metrics = None
+        self.start = None
+
+    def __enter__(self) -> 'Trace':
+        if self.metric is not None:
+            self.metrics = RequestMetrics.get()
+        if self.metrics is not None or self.logger.isEnabledFor(logging.DEBUG):
+            self.start = perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> bool:
+        if self.start is not None:
+            elapsed = perf_counter() - self.start
+            if self.metrics is not None:
+                self.metrics.add(self.metric, elapsed)
+            self.logger.debug('%s took %.3fms %s', self.operation, elapsed * 1000,
+                              LazyStr(format_fields, self.fields))
+        return False  # never swallowing the exception
+
+
+class MetricsRegistry:
+    """
+    In-process aggregate of the request metrics, labelled by view; rendered in the Prometheus text format.
+
+    NOTE: the registry lives in the memory of a single process: every worker process of the server
+    exposes (and is to be scraped for) its own metrics.
+
+    Ref: https://prometheus.io/docs/instrumenting/exposition_formats/#text-based-format
+    """
+    PREFIX = 'splitwise'
+    BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)  # seconds
+
+    lock = threading.Lock()
+    requests: Dict[Tuple[str, str, str], int] = defaultdict(int)  # (view, method, status) -> count
+    durations: Dict[Tuple[str, str], List[float]] = {}  # (view, method) -> bucket counts + [+Inf, sum]
+    queries: Dict[str, int] = defaultdict(int)  # view -> num of queries
+    db_time: Dict[str, float] = defaultdict(float)  # view -> seconds
+    timings: Dict[Tuple[str, str], float] = defaultdict(float)  # (view, timing) -> seconds
+
+    @classmethod
+    def observe(cls, view: str, method: str, status: int, metrics: RequestMetrics) -> None:
+        with cls.lock:
+            cls.requests[(view, method, str(status))] += 1
+            histogram = cls.durations.get((view, method))
+            if histogram is None:
+                histogram = cls.durations[(view, method)] = [0] * (len(cls.BUCKETS) + 1) + [0.0]
+            histogram[bisect_left(cls.BUCKETS, metrics.total)] += 1  # non-cumulative; summed up while rendering
+            histogram[-1] += metrics.total
+            cls.queries[view] += metrics.num_queries
+            cls.db_time[view] += metrics.db_time
+            for name, seconds in metrics.timings.items():
+                cls.timings[(view, name)] += seconds
+
+    @classmethod
+    def reset(cls) -> None:
+        with cls.lock:
+            for metric in (cls.requests, cls.durations, cls.queries, cls.db_time, cls.timings):
+                metric.clear()
+
+    @staticmethod
+    def escape_label_value(value) -> str:
+        return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+    @classmethod
+    def format_labels(cls, **labels) -> str:
+        return '{' + ','.join(f'{name}="{cls.escape_label_value(value)}"' for name, value in labels.items()) + '}'
+
+    @classmethod
+    def render(cls) -> str:
+        """
+        :return: All the metrics in the Prometheus text exposition format (version 0.0.4)
+        """
+        prefix, labels = cls.PREFIX, cls.format_labels
+        lines = []
+        with cls.lock:
+            lines += [f'# HELP {prefix}_http_requests_total Num of requests served',
+                      f'# TYPE {prefix}_http_requests_total counter']
+            lines += [f'{prefix}_http_requests_total{labels(view=view, method=method, status=status)} {count}'
+                      for (view, method, status), count in sorted(cls.requests.items())]
+            lines += [f'# HELP {prefix}_http_request_duration_seconds Wall time of the requests',
+                      f'# TYPE {prefix}_http_request_duration_seconds histogram']
+            for (view, method), histogram in sorted(cls.durations.items()):
+                cumulative = 0
+                for bound, count in zip([*cls.BUCKETS, '+Inf'], histogram[:-1]):
+                    cumulative += count
+                    lines.append(f'{prefix}_http_request_duration_seconds_bucket'
+                                 f'{labels(view=view, method=method, le=bound)} {cumulative}')
+                lines.append(f'{prefix}_http_request_duration_seconds_sum{labels(view=view, method=method)} '
+                             f'{histogram[-1]}')
+                lines.append(f'{prefix}_http_request_duration_seconds_count{labels(view=view, method=method)} '
+                             f'{cumulative}')
+            lines += [f'# HELP {prefix}_db_queries_total Num of database queries executed',
+                      f'# TYPE {prefix}_db_queries_total counter']
+            lines += [f'{prefix}_db_queries_total{labels(view=view)} {count}'
+                      for view, count in sorted(cls.queries.items())]
+            lines += [f'# HELP {prefix}_db_query_seconds_total Time spent executing the database queries',
+                      f'# TYPE {prefix}_db_query_seconds_total counter']
+            lines += [f'{prefix}_db_query_seconds_total{labels(view=view)} {seconds}'
+                      for view, seconds in sorted(cls.db_time.items())]
+            lines += [f'# HELP {prefix}_timing_seconds_total Time spent in the instrumented parts of the requests '
+                      f'(serializer, strategy, ...)',
+                      f'# TYPE {prefix}_timing_seconds_total counter']
+            lines += [f'{prefix}_timing_seconds_total{labels(view=view, timing=timing)} {seconds}'
+                      for (view, timing), seconds in sorted(cls.timings.items())]
+        return '\n'.join(lines) + '\n'
+
+
+class SamplingProfiler:
+    """
+    A statistical profiler of a single thread: a background thread samples the call stack of the target thread
+    every 'interval' seconds. Far cheaper than cProfile (the profiled code is not traced) and the output,
+    in the collapsed-stack format, is read by flame graph tools (flamegraph.pl, speedscope, ...).
+
+    NOTE: The sampler needs the GIL to take a sample, hence a CPU bound thread is sampled at most once per
+    switch interval (sys.getswitchinterval(), 5ms by default).
+
+    Usage:
+        with SamplingProfiler() as profiler:
+            ...
+        profiler.to_collapsed()
+    """
+
+    def __init__(self, interval: float = 0.001):
+        self.interval = interval  # seconds
+        self.samples = Counter()  # stack (tuple of frame labels, root first) -> num of samples
+        self.thread_id = None
+        self.base_depth = 0
+        self.stopped = threading.Event()
+        self.sampler = None
+
+    @staticmethod
+    def get_stack(frame) -> List:
+        """
+        :return: The code objects of the stack, root first
+        """
+        stack = []
+        while frame is not None:
+            stack.append(frame.f_code)
+            frame = frame.f_back
+        stack.reverse()
+        return stack
+
+    @staticmethod
+    def format_frame(code) -> str:
+        return f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})'
+
+    def sample(self) -> None:
+        labels = {}  # code -> label: formatting a frame once per profile
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            # the frames below the one starting the profiler (server, middlewares) are dropped
+            stack = self.get_stack(frame)[self.base_depth:]
+            if stack and stack[0] is SamplingProfiler.__exit__.__code__:  # caught stopping the profiler
+                continue
+            self.samples[tuple(labels.get(code) or labels.setdefault(code, self.format_frame(code))
+                               for code in stack)] += 1
+
+    def __enter__(self) -> 'SamplingProfiler':
+        self.thread_id = threading.get_ident()
+        self.base_depth = len(self.get_stack(sys._getframe(1)))
+        self.sampler = threading.Thread(target=self.sample, name='splitwise-sampling-profiler', daemon=True)
+        self.sampler.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> bool:
+        self.stopped.set()
+        self.sampler.join()
+        return False
+
+    def to_collapsed(self) -> str:
+        """
+        :return: One line per distinct stack: the frames, root first, separated by ';' followed by the num of samples
+        Ref: https://github.com/brendangregg/FlameGraph#2-fold-stacks
+        """
+        return ''.join(f'{";".join(stack)} {count}\n' for stack, count in self.samples.most_common() if stack)
+
+
+class QueueLogging:
+    """
+    Moves the handlers of the given loggers behind a queue: the request thread only enqueues the record
+    and a background thread (QueueListener) does the blocking I/O
+    """
+    listeners: List[QueueListener] = []
+
+    @classmethod
+    def start(cls, logger_names: Iterable[str]) -> None:
+        """
+        :param logger_names: The loggers whose handlers are to be moved behind a queue
+        :return: None
+        """
+        for logger_name in logger_names:
+            logger = logging.getLogger(logger_name)
+            handlers = [handler for handler in logger.handlers if not isinstance(handler, QueueHandler)]
+            if not handlers:
+                continue
+            queue = SimpleQueue()
+            for handler in handlers:
+                logger.removeHandler(handler)
+            logger.addHandler(QueueHandler(queue))
+            listener = QueueListener(queue, *handlers, respect_handler_level=True)
+            listener.start()
+            cls.listeners.append(listener)
+        atexit.register(cls.stop)
+
+    @classmethod
+    def stop(cls) -> None:
+        """
+        Flushes the queued records and stops the background threads
+        """
+        while cls.listeners:
+            cls.listeners.pop().stop()
@@ -0,0 +1,334 @@
+import logging
+import os
+import signal
+import threading
+import traceback
+from contextlib import nullcontext
+from datetime import timedelta
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+from uuid import uuid4
+from django.conf import settings
+from django.db import DatabaseError, connection, transaction
+from django.db.models import F
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+from .caches import SettlementCache
+from .enums import JobStatus, Query, SettlementExecution
+from .exporters import ExpenseHistoryExporter
+from .factories import SettlementStrategyFactory
+from .importers import GroupExpenseImporter
+from .ledgers import GroupBalanceLedger
+from .models import Group, Job, User
+
+logger = logging.getLogger(__name__)
+
+
+class JobQueue:
+    """
+    A job queue backed by the database (the Job table): no broker to run, works on SQLite and PostgreSQL.
+    - enqueue: a single INSERT, in the transaction of the caller if any
+    - claim: the due jobs are marked as running by a conditional UPDATE (status = queued), hence a job is claimed by
+    a single worker; on PostgreSQL the candidates are also locked with SELECT ... FOR UPDATE SKIP LOCKED,
+    so the concurrent workers do not even contend for the same rows
+    - run: the failed attempts are retried with an exponential backoff (settings.JOBS['RETRY_BACKOFF']),
+    up to the max attempts of the job
+    - a running job is kept claimed by a heartbeat (see JobHeartbeat); a job whose heartbeat stopped for
+    settings.JOBS['LOCK_TIMEOUT'] (its worker died) is re-queued
+
+    The tasks are registered with '@JobQueue.task(name)': func(payload: dict, job: Job) -> JSON serializable result
+    """
+    tasks: Dict[str, Callable] = {}
+    task_max_attempts: Dict[str, int] = {}
+
+    @classmethod
+    def task(cls, name: str, max_attempts: Optional[int] = None):
+        """
+        :param name: The name the jobs refer to the task by
+        :param max_attempts: Max num of runs of a job; 1 for a task which is not safe to re-run.
+        Defaults to settings.JOBS['MAX_ATTEMPTS']
+        """
+        def register(func: Callable) -> Callable:
+            cls.tasks[name] = func
+            if max_attempts is not None:
+                cls.task_max_attempts[name] = max_attempts
+            return func
+        return register
+
+    @classmethod
+    def enqueue(cls, name: str, payload: dict, created_by: Optional[User] = None) -> Job:
+        """
+        :param name: A registered task
+        :param payload: The input of the task; must be JSON serializable
+        :param created_by: The user the job is run for: the only one (with the admins) to see its status
+        :return: The queued job
+        """
+        if name not in cls.tasks:
+            raise ValueError(f'Unknown task: {name}')
+        job = Job.objects.create(name=name, payload=payload, created_by=created_by,
+                                 max_attempts=cls.task_max_attempts.get(name, settings.JOBS['MAX_ATTEMPTS']))
+        logger.info('JobQueue: enqueued job=%s name=%s', job.id, name)
+        return job
+
+    @classmethod
+    def claim(cls, worker_id: str, limit: int = 1) -> List[Job]:
+        """
+        Marks (at most) 'limit' due jobs as running by the given worker
+
+        :param worker_id: Identifies the worker in the locked_by column
+        :return: The claimed jobs, oldest first
+        """
+        token = f'{worker_id}:{uuid4().hex[:12]}'  # tells the jobs claimed by this call apart
+        now = timezone.now()
+        queryset = Job.objects.filter(status=JobStatus.QUEUED.value, run_after__lte=now).order_by('run_after', 'id')
+        skip_locked = connection.features.has_select_for_update_skip_locked
+        # NOTE: SQLite has no row locks: the conditional UPDATE alone decides which worker gets a job
+        with transaction.atomic() if skip_locked else nullcontext():
+            if skip_locked:
+                queryset = queryset.select_for_update(skip_locked=True)
+            job_ids = list(queryset.values_list('id', flat=True)[:limit])
+            if not job_ids:
+                return []
+            Job.objects.filter(id__in=job_ids, status=JobStatus.QUEUED.value).update(
+                status=JobStatus.RUNNING.value, locked_by=token, locked_at=now, attempts=F('attempts') + 1,
+                updated_at=now)
+        return list(Job.objects.filter(locked_by=token, status=JobStatus.RUNNING.value).order_by('run_after', 'id'))
+
+    @classmethod
+    def run(cls, job: Job) -> None:
+        """
+        Runs a claimed job and records its outcome: succeeded, failed, or queued again for a retry
+        """
+        fields = {'locked_by': '', 'locked_at': None}
+        try:
+            func = cls.tasks.get(job.name)
+            if func is None:
+                raise ValidationError(f'Unknown task: {job.name}')
+            with JobHeartbeat(job, settings.JOBS['HEARTBEAT_INTERVAL']):
+                result = func(job.payload, job)
+        except Exception as e:
+            now = timezone.now()
+            # an invalid input fails the same way on every attempt: not retried
+            retry = job.attempts < job.max_attempts and not isinstance(e, ValidationError)
+            logger.warning('JobQueue: job=%s name=%s attempt=%s/%s failed: %r%s', job.id, job.name, job.attempts,
+                           job.max_attempts, e, ' (retrying)' if retry else '')
+            fields['error'] = traceback.format_exc()
+            if retry:
+                backoff = settings.JOBS['RETRY_BACKOFF'] * 2 ** (job.attempts - 1)
+                fields.update(status=JobStatus.QUEUED.value, run_after=now + timedelta(seconds=backoff))
+            else:
+                fields.update(status=JobStatus.FAILED.value, finished_at=now)
+        else:
+            now = timezone.now()
+            logger.info('JobQueue: job=%s name=%s succeeded', job.id, job.name)
+            fields.update(status=JobStatus.SUCCEEDED.value, result=result, error='', finished_at=now)
+        # NOTE: filtered by the claim: a job re-queued as lost (see 'requeue_lost()') is not overwritten
+        updated = Job.objects.filter(id=job.id, locked_by=job.locked_by).update(updated_at=now, **fields)
+        if not updated:
+            logger.warning('JobQueue: job=%s was re-queued while running: outcome dropped', job.id)
+        for field_name, value in fields.items():
+            setattr(job, field_name, value)
+
+    @classmethod
+    def requeue_lost(cls) -> int:
+        """
+        Re-queues the running jobs without a heartbeat for settings.JOBS['LOCK_TIMEOUT'] (or fails them if out of
+        attempts)
+
+        :return: The num of jobs recovered
+        """
+        now = timezone.now()
+        lost = Job.objects.filter(status=JobStatus.RUNNING.value,
+                                  locked_at__lt=now - timedelta(seconds=settings.JOBS['LOCK_TIMEOUT']))
+        num_failed = lost.filter(attempts__gte=F('max_attempts')).update(
+            status=JobStatus.FAILED.value, error='Lost: the worker stopped sending heartbeats', locked_by='',
+            locked_at=None, finished_at=now, updated_at=now)
+        num_requeued = lost.update(status=JobStatus.QUEUED.value, locked_by='', locked_at=None, updated_at=now)
+        if num_failed or num_requeued:
+            logger.warning('JobQueue: lost jobs: requeued=%s failed=%s', num_requeued, num_failed)
+        return num_failed + num_requeued
+
+
+class JobHeartbeat:
+    """
+    Refreshes the claim (locked_at) of a running job every 'interval' seconds, from a thread of its own: a job is
+    found lost by its stale heartbeat (see 'JobQueue.requeue_lost()'), not by how long it runs
+    """
+
+    def __init__(self, job: Job, interval: float):
+        self.job = job
+        self.interval = interval
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self.beat, name=f'job-heartbeat-{job.id}', daemon=True)
+
+    def beat(self) -> None:
+        try:
+            while not self.stop_event.wait(self.interval):
+                try:
+                    updated = Job.objects.filter(id=self.job.id, locked_by=self.job.locked_by,
+                                                 status=JobStatus.RUNNING.value).update(locked_at=timezone.now())
+                except DatabaseError as e:  # e.g. SQLite busy with the writes of the job: beats again next time
+                    logger.warning('JobHeartbeat: job=%s: %r', self.job.id, e)
+                    continue
+                if not updated:
+                    logger.warning('JobHeartbeat: job=%s is no longer claimed by this worker', self.job.id)
+                    return
+        finally:
+            connection.close()  # the connection of this thread
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop_event.set()
+        self.thread.join()
+
+
+class JobWorker:
+    """
+    Runs the queued jobs with 'concurrency' threads, each claiming and running one job at a time
+    (see the 'run_job_worker' command for the process based concurrency)
+    """
+
+    def __init__(self, worker_id: str, concurrency: int, poll_interval: float, burst: bool = False):
+        """
+        :param worker_id: Identifies the worker in the claims of its jobs
+        :param concurrency: Num of threads
+        :param poll_interval: Seconds to wait for a job once the queue is found empty
+        :param burst: If True, every thread exits once the queue is found empty instead of polling
+        """
+        self.worker_id = worker_id
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.burst = burst
+        self.stop_event = threading.Event()
+        self.num_jobs = 0
+        self.lock = threading.Lock()
+
+    def stop(self, *args) -> None:
+        """
+        Lets the threads finish their current job and exit; a signal handler
+        """
+        logger.info('JobWorker %s: stopping', self.worker_id)
+        self.stop_event.set()
+
+    def work(self, thread_id: str) -> None:
+        try:
+            while not self.stop_event.is_set():
+                jobs = JobQueue.claim(thread_id)
+                if not jobs:
+                    if self.burst:
+                        return
+                    JobQueue.requeue_lost()
+                    self.stop_event.wait(self.poll_interval)
+                    continue
+                for job in jobs:
+                    JobQueue.run(job)
+                    with self.lock:
+                        self.num_jobs += 1
+        finally:
+            connection.close()  # the connection of this thread
+
+    def run(self) -> int:
+        """
+        Runs the threads until stopped (SIGINT, SIGTERM), or until the queue is empty in the burst mode
+
+        :return: The num of jobs run
+        """
+        if threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGINT, self.stop)
+            signal.signal(signal.SIGTERM, self.stop)
+        logger.info('JobWorker %s: started: concurrency=%s', self.worker_id, self.concurrency)
+        threads = [threading.Thread(target=self.work, args=(f'{self.worker_id}-{i}',), name=f'job-worker-{i}')
+                   for i in range(self.concurrency)]
+        for thread in threads:
+            thread.start()
+        # NOTE: join() with a timeout: an untimed join would defer the signal handlers until the threads exit
+        while any(thread.is_alive() for thread in threads):
+            for thread in threads:
+                thread.join(timeout=0.5)
+        logger.info('JobWorker %s: stopped: jobs=%s', self.worker_id, self.num_jobs)
+        return self.num_jobs
+
+
+def get_export_path(job: Job) -> Path:
+    """
+    :return: The file written by an 'export_expenses' job
+    """
+    extension, _ = ExpenseHistoryExporter.FORMATS[job.payload['file_type']]
+    return Path(settings.JOBS['EXPORT_DIR']) / f'job-{job.id}.{extension}'
+
+
+"""
+Tasks: the heavy flows of the API, enqueued with '?background=1' (see viewsets.py)
+"""
+
+
+@JobQueue.task('settle_up')
+def settle_up(payload: dict, job: Job) -> dict:
+    """
+    :param payload: {'group_id', 'strategy'}
+    :return: {'strategy', 'ledger_version', 'transactions'}: the transactions as served by the settle_up endpoint
+    """
+    group_id, strategy = payload['group_id'], payload['strategy']
+    # already out of the request: settled up in this process (see SettlementExecution)
+    settlement_strategy = SettlementStrategyFactory.get_by_name(strategy, SettlementExecution.IN_PROCESS.value)
+    ledger_version = GroupBalanceLedger.get_version(group_id)
+    if ledger_version is None:
+        raise ValidationError(f'Group not found: {group_id}')
+    data = SettlementCache.get(group_id, strategy, ledger_version)
+    if data is None:
+        transactions = settlement_strategy.settle_up(GroupBalanceLedger.get_balance_sheet(group_id))
+        data = [transaction.to_dict() for transaction in transactions]
+        SettlementCache.set(group_id, strategy, ledger_version, data)
+    return {'strategy': strategy, 'ledger_version': ledger_version, 'transactions': data}
+
+
+@JobQueue.task('import_expenses', max_attempts=1)  # not re-run: the chunks imported before a failure are committed
+def import_expenses(payload: dict, job: Job) -> dict:
+    """
+    :param payload: {'group_id', 'items'}: the expenses, as accepted by the import endpoint
+    :return: The result of 'GroupExpenseImporter.run()'
+    """
+    group = Group.objects.filter(id=payload['group_id']).first()
+    if group is None:
+        raise ValidationError(f'Group not found: {payload["group_id"]}')
+    return GroupExpenseImporter.run(group, job.created_by, payload['items'], settings.EXPENSE_IMPORT['CHUNK_SIZE'])
+
+
+@JobQueue.task('export_expenses')
+def export_expenses(payload: dict, job: Job) -> dict:
+    """
+    Writes the expense history of the user to a file in settings.JOBS['EXPORT_DIR'], served by the job download
+    endpoint
+
+    :param payload: {'query', 'file_type'}
+    :return: {'file_name', 'content_type', 'size'}
+    """
+    if job.created_by is None:
+        raise ValidationError('The user of the export no longer exists')
+    query_type, file_type = Query(payload['query']), payload['file_type']
+    extension, content_type = ExpenseHistoryExporter.FORMATS[file_type]
+    path = get_export_path(job)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temp_path = path.with_name(path.name + '.part')  # a retry or a download never sees a partial file
+    with open(temp_path, 'w', newline='', encoding='utf-8') as file:
+        for chunk in ExpenseHistoryExporter.stream(job.created_by, query_type, file_type,
+                                                   settings.EXPENSE_EXPORT['CHUNK_SIZE']):
+            file.write(chunk)
+    os.replace(temp_path, path)
+    return {'file_name': f'expenses-{job.created_by.id}-{query_type.value}.{extension}',
+            'content_type': content_type, 'size': path.stat().st_size}
+
+
+@JobQueue.task('rebuild_ledger')
+def rebuild_ledger(payload: dict, job: Job) -> dict:
+    """
+    :param payload: {'group_id'}
+    :return: {'users'}: the num of users with a non-zero balance
+    """
+    group = Group.objects.filter(id=payload['group_id']).first()
+    if group is None:
+        raise ValidationError(f'Group not found: {payload["group_id"]}')
+    return {'users': len(GroupBalanceLedger.rebuild(group))}
@@ -0,0 +1,140 @@
+from decimal import Decimal
+from typing import Iterable, Optional, Tuple
+from django.db import transaction
+from django.db.models import Case, F, Value, When
+from .models import Group, GroupBalance
+from .queries import BalanceQuery
+from .utils import build_balance_sheet
+
+
+class GroupBalanceLedger:
+    """
+    Keeps the 'GroupBalance' rows of a group in sync with its expenses.
+
+    Every write is a delta (user -> amount) applied with an F() expression, hence concurrent
+    expense writes on the same group never lose an update.
+    The ledger must be updated in the same transaction as the expense itself.
+    Every update bumps the ledger version of the group, which keys its cached settlements (see caches.py).
+    """
+
+    @classmethod
+    def get_deltas(cls, paid_by: Iterable[Tuple[int, Decimal]], shared_by: Iterable[Tuple[int, Decimal]],
+                   sign: int = 1) -> dict:
+        """
+        Builds the user to balance delta mapping of a single expense
+
+        :param paid_by: (user_id, amount) pairs of the users who paid
+        :param shared_by: (user_id, amount) pairs of the users who owe
+        :param sign: 1 to apply the expense, -1 to revert it
+        :return: A dict of user_id to balance delta; zero deltas are dropped
+        """
+        deltas = build_balance_sheet(*((user_id, sign * amount) for user_id, amount in paid_by),
+                                     *((user_id, -sign * amount) for user_id, amount in shared_by))
+        return {user_id: delta for user_id, delta in deltas.items() if delta != 0}
+
+    @classmethod
+    def apply(cls, group_id: int, deltas: dict) -> None:
+        """
+        Adds the given deltas to the balances of the group members
+
+        :param group_id: The group the expense belongs to
+        :param deltas: A dict of user_id to balance delta (see 'get_deltas()')
+        :return: None
+        """
+        cls.bump_version(group_id)  # even for zero deltas: an expense was still created or deleted
+        if not deltas:
+            return
+        with transaction.atomic():
+            # ensuring a ledger row exists for every participant, then incrementing all of them in a single UPDATE
+            GroupBalance.objects.bulk_create([GroupBalance(group_id=group_id, user_id=user_id) for user_id in deltas],
+                                             ignore_conflicts=True)
+            delta = Case(*[When(user_id=user_id, then=Value(delta)) for user_id, delta in deltas.items()],
+                         output_field=GroupBalance._meta.get_field('balance'))
+            (GroupBalance.objects.filter(group_id=group_id, user_id__in=deltas.keys())
+             .update(balance=F('balance') + delta))
+
+    @classmethod
+    def bump_version(cls, group_id: int) -> None:
+        """
+        Invalidates the cached settlements of the group; must be called in the same transaction as the change
+        of its expenses or members. Incremented with an F() expression: concurrent bumps are never lost.
+        """
+        Group.objects.filter(pk=group_id).update(ledger_version=F('ledger_version') + 1)
+
+    @classmethod
+    def get_version(cls, group_id: int) -> Optional[int]:
+        """
+        :return: The ledger version of the group, or None if the group does not exist
+        """
+        return Group.objects.filter(pk=group_id).values_list('ledger_version', flat=True).first()
+
+    @classmethod
+    def get_balance_sheet(cls, group_id: int) -> dict:
+        """
+        Reads the group balance sheet from the ledger: one row per user with a non-zero balance
+
+        :param group_id: The target group
+        :return: A dict of user_id to balance mapping; -ve balance indicates owed amount
+        """
+        queryset = (GroupBalance.objects.filter(group_id=group_id)
+                    .exclude(balance=0)
+                    .order_by('user_id')
+                    .values_list('user_id', 'balance'))
+        return dict(queryset)
+
+    @classmethod
+    async def aget_balance_sheet(cls, group_id: int) -> dict:
+        """
+        The async twin of 'get_balance_sheet()', for the async views
+        """
+        queryset = (GroupBalance.objects.filter(group_id=group_id)
+                    .exclude(balance=0)
+                    .order_by('user_id')
+                    .values_list('user_id', 'balance'))
+        return {user_id: balance async for user_id, balance in queryset}
+
+    @classmethod
+    def compute_balance_sheet(cls, group_id: int) -> dict:
+        """
+        Recomputes the group balance sheet from the full expense history (aggregated by the database)
+
+        :param group_id: The target group
+        :return: A dict of user_id to balance mapping; users with a zero balance are dropped
+        """
+        return BalanceQuery.group_balance_sheet(group_id).to_dict()
+
+    @classmethod
+    def rebuild(cls, group: Group) -> dict:
+        """
+        Replaces the ledger of the group with the balances computed from its expense history.
+        The version bump locks the group row before the history is read, as 'apply()' does: an expense written
+        concurrently is either part of the computed balances or applied as a delta after the rebuild, never lost.
+
+        :param group: The target group
+        :return: The rebuilt balance sheet
+        """
+        with transaction.atomic():
+            cls.bump_version(group.id)
+            balance_sheet = cls.compute_balance_sheet(group.id)
+            GroupBalance.objects.filter(group=group).delete()
+            GroupBalance.objects.bulk_create([GroupBalance(group=group, user_id=user_id, balance=balance)
+                                              for user_id, balance in balance_sheet.items()])
+        return balance_sheet
+
+    @classmethod
+    def verify(cls, group: Group) -> dict:
+        """
+        Compares the ledger of the group against its expense history
+
+        :param group: The target group
+        :return: A dict of user_id to (ledger_balance, expected_balance) for every mismatch
+        """
+        ledger = cls.get_balance_sheet(group.id)
+        expected = cls.compute_balance_sheet(group.id)
+        mismatches = {}
+        for user_id in ledger.keys() | expected.keys():
+            ledger_balance = ledger.get(user_id, 0)
+            expected_balance = expected.get(user_id, 0)
+            if ledger_balance != expected_balance:
+                mismatches[user_id] = (ledger_balance, expected_balance)
+        return mismatches
@@ -0,0 +1,117 @@
+import json
+import random
+from time import perf_counter
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from rest_framework.renderers import JSONRenderer
+from ...instrumentation import RequestMetrics
+from ...importers import GroupExpenseImporter
+from ...models import Group, GroupExpense, User
+from ...serializers import GroupExpenseListReader, GroupExpenseSerializer
+
+
+class Command(BaseCommand):
+    help = ('Benchmarks the read path of the group expense list: GroupExpenseSerializer(many=True) against the '
+            'values() based GroupExpenseListReader, over groups of the given sizes seeded in a throwaway test '
+            'database; checks that both render the same JSON')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--expenses', nargs='+', type=int, default=[1_000, 10_000],
+                            help='The num of expenses per group to benchmark')
+        parser.add_argument('--members', type=int, default=5, help='Num of members per group, admin included')
+        parser.add_argument('--iterations', type=int, default=3, help='Num of timed runs per path and group size')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--format', choices=['table', 'json'], default='table')
+        parser.add_argument('--output', help='Writes the report to the given file instead of stdout')
+
+    def seed_group(self, rng: random.Random, num_expenses: int, members: list) -> Group:
+        """
+        :return: A new group of the given members with 'num_expenses' expenses, each paid by one or two members
+        and shared by all of them
+        """
+        group = Group.objects.create(name=f'benchmark {num_expenses}', created_by=members[0])
+        group.members.add(*members[1:])
+        items = []
+        for i in range(num_expenses):
+            amount = rng.randint(100, 100_000)  # in cents
+            payers = rng.sample(members, rng.randint(1, min(2, len(members))))
+            paid = [amount // len(payers)] * len(payers)
+            paid[0] += amount - sum(paid)
+            shared = [amount // len(members)] * len(members)
+            shared[0] += amount - sum(shared)
+            items.append({
+                'amount': f'{amount / 100:.2f}', 'title': f'expense {i}', 'description': 'benchmark',
+                'paid_by': [{'user': user.id, 'amount': f'{cents / 100:.2f}'} for user, cents in zip(payers, paid)],
+                'shared_by': [{'user': user.id, 'amount': f'{cents / 100:.2f}'}
+                              for user, cents in zip(members, shared)],
+            })
+        result = GroupExpenseImporter.run(group, members[0], items, chunk_size=1_000)
+        if result['errors']:
+            raise CommandError(f'Failed to seed the group: {result["errors"][:3]}')
+        return group
+
+    def time_path(self, read, iterations: int) -> dict:
+        """
+        :param read: A callable returning the representation of the expense list
+        :return: The timings of rendering the list to JSON, the num of queries and the rendered JSON
+        """
+        latencies = []
+        for _ in range(iterations):
+            metrics = RequestMetrics()  # counting the queries: CaptureQueriesContext keeps the last 9000 only
+            with connection.execute_wrapper(metrics.wrap_query):
+                start = perf_counter()
+                content = JSONRenderer().render(read())
+                latencies.append(perf_counter() - start)
+        latencies.sort()
+        return {
+            'best_ms': round(latencies[0] * 1000, 1),
+            'median_ms': round(latencies[len(latencies) // 2] * 1000, 1),
+            'queries': metrics.num_queries,
+            'content': content,
+        }
+
+    def run_benchmark(self, options: dict) -> list:
+        rng = random.Random(options['seed'])
+        members = [User.objects.create_user(username=f'benchmark_user_{i}', password=None)
+                   for i in range(options['members'])]
+        results = []
+        for num_expenses in options['expenses']:
+            group = self.seed_group(rng, num_expenses, members)
+            # the serializer path, as served before GroupExpenseListReader; ordered by id like the reader
+            serializer_path = self.time_path(lambda: GroupExpenseSerializer(
+                GroupExpense.objects.filter(group_id=group.id).order_by('id'), many=True).data, options['iterations'])
+            reader_path = self.time_path(lambda: GroupExpenseListReader.read(group.id), options['iterations'])
+            if serializer_path.pop('content') != reader_path.pop('content'):
+                raise CommandError(f'The reader does not render the same JSON as the serializer: {num_expenses}')
+            for path, result in (('serializer', serializer_path), ('values_reader', reader_path)):
+                results.append({'expenses': num_expenses, 'path': path, **result,
+                                'speedup': round(serializer_path['median_ms'] / result['median_ms'], 1)})
+        return results
+
+    def handle(self, *args, **options):
+        if options['iterations'] < 1 or options['members'] < 2:
+            raise CommandError('--iterations must be positive and --members at least 2')
+        # a throwaway test database, as the test runner does: the configured database is never touched
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            results = self.run_benchmark(options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+        if options['format'] == 'json':
+            report = json.dumps({
+                'options': {key: options[key] for key in ('expenses', 'members', 'iterations', 'seed')},
+                'database': connection.vendor,
+                'results': results,
+            }, indent=2)
+        else:
+            columns = list(results[0].keys())
+            lines = [' '.join(f'{column:>14}' for column in columns)]
+            for result in results:
+                lines.append(' '.join(f'{str(result[column]):>14}' for column in columns))
+            report = '\n'.join(lines)
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                file.write(report + '\n')
+            self.stdout.write(self.style.SUCCESS(f'Report written to {options["output"]}'))
+        else:
+            self.stdout.write(report)
@@ -0,0 +1,172 @@
+import json
+import logging
+import platform
+import random
+import tracemalloc
+from decimal import Decimal
+from time import perf_counter_ns
+from typing import Callable, List
+import django
+from django.core.management.base import BaseCommand, CommandError
+from ...enums import SettlementType, SettlementExecution
+from ...factories import SettlementStrategyFactory
+from ...utils import BalanceSheet, build_balance_sheet, validate_balance_sheet
+
+SPLITS_PER_USER = 4  # expense splits per user fed to build_balance_sheet
+
+
+def generate_minor_units(rng: random.Random, members: int, skew: float) -> List[int]:
+    """
+    Generates a zero-sum list of balances in minor units
+
+    :param rng: The seeded random generator
+    :param members: Num of users with a balance
+    :param skew: 0 for uniformly distributed balances; the higher, the more a few users hold most of the balance
+    (the balances follow a Pareto distribution of shape 1 / skew)
+    :return: A list of the balances; -ve balance indicates owed amount
+    """
+    balances = []
+    for _ in range(members - 1):
+        magnitude = rng.random() if skew <= 0 else rng.paretovariate(1 / skew)
+        balance = max(1, round(magnitude * 10_000))
+        balances.append(balance if rng.random() < 0.5 else -balance)
+    balances.append(-sum(balances))  # the last user settles the sheet
+    return balances
+
+
+def generate_balance_sheet(rng: random.Random, members: int, skew: float, precision: int) -> dict:
+    """
+    :param precision: Num of decimal places of the balances
+    :return: A zero-sum dict of user_id to Decimal balance, as read from the group balance ledger
+    """
+    return {user_id: Decimal(balance).scaleb(-precision)
+            for user_id, balance in enumerate(generate_minor_units(rng, members, skew), start=1)}
+
+
+def generate_splits(rng: random.Random, balance_sheet: dict) -> list:
+    """
+    :return: A shuffled list of (user_id, amount) adding up to the given balance sheet
+    """
+    splits = []
+    for user_id, balance in balance_sheet.items():
+        pieces = [balance / SPLITS_PER_USER] * (SPLITS_PER_USER - 1)
+        splits.extend((user_id, piece) for piece in pieces)
+        splits.append((user_id, balance - sum(pieces)))
+    rng.shuffle(splits)
+    return splits
+
+
+def percentile(sorted_values: list, fraction: float):
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+class Command(BaseCommand):
+    help = ('Benchmarks the settlement strategies, build_balance_sheet and validate_balance_sheet over seeded '
+            'synthetic balance sheets; reports ops/sec, p50/p99 latency, transactions emitted and peak memory')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--members', nargs='+', type=int, default=[10, 100, 1_000],
+                            help='The group sizes (users with a balance) to benchmark')
+        parser.add_argument('--skew', nargs='+', type=float, default=[0.0, 1.0],
+                            help='The skews of the balances: 0 for uniform, higher for a few large balances')
+        parser.add_argument('--precision', nargs='+', type=int, default=[2],
+                            help='The num of decimal places of the balances')
+        parser.add_argument('--benchmarks', nargs='+',
+                            default=[settlement_type.value for settlement_type in SettlementType] +
+                                    ['build_balance_sheet', 'validate_balance_sheet'],
+                            help='The settlement strategies (see SettlementType) and utils to benchmark')
+        parser.add_argument('--iterations', type=int, default=200, help='Num of timed runs per case')
+        parser.add_argument('--execution', choices=[execution.value for execution in SettlementExecution],
+                            default=SettlementExecution.IN_PROCESS.value,
+                            help='process_pool: includes the round trip to the pool for the large groups')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--format', choices=['table', 'json'], default='table')
+        parser.add_argument('--output', help='Writes the report to the given file instead of stdout')
+
+    def get_benchmark(self, name: str, precision: int, execution: str) -> Callable:
+        """
+        :param execution: The execution mode of the strategies (see SettlementExecution)
+        :return: A callable taking (balance_sheet, splits), returning the transactions for a strategy or None
+        """
+        if name == 'build_balance_sheet':
+            return lambda balance_sheet, splits: build_balance_sheet(*splits) and None
+        if name == 'validate_balance_sheet':
+            return lambda balance_sheet, splits: validate_balance_sheet(balance_sheet) and None
+        try:
+            strategy = SettlementStrategyFactory.get_by_name(name, execution=execution)
+        except ValueError:
+            raise CommandError(f'Unknown benchmark: {name}')
+        # the conversion to minor units is part of every settlement, hence timed along with it
+        return lambda balance_sheet, splits: strategy.settle_up(BalanceSheet.from_dict(balance_sheet, precision))
+
+    def run_case(self, name: str, members: int, skew: float, precision: int, options: dict) -> dict:
+        benchmark = self.get_benchmark(name, precision, options['execution'])
+        # the same seed for every benchmark: all of them are fed the same inputs
+        rng = random.Random(f'{options["seed"]}:{members}:{skew}:{precision}')
+        inputs = []
+        for _ in range(options['iterations']):
+            balance_sheet = generate_balance_sheet(rng, members, skew, precision)
+            splits = generate_splits(rng, balance_sheet) if name == 'build_balance_sheet' else None
+            inputs.append((balance_sheet, splits))
+        latencies, num_transactions = [], []
+        for balance_sheet, splits in inputs:
+            start = perf_counter_ns()
+            transactions = benchmark(balance_sheet, splits)
+            latencies.append(perf_counter_ns() - start)
+            if transactions is not None:
+                num_transactions.append(len(transactions))
+        # peak memory is measured on a separate run: tracing the allocations slows down the timed runs
+        tracemalloc.start()
+        benchmark(*inputs[0])
+        peak_memory = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        latencies.sort()
+        return {
+            'benchmark': name,
+            'members': members,
+            'skew': skew,
+            'precision': precision,
+            'iterations': len(latencies),
+            'ops_per_sec': round(len(latencies) / (sum(latencies) / 1e9), 1),
+            'p50_us': round(percentile(latencies, 0.50) / 1e3, 2),
+            'p99_us': round(percentile(latencies, 0.99) / 1e3, 2),
+            'transactions_avg': round(sum(num_transactions) / len(num_transactions), 2) if num_transactions else None,
+            'peak_memory_kib': round(peak_memory / 1024, 1),
+        }
+
+    def handle(self, *args, **options):
+        if options['iterations'] < 1:
+            raise CommandError('--iterations must be positive')
+        # the min-transactions fallback is logged at INFO on every call beyond its bounds
+        strategies_logger = logging.getLogger('splitwise.strategies')
+        level = strategies_logger.level
+        strategies_logger.setLevel(logging.WARNING)
+        try:
+            results = [self.run_case(name, members, skew, precision, options)
+                       for name in options['benchmarks']
+                       for members in options['members']
+                       for skew in options['skew']
+                       for precision in options['precision']]
+        finally:
+            strategies_logger.setLevel(level)
+        if options['format'] == 'json':
+            report = json.dumps({
+                'seed': options['seed'],
+                'execution': options['execution'],
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'results': results,
+            }, indent=2)
+        else:
+            columns = list(results[0].keys())
+            lines = [' '.join(f'{column:>22}' if i == 0 else f'{column:>16}' for i, column in enumerate(columns))]
+            for result in results:
+                lines.append(' '.join(f'{str(result[column]):>22}' if i == 0 else f'{str(result[column]):>16}'
+                                      for i, column in enumerate(columns)))
+            report = '\n'.join(lines)
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                file.write(report + '\n')
+            self.stdout.write(self.style.SUCCESS(f'Report written to {options["output"]}'))
+        else:
+            self.stdout.write(report)
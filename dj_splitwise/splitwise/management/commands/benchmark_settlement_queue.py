@@ -0,0 +1,45 @@
+import random
+from time import perf_counter
+from django.core.management.base import BaseCommand
+from ...utils import SettlementQueue, heap_push, heap_pop, is_smaller_balance
+
+
+def run_hand_rolled_heap(user_balances: list) -> None:
+    heap = []
+    for user_id, balance in user_balances:
+        heap_push((user_id, -balance), heap, comparator=is_smaller_balance)
+    while heap:
+        heap_pop(heap, comparator=is_smaller_balance)
+
+
+def run_settlement_queue(user_balances: list) -> None:
+    queue = SettlementQueue(user_balances)
+    while queue:
+        queue.pop()
+
+
+class Command(BaseCommand):
+    help = ('Compares the hand-rolled heap (utils.functions) against the heapq-backed SettlementQueue: '
+            'building the queue and draining it')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', nargs='+', type=int, default=[10, 1_000, 100_000],
+                            help='The numbers of balances to benchmark')
+        parser.add_argument('--repeat', type=int, default=3, help='Best of the given number of runs')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        self.stdout.write(f'{"balances":>10} {"hand-rolled (ms)":>18} {"heapq (ms)":>12} {"speedup":>9}')
+        for size in options['sizes']:
+            # balances in minor units, as used by the settlement strategies (see utils.BalanceSheet)
+            user_balances = [(user_id, rng.randint(1, 10_000_000)) for user_id in range(size)]
+            timings = []
+            for run in (run_hand_rolled_heap, run_settlement_queue):
+                best = float('inf')
+                for _ in range(options['repeat']):
+                    start = perf_counter()
+                    run(user_balances)
+                    best = min(best, perf_counter() - start)
+                timings.append(best * 1000)
+            self.stdout.write(f'{size:>10} {timings[0]:>18.3f} {timings[1]:>12.3f} {timings[0] / timings[1]:>8.1f}x')
@@ -0,0 +1,112 @@
+import json
+import re
+from typing import Dict, List, Tuple
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+from django.db.models import QuerySet
+from django.utils import timezone
+from ...enums import JobStatus, Query
+from ...models import Group, GroupBalance, Job, User
+from ...queries import BalanceQuery, ExpenseFeedQuery
+from ...serializers import GroupExpenseListReader
+from ...viewsets import QueryExpenseViewSet
+
+SQLITE_SCAN = re.compile(r'^SCAN (\w+)')  # 'SCAN (subquery-1)' etc. are not tables
+
+
+class Command(BaseCommand):
+    help = ('Runs EXPLAIN on the hot queries of the API and fails if any of them reads a whole table (a full scan) '
+            'instead of searching an index. Read only: the queries are planned, not run. SQLite and PostgreSQL.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default', help='The database alias to check the plans on')
+
+    def get_hot_queries(self) -> Dict[str, QuerySet]:
+        """
+        :return: The queries of the hot paths, built by the code serving them; the ids are placeholders:
+        a plan does not depend on the rows existing
+        """
+        user, group_id = User(id=1), 1
+        expenses, splits = GroupExpenseListReader.get_querysets(group_id)
+        viewset = QueryExpenseViewSet()
+        hot_queries = {
+            'group.ledger_version': Group.objects.filter(pk=group_id).values_list('ledger_version', flat=True),
+            'group.member_ids': Group.members.through.objects.filter(group_id=group_id).values_list('user_id'),
+            'group_expense.list': expenses,
+            **{f'group_expense.list.{field_name}': queryset for field_name, queryset in splits.items()},
+            'settle_up.balance_sheet': (GroupBalance.objects.filter(group_id=group_id).exclude(balance=0)
+                                        .order_by('user_id').values_list('user_id', 'balance')),
+            'expense.user_expense': viewset.query_user_expense(user).order_by('created_at'),
+            'expense.group_expense_paid_by': (viewset.query_group_expense_paid_by(user)
+                                              .order_by('expense__created_at')),
+            'expense.group_expense_shared_by': (viewset.query_group_expense_shared_by(user)
+                                                .order_by('expense__created_at')),
+            'expense.feed_page': ExpenseFeedQuery.get_page_queryset(user, Query.ALL, limit=51),
+            'expense.feed_page_cursor': ExpenseFeedQuery.get_page_queryset(
+                user, Query.ALL, cursor=(timezone.now(), 1, 0, 1), limit=51),
+            'ledger.rebuild': BalanceQuery.signed_splits(group_id=group_id),
+            'job.claim': (Job.objects.filter(status=JobStatus.QUEUED.value, run_after__lte=timezone.now())
+                          .order_by('run_after', 'id').values_list('id', flat=True)[:1]),
+        }
+        for i, queryset in enumerate(ExpenseFeedQuery.get_querysets(user, Query.ALL)):
+            hot_queries[f'expense.export.{i}'] = queryset.values(*ExpenseFeedQuery.FIELDS).order_by(
+                *ExpenseFeedQuery.KEYSET)
+        return hot_queries
+
+    def explain_sqlite(self, connection, sql: str, params) -> Tuple[List[str], List[str]]:
+        """
+        :return: (the plan lines, the tables scanned in full)
+        """
+        tables = set(connection.introspection.table_names())
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            lines = [row[3] for row in cursor.fetchall()]
+        # NOTE: 'SCAN <table> USING [COVERING] INDEX' walks the whole index: a full scan as well
+        full_scans = [match.group(1) for match in map(SQLITE_SCAN.match, lines)
+                      if match and match.group(1) in tables]
+        return lines, full_scans
+
+    def explain_postgresql(self, connection, sql: str, params) -> Tuple[List[str], List[str]]:
+        """
+        :return: (the plan lines, the tables scanned in full)
+        """
+        with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+            # the planner prefers a Seq Scan on a small table anyway: asks whether an index could be used at all
+            cursor.execute('SET LOCAL enable_seqscan = off')
+            cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+            plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        lines, full_scans = [], []
+        nodes = [(plan[0]['Plan'], 0)]
+        while nodes:
+            node, depth = nodes.pop()
+            relation = node.get('Relation Name')
+            index = node.get('Index Name')
+            lines.append('  ' * depth + node['Node Type'] + (f' on {relation}' if relation else '') +
+                         (f' using {index}' if index else ''))
+            if node['Node Type'] == 'Seq Scan':
+                full_scans.append(relation)
+            nodes.extend((child, depth + 1) for child in reversed(node.get('Plans', [])))
+        return lines, full_scans
+
+    def handle(self, *args, **options):
+        connection = connections[options['database']]
+        explain = {'sqlite': self.explain_sqlite, 'postgresql': self.explain_postgresql}.get(connection.vendor)
+        if explain is None:
+            raise CommandError(f'Unsupported database: {connection.vendor}')
+        failures = []
+        for name, queryset in self.get_hot_queries().items():
+            sql, params = queryset.using(options['database']).query.sql_with_params()
+            lines, full_scans = explain(connection, sql, params)
+            if full_scans:
+                failures.append(name)
+                self.stdout.write(self.style.ERROR(f'FULL SCAN {name}: {", ".join(full_scans)}'))
+            else:
+                self.stdout.write(f'ok        {name}')
+            if options['verbosity'] > 1 or full_scans:
+                for line in lines:
+                    self.stdout.write(f'            {line}')
+        if failures:
+            raise CommandError(f'{len(failures)} hot query(ies) scan a whole table: {", ".join(failures)}')
+        self.stdout.write(self.style.SUCCESS('No hot query scans a whole table'))
@@ -0,0 +1,259 @@
+import json
+import os
+import random
+import tempfile
+import threading
+from collections import Counter
+from time import perf_counter
+from typing import List, Optional, Tuple
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, setup_test_environment, teardown_test_environment
+
+LATENCY_BUCKETS_MS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000]  # upper bounds; the last bucket is unbounded
+READ_ENDPOINTS = ['expense_list', 'settle_up', 'query_feed', 'group_retrieve']
+
+
+class EndpointStats:
+    """
+    The latencies, query counts and statuses of every call made to a single endpoint
+    """
+
+    def __init__(self):
+        self.latencies: List[float] = []  # seconds
+        self.num_queries: List[int] = []
+        self.statuses = Counter()
+        self.wall_time = 0.0  # seconds: the duration of the phases the endpoint was called in
+        self.lock = threading.Lock()
+
+    def add(self, latency: float, num_queries: int, status_code: int) -> None:
+        with self.lock:
+            self.latencies.append(latency)
+            self.num_queries.append(num_queries)
+            self.statuses[status_code] += 1
+
+    def report(self) -> dict:
+        latencies = sorted(self.latencies)
+        count = len(latencies)
+        histogram = Counter()
+        for latency in latencies:
+            bucket = next((f'<={bound}ms' for bound in LATENCY_BUCKETS_MS if latency * 1000 <= bound),
+                          f'>{LATENCY_BUCKETS_MS[-1]}ms')
+            histogram[bucket] += 1
+        return {
+            'requests': count,
+            'errors': sum(num for status_code, num in self.statuses.items() if status_code >= 400),
+            'throughput_rps': round(count / self.wall_time, 1) if self.wall_time else None,
+            'p50_ms': round(latencies[int(0.50 * count)] * 1000, 2),
+            'p90_ms': round(latencies[int(0.90 * count)] * 1000, 2),
+            'p99_ms': round(latencies[min(count - 1, int(0.99 * count))] * 1000, 2),
+            'max_ms': round(latencies[-1] * 1000, 2),
+            'queries_avg': round(sum(self.num_queries) / count, 2),
+            'queries_max': max(self.num_queries),
+            'statuses': {str(status_code): num for status_code, num in sorted(self.statuses.items())},
+            'histogram': {f'<={bound}ms': histogram[f'<={bound}ms'] for bound in LATENCY_BUCKETS_MS} |
+                         {f'>{LATENCY_BUCKETS_MS[-1]}ms': histogram[f'>{LATENCY_BUCKETS_MS[-1]}ms']},
+        }
+
+
+class Command(BaseCommand):
+    help = ('Load-tests the REST API offline: seeds users, groups and expenses through the endpoints into a '
+            'throwaway test database, drives the read endpoints concurrently through the Django test client '
+            'and reports the throughput, latency histogram and DB query count of every endpoint')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=50, help='N: num of users to register')
+        parser.add_argument('--groups', type=int, default=10, help='M: num of groups to create')
+        parser.add_argument('--group-size', type=int, default=5, help='Num of members per group, admin included')
+        parser.add_argument('--expenses', type=int, default=500, help='K: num of group expenses to create')
+        parser.add_argument('--reads', type=int, default=1_000,
+                            help='Num of requests spread over the read endpoints: ' + ', '.join(READ_ENDPOINTS))
+        parser.add_argument('--concurrency', type=int, default=8, help='Num of concurrent clients (threads)')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--fast-password-hasher', action='store_true',
+                            help='Uses MD5 to hash the passwords: register and token are then no longer '
+                                 'dominated by the (deliberately slow) default hasher')
+        parser.add_argument('--format', choices=['table', 'json'], default='table')
+        parser.add_argument('--output', help='Writes the report to the given file instead of stdout')
+
+    def setup_database(self) -> Tuple[str, Optional[str]]:
+        """
+        Creates a throwaway test database, as the test runner does: the configured database is never touched.
+        SQLite gets a file (instead of the default in-memory test database) and IMMEDIATE transactions, so that
+        the concurrent clients wait on each other's write locks instead of failing with 'database is locked'.
+
+        :return: (the name of the configured database, the SQLite file to remove afterward)
+        """
+        sqlite_file = None
+        if connection.vendor == 'sqlite':
+            fd, sqlite_file = tempfile.mkstemp(prefix='splitwise_load_test_', suffix='.sqlite3')
+            os.close(fd)
+            connection.settings_dict['TEST'] = dict(connection.settings_dict.get('TEST') or {}, NAME=sqlite_file)
+            connection.settings_dict['OPTIONS'] = dict(connection.settings_dict.get('OPTIONS') or {},
+                                                       transaction_mode='IMMEDIATE', timeout=30)
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        return old_name, sqlite_file
+
+    def call(self, client: Client, endpoint: str, method: str, path: str, data=None,
+             token: str = None) -> Tuple[int, dict]:
+        """
+        Calls the endpoint, recording the latency and the query count
+
+        :return: (status_code, response json)
+        """
+        headers = {'HTTP_AUTHORIZATION': f'Bearer {token}'} if token else {}
+        with CaptureQueriesContext(connection) as queries:
+            start = perf_counter()
+            response = getattr(client, method)(path, data, content_type='application/json', **headers)
+            latency = perf_counter() - start
+        self.stats.setdefault(endpoint, EndpointStats()).add(latency, len(queries), response.status_code)
+        try:
+            return response.status_code, response.json()
+        except ValueError:
+            return response.status_code, {}
+
+    def run_phase(self, calls: List[tuple]) -> list:
+        """
+        Runs the given calls concurrently: every thread has its own client and DB connection
+
+        :param calls: A list of (endpoint, method, path, data, token)
+        :return: The results of the calls, in the same order
+        """
+        for endpoint, *_ in calls:
+            self.stats.setdefault(endpoint, EndpointStats())
+        results = [None] * len(calls)
+        pending = iter(enumerate(calls))
+        lock = threading.Lock()
+
+        def worker():
+            client = Client()
+            try:
+                while True:
+                    with lock:
+                        i, call = next(pending, (None, None))
+                    if call is None:
+                        return
+                    results[i] = self.call(client, *call)
+            finally:
+                connection.close()  # the test database can not be destroyed while connections are open
+
+        threads = [threading.Thread(target=worker) for _ in range(self.concurrency)]
+        start = perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        wall_time = perf_counter() - start
+        for endpoint in {endpoint for endpoint, *_ in calls}:
+            self.stats[endpoint].wall_time += wall_time
+        return results
+
+    def get_expense_payload(self, rng: random.Random, member_ids: List[int]) -> dict:
+        amount = rng.randint(100, 100_000)  # in cents
+        payers = rng.sample(member_ids, rng.randint(1, min(2, len(member_ids))))
+        paid = [amount // len(payers)] * len(payers)
+        paid[0] += amount - sum(paid)
+        shared = [amount // len(member_ids)] * len(member_ids)
+        shared[0] += amount - sum(shared)
+        return {
+            'amount': f'{amount / 100:.2f}', 'title': 'load test', 'description': 'load test',
+            'paid_by': [{'user': user_id, 'amount': f'{cents / 100:.2f}'} for user_id, cents in zip(payers, paid)],
+            'shared_by': [{'user': user_id, 'amount': f'{cents / 100:.2f}'}
+                          for user_id, cents in zip(member_ids, shared)],
+        }
+
+    def run_load_test(self, options: dict) -> None:
+        rng = random.Random(options['seed'])
+        # users: register & token
+        password = 'load-test-password'
+        results = self.run_phase([('register', 'post', '/register/user/',
+                                   {'username': f'load_test_user_{i}', 'password': password}, None)
+                                  for i in range(options['users'])])
+        user_ids = [data['id'] for status_code, data in results if status_code == 201]
+        results = self.run_phase([('token', 'post', '/api/token/',
+                                   {'username': f'load_test_user_{i}', 'password': password}, None)
+                                  for i in range(options['users'])])
+        tokens = dict(zip(user_ids, [data.get('access') for _, data in results]))
+        # groups: create with the first member, add the rest
+        groups = []  # (group_id, admin_id, member_ids)
+        members_per_group = [rng.sample(user_ids, options['group_size']) for _ in range(options['groups'])]
+        results = self.run_phase([('group_create', 'post', '/user/group/',
+                                   {'name': f'group {i}', 'members': member_ids[1:2]}, tokens[member_ids[0]])
+                                  for i, member_ids in enumerate(members_per_group)])
+        for (status_code, data), member_ids in zip(results, members_per_group):
+            if status_code == 201:
+                groups.append((data['id'], member_ids[0], member_ids))
+        self.run_phase([('add_member', 'patch', f'/user/group/{group_id}/', {'members': member_ids[2:]},
+                         tokens[admin_id])
+                        for group_id, admin_id, member_ids in groups])
+        # expenses
+        calls = []
+        for _ in range(options['expenses']):
+            group_id, _, member_ids = rng.choice(groups)
+            calls.append(('expense_create', 'post', f'/expense/group/{group_id}/',
+                          self.get_expense_payload(rng, member_ids), tokens[rng.choice(member_ids)]))
+        self.run_phase(calls)
+        # reads: mixed and concurrent
+        calls = []
+        for _ in range(options['reads']):
+            group_id, _, member_ids = rng.choice(groups)
+            token = tokens[rng.choice(member_ids)]
+            endpoint = rng.choice(READ_ENDPOINTS)
+            path = {
+                'expense_list': f'/expense/group/{group_id}/',
+                'settle_up': f'/expense/group/{group_id}/settle_up/?strategy='
+                             f'{rng.choice(["n_minus_1", "greedy", "min_transactions"])}',
+                'query_feed': '/user/expense/?query=all&limit=50',
+                'group_retrieve': f'/user/group/{group_id}/',
+            }[endpoint]
+            calls.append((endpoint, 'get', path, None, token))
+        self.run_phase(calls)
+
+    def handle(self, *args, **options):
+        if options['group_size'] < 2 or options['group_size'] > options['users']:
+            raise CommandError('--group-size must be between 2 and --users')
+        if min(options['groups'], options['concurrency']) < 1:
+            raise CommandError('--groups and --concurrency must be positive')
+        self.concurrency = options['concurrency']
+        self.stats = {}
+        old_password_hashers = settings.PASSWORD_HASHERS
+        if options['fast_password_hasher']:
+            settings.PASSWORD_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
+        setup_test_environment()
+        old_name, sqlite_file = self.setup_database()
+        try:
+            self.run_load_test(options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+            settings.PASSWORD_HASHERS = old_password_hashers
+            if sqlite_file and os.path.exists(sqlite_file):
+                os.remove(sqlite_file)
+        results = {endpoint: stats.report() for endpoint, stats in self.stats.items() if stats.latencies}
+        if options['format'] == 'json':
+            report = json.dumps({
+                'options': {key: options[key] for key in ('users', 'groups', 'group_size', 'expenses', 'reads',
+                                                          'concurrency', 'seed', 'fast_password_hasher')},
+                'database': connection.vendor,
+                'endpoints': results,
+            }, indent=2)
+        else:
+            columns = ['requests', 'errors', 'throughput_rps', 'p50_ms', 'p90_ms', 'p99_ms', 'max_ms',
+                       'queries_avg', 'queries_max']
+            lines = [f'{"endpoint":>16} ' + ' '.join(f'{column:>14}' for column in columns)]
+            for endpoint, result in results.items():
+                lines.append(f'{endpoint:>16} ' + ' '.join(f'{str(result[column]):>14}' for column in columns))
+            lines.append('')
+            lines.append(f'{"latency (ms)":>16} ' + ' '.join(f'{bucket:>8}' for bucket in
+                                                            next(iter(results.values()))['histogram']))
+            for endpoint, result in results.items():
+                lines.append(f'{endpoint:>16} ' + ' '.join(f'{num:>8}' for num in result['histogram'].values()))
+            report = '\n'.join(lines)
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                file.write(report + '\n')
+            self.stdout.write(self.style.SUCCESS(f'Report written to {options["output"]}'))
+        else:
+            self.stdout.write(report)
@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand, CommandError
+from ...jobs import JobQueue
+from ...ledgers import GroupBalanceLedger
+from ...models import Group
+
+
+class Command(BaseCommand):
+    help = 'Verifies the group balance ledger against the group expense history and rebuilds it if out of sync'
+
+    def add_arguments(self, parser):
+        parser.add_argument('group_ids', nargs='*', type=int,
+                            help='The groups to process; all the groups if not specified')
+        parser.add_argument('--verify', action='store_true',
+                            help='Only compares the ledger against the expense history, without writing')
+        parser.add_argument('--enqueue', action='store_true',
+                            help='Queues a rebuild job per group instead (see the run_job_worker command)')
+
+    def handle(self, *args, **options):
+        queryset = Group.objects.order_by('id')
+        if options['group_ids']:
+            queryset = queryset.filter(id__in=options['group_ids'])
+        if options['enqueue']:
+            if options['verify']:
+                raise CommandError('--verify and --enqueue are exclusive')
+            job_ids = [JobQueue.enqueue('rebuild_ledger', {'group_id': group_id}).id
+                       for group_id in queryset.values_list('id', flat=True)]
+            self.stdout.write(self.style.SUCCESS(f'Queued {len(job_ids)} rebuild job(s): {job_ids}'))
+            return
+        num_mismatched = 0
+        for group in queryset:
+            mismatches = GroupBalanceLedger.verify(group)
+            if mismatches:
+                num_mismatched += 1
+                for user_id, (ledger_balance, expected_balance) in mismatches.items():
+                    self.stdout.write(f'group(id={group.id}) user(id={user_id}): '
+                                      f'ledger={ledger_balance} expected={expected_balance}')
+                if not options['verify']:
+                    GroupBalanceLedger.rebuild(group)
+        if not num_mismatched:
+            self.stdout.write(self.style.SUCCESS('All the group ledgers are in sync'))
+        elif options['verify']:
+            raise CommandError(f'{num_mismatched} group ledger(s) out of sync')
+        else:
+            self.stdout.write(self.style.SUCCESS(f'Rebuilt the ledger of {num_mismatched} group(s)'))
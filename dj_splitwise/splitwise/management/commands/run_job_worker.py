@@ -0,0 +1,69 @@
+import multiprocessing
+import os
+import signal
+import socket
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+# NOTE: '...jobs' (hence the models) is imported in the functions: a spawned worker process imports this module
+# to find its target, before django.setup()
+
+
+def run_worker_process(worker_id: str, poll_interval: float, burst: bool) -> None:
+    """
+    The target of a worker process: a single threaded JobWorker
+    """
+    django.setup()
+    from ...jobs import JobWorker
+    JobWorker(worker_id, concurrency=1, poll_interval=poll_interval, burst=burst).run()
+
+
+class Command(BaseCommand):
+    help = ('Runs the background jobs queued in the database (see jobs.JobQueue) until stopped with SIGINT or '
+            'SIGTERM: the running jobs are finished first')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=settings.JOBS['CONCURRENCY'],
+                            help='Num of jobs run at a time')
+        parser.add_argument('--mode', choices=['thread', 'process'], default='thread',
+                            help='process: a process per job slot, for the CPU bound tasks (e.g. settle_up); '
+                                 'thread: a thread per job slot, for the I/O bound ones (e.g. import, export)')
+        parser.add_argument('--poll-interval', type=float, default=settings.JOBS['POLL_INTERVAL'],
+                            help='Seconds an idle worker waits before polling the queue again')
+        parser.add_argument('--burst', action='store_true',
+                            help='Exits once the queue is empty instead of waiting for new jobs')
+
+    def handle(self, *args, **options):
+        from ...jobs import JobWorker
+        if options['concurrency'] < 1:
+            raise CommandError('--concurrency must be positive')
+        worker_id = f'{socket.gethostname()}:{os.getpid()}'
+        self.stdout.write(f'Job worker {worker_id}: mode={options["mode"]} concurrency={options["concurrency"]}')
+        if options['mode'] == 'thread':
+            num_jobs = JobWorker(worker_id, options['concurrency'], options['poll_interval'], options['burst']).run()
+            self.stdout.write(self.style.SUCCESS(f'Job worker {worker_id}: stopped after {num_jobs} job(s)'))
+            return
+        connections.close_all()  # not shared with the worker processes
+        context = multiprocessing.get_context('spawn')
+        processes = [context.Process(target=run_worker_process, name=f'job-worker-{i}',
+                                     args=(f'{worker_id}-{i}', options['poll_interval'], options['burst']))
+                     for i in range(options['concurrency'])]
+        for process in processes:
+            process.start()
+
+        def stop(*args):
+            for process in processes:
+                if process.is_alive():
+                    process.terminate()  # SIGTERM: the process finishes its current job
+
+        signal.signal(signal.SIGINT, stop)
+        signal.signal(signal.SIGTERM, stop)
+        while any(process.is_alive() for process in processes):
+            for process in processes:
+                process.join(timeout=0.5)
+        failed = [process.name for process in processes if process.exitcode]
+        if failed:
+            raise CommandError(f'Worker process(es) exited with an error: {", ".join(failed)}')
+        self.stdout.write(self.style.SUCCESS(f'Job worker {worker_id}: stopped'))
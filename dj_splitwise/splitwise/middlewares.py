@@ -1,28 +1,227 @@
-from django.http import HttpRequest, HttpResponse
-import json
-import http
-
-
-class ExceptionMiddleware:
-    def __init__(self, forward_request):
-        """
-
-        :param forward_request: A callable that forwards the request to the next middleware (if any) or the view
-        """
-        self.get_response = forward_request
-
-    def __call__(self, request):
-        response = self.get_response(request)
-        return response
-
-    def process_exception(self, request: HttpRequest, exception: Exception) -> HttpResponse:
-        """Any unattended exception raised by the view will be caught here"""
-        return HttpResponse(
-            json.dumps({
-                'error': str(exception),
-                'meta': 'Caught by Middleware Hook'
-            }),
-            status=http.HTTPStatus.BAD_REQUEST,
-            content_type='application/json',
-            charset='utf-8'
-        )
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+from django.http import HttpRequest, HttpResponse
+from django.utils import timezone
+from django.utils.deprecation import MiddlewareMixin
+from time import perf_counter
+from .instrumentation import MetricsRegistry, RequestMetrics, SamplingProfiler
+from .permissions import is_staff_request
+import cProfile
+import io
+import json
+import http
+import logging
+import marshal
+import os
+import pstats
+import threading
+import uuid
+
+logger = logging.getLogger(__name__)
+
+
+class ExceptionMiddleware(MiddlewareMixin):
+    # NOTE: MiddlewareMixin serves both the sync and the async (ASGI) requests: see async_views.py
+    def __init__(self, forward_request):
+        """
+
+        :param forward_request: A callable that forwards the request to the next middleware (if any) or the view
+        """
+        super().__init__(forward_request)
+
+    def process_exception(self, request: HttpRequest, exception: Exception) -> HttpResponse:
+        """Any unattended exception raised by the view will be caught here"""
+        return HttpResponse(
+            json.dumps({
+                'error': str(exception),
+                'meta': 'Caught by Middleware Hook'
+            }),
+            status=http.HTTPStatus.BAD_REQUEST,
+            content_type='application/json',
+            charset='utf-8'
+        )
+
+
+class InstrumentationMiddleware:
+    """
+    Records the wall time, the num of DB queries and the DB time of every request, along with the timings
+    of its instrumented parts (serializer, strategy, ...: see instrumentation.Trace)
+    - exposes them to the client in the 'Server-Timing' header (settings.INSTRUMENTATION['SERVER_TIMING'])
+    - aggregates them per view in the in-process MetricsRegistry, scraped through 'metrics/'
+
+    NOTE: Should be the first middleware, in order to time the whole stack.
+    The queries run while streaming a response (StreamingHttpResponse) are not recorded.
+    Serves both the sync and the async (ASGI) requests, without switching the mode of the stack.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, forward_request):
+        self.get_response = forward_request
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    @staticmethod
+    def get_view_name(request: HttpRequest) -> str:
+        """
+        :return: The name of the view the request was routed to, e.g. 'GroupSettleUpViewSet.settle_up'
+        """
+        match = request.resolver_match
+        if match is None:
+            return 'unmatched'
+        view_class = getattr(match.func, 'cls', None) or getattr(match.func, 'view_class', None)
+        if view_class is None:
+            return match.view_name or match._func_path
+        action = (getattr(match.func, 'actions', None) or {}).get(request.method.lower())
+        return f'{view_class.__name__}.{action}' if action else view_class.__name__
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        metrics = RequestMetrics()
+        token = RequestMetrics.current.set(metrics)
+        start = perf_counter()
+        try:
+            with connection.execute_wrapper(metrics.wrap_query):
+                response = self.get_response(request)
+        finally:
+            RequestMetrics.current.reset(token)
+        return self.record(request, response, metrics, start)
+
+    async def __acall__(self, request):
+        metrics = RequestMetrics()
+        token = RequestMetrics.current.set(metrics)
+        start = perf_counter()
+        # the connections are thread local and the async ORM runs its queries in the sync thread
+        # (sync_to_async, thread_sensitive): the wrapper is installed on the connection of that thread
+        query_wrapper = await sync_to_async(self.install_query_wrapper, thread_sensitive=True)(metrics)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(query_wrapper.__exit__, thread_sensitive=True)(None, None, None)
+            RequestMetrics.current.reset(token)
+        return self.record(request, response, metrics, start)
+
+    @staticmethod
+    def install_query_wrapper(metrics: RequestMetrics):
+        """
+        :return: The entered execute_wrapper() of the connection of the calling thread: to be exited in that thread
+        """
+        query_wrapper = connection.execute_wrapper(metrics.wrap_query)
+        query_wrapper.__enter__()
+        return query_wrapper
+
+    def record(self, request: HttpRequest, response: HttpResponse, metrics: RequestMetrics,
+               start: float) -> HttpResponse:
+        metrics.total = perf_counter() - start
+        if settings.INSTRUMENTATION['SERVER_TIMING']:
+            response['Server-Timing'] = metrics.to_server_timing()
+        if settings.INSTRUMENTATION['METRICS']:
+            MetricsRegistry.observe(self.get_view_name(request), request.method, response.status_code, metrics)
+        return response
+
+
+class ProfilingMiddleware(MiddlewareMixin):
+    """
+    Profiles a single request on demand: the view of a request carrying the 'X-Profile' header or the '_profile'
+    query param (see settings.PROFILING) is run under a profiler, provided the user is an admin (is_staff).
+    The value selects the profiler & the output format:
+    - pstats: cProfile, the binary stats dump (load with pstats.Stats / snakeviz)
+    - text: cProfile, the stats sorted by cumulative time
+    - collapsed: SamplingProfiler, the collapsed stacks of a flame graph
+    The profile is written to PROFILING['OUTPUT_DIR'] (named in the 'X-Profile-File' header of the actual response)
+    or, if it is not set, returned inline instead of the response.
+
+    The profiler is started in process_view and stopped in process_response: the view is called by the handler
+    as usual, hence an exception of the view is handled by the process_exception hooks (see ExceptionMiddleware)
+    exactly as when not profiled. The profile covers the view, the handling of its exception and the rendering of
+    its response.
+
+    NOTE: Should be the last middleware: the process_view hooks of the middlewares that follow would be profiled
+    too. Costs a header & query param lookup when not triggered, nothing at all when disabled (MiddlewareNotUsed).
+    The async views (async_views.py) are not profiled.
+    """
+    FORMATS = {
+        'pstats': ('pstats', 'application/octet-stream'),
+        'text': ('txt', 'text/plain; charset=utf-8'),
+        'collapsed': ('collapsed', 'text/plain; charset=utf-8'),
+    }
+    lock = threading.Lock()  # one profiled request at a time: the profilers of concurrent requests would clash
+    REQUEST_ATTR = '_profiling'  # (output format, profiler) of the profiled request
+
+    def __init__(self, forward_request):
+        if not settings.PROFILING['ENABLED']:
+            raise MiddlewareNotUsed
+        super().__init__(forward_request)
+        self.header = 'HTTP_' + settings.PROFILING['HEADER'].upper().replace('-', '_')  # the key in request.META
+
+    @staticmethod
+    def start(output_format: str):
+        """
+        :return: The profiler, started
+        """
+        if output_format == 'collapsed':
+            return SamplingProfiler(settings.PROFILING['SAMPLING_INTERVAL']).__enter__()
+        profiler = cProfile.Profile()
+        profiler.enable()
+        return profiler
+
+    @staticmethod
+    def stop(output_format: str, profiler) -> bytes:
+        """
+        :return: The profile, in the given output format
+        """
+        if output_format == 'collapsed':
+            profiler.__exit__(None, None, None)
+            return profiler.to_collapsed().encode()
+        profiler.disable()
+        profiler.create_stats()
+        if output_format == 'pstats':
+            return marshal.dumps(profiler.stats)
+        stream = io.StringIO()
+        pstats.Stats(profiler, stream=stream).sort_stats(pstats.SortKey.CUMULATIVE).print_stats(
+            settings.PROFILING['TEXT_LIMIT'])
+        return stream.getvalue().encode()
+
+    def process_view(self, request: HttpRequest, view_func, view_args, view_kwargs):
+        output_format = request.META.get(self.header) or request.GET.get(settings.PROFILING['QUERY_PARAM'])
+        if output_format is None or iscoroutinefunction(view_func) or not is_staff_request(request):
+            return None  # a non-admin is silently served unprofiled
+        if output_format not in self.FORMATS:
+            return HttpResponse(json.dumps({'error': f'Invalid profile format: {output_format}! '
+                                                     f'Choose from {", ".join(self.FORMATS)}'}),
+                                status=http.HTTPStatus.BAD_REQUEST, content_type='application/json')
+        if not self.lock.acquire(blocking=False):
+            logger.warning('profiling skipped: another request is being profiled path=%s', request.path)
+            return None
+        try:
+            setattr(request, self.REQUEST_ATTR, (output_format, self.start(output_format)))
+        except BaseException:
+            self.lock.release()
+            raise
+        return None  # the view is called by the handler, as when not profiled
+
+    def process_response(self, request: HttpRequest, response: HttpResponse) -> HttpResponse:
+        profiling = getattr(request, self.REQUEST_ATTR, None)
+        if profiling is None:
+            return response
+        delattr(request, self.REQUEST_ATTR)
+        output_format, profiler = profiling
+        try:
+            profile = self.stop(output_format, profiler)
+        finally:
+            self.lock.release()
+        extension, content_type = self.FORMATS[output_format]
+        output_dir = settings.PROFILING['OUTPUT_DIR']
+        if output_dir is None:
+            return HttpResponse(profile, content_type=content_type)
+        os.makedirs(output_dir, exist_ok=True)
+        file_name = (f'{timezone.now():%Y%m%dT%H%M%S}-{request.method}-{request.path.strip("/").replace("/", "_")}-'
+                     f'{uuid.uuid4().hex[:8]}.{extension}')
+        with open(os.path.join(output_dir, file_name), 'wb') as file:
+            file.write(profile)
+        logger.info('profile written: %s', file_name)
+        response['X-Profile-File'] = file_name
+        return response
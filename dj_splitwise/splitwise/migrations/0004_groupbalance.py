@@ -0,0 +1,47 @@
+# Generated by Django 5.1.1 on 2026-10-18 03:34
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_group_balances(apps, schema_editor):
+    """Builds the ledger of the existing groups from their expense history"""
+    ExpensePaidBy = apps.get_model('splitwise', 'ExpensePaidBy')
+    ExpenseSharedBy = apps.get_model('splitwise', 'ExpenseSharedBy')
+    GroupBalance = apps.get_model('splitwise', 'GroupBalance')
+    balances = {}
+    for group_id, user_id, amount in (ExpensePaidBy.objects
+                                      .values_list('group_expense__group_id', 'user_id', 'amount')):
+        balances[(group_id, user_id)] = balances.get((group_id, user_id), 0) + amount
+    for group_id, user_id, amount in (ExpenseSharedBy.objects
+                                      .values_list('group_expense__group_id', 'user_id', 'amount')):
+        balances[(group_id, user_id)] = balances.get((group_id, user_id), 0) - amount
+    GroupBalance.objects.bulk_create([GroupBalance(group_id=group_id, user_id=user_id, balance=balance)
+                                      for (group_id, user_id), balance in balances.items()
+                                      if group_id is not None and balance != 0])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('splitwise', '0003_alter_groupexpense_paid_by_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GroupBalance',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('balance', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('group', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='balances', to='splitwise.group')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.DO_NOTHING, related_name='group_balances', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('group', 'user')},
+            },
+        ),
+        migrations.RunPython(backfill_group_balances, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.1 on 2026-10-18 04:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('splitwise', '0004_groupbalance'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='group',
+            name='ledger_version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.1.1 on 2026-10-18 04:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('splitwise', '0006_job'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='expensepaidby',
+            index=models.Index(fields=['user', 'id', 'amount'], name='paidby_user_covering_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='expensesharedby',
+            index=models.Index(fields=['user', 'id', 'amount'], name='sharedby_user_covering_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='groupbalance',
+            index=models.Index(fields=['group', 'user', 'balance'], name='groupbal_group_covering_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='groupexpense',
+            index=models.Index(fields=['group', 'expense_ptr'], name='groupexp_group_ptr_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userexpense',
+            index=models.Index(fields=['paid_by', 'paid_to', 'expense_ptr'], name='userexp_paid_by_covering_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userexpense',
+            index=models.Index(fields=['paid_to', 'paid_by', 'expense_ptr'], name='userexp_paid_to_covering_idx'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.1.1 on 2026-10-18 04:37
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('splitwise', '0007_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='expensepaidby',
+            name='expense',
+            field=models.ForeignKey(db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='splitwise.groupexpense'),
+        ),
+        migrations.AddField(
+            model_name='expensepaidby',
+            name='group',
+            field=models.ForeignKey(db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='splitwise.group'),
+        ),
+        migrations.AddField(
+            model_name='expensesharedby',
+            name='expense',
+            field=models.ForeignKey(db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='splitwise.groupexpense'),
+        ),
+        migrations.AddField(
+            model_name='expensesharedby',
+            name='group',
+            field=models.ForeignKey(db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='splitwise.group'),
+        ),
+    ]
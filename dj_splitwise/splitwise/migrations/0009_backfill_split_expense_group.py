@@ -0,0 +1,43 @@
+# Generated by Django 5.1.1 on 2026-10-18 04:37
+
+from django.db import migrations, transaction
+from django.db.models import Max, Min, OuterRef, Subquery
+
+CHUNK_SIZE = 2_000  # splits updated per transaction
+
+
+def backfill_split_expense_group(apps, schema_editor):
+    """
+    Copies the expense (and its group) of every split from the M2M through tables to the split rows.
+    One UPDATE per range of CHUNK_SIZE split ids, each in its own transaction: the locks are held on a chunk of rows
+    for a short while, never on the whole table, and an interrupted run resumes where it stopped (NULL rows only)
+    """
+    db_alias = schema_editor.connection.alias
+    GroupExpense = apps.get_model('splitwise', 'GroupExpense')
+    for field_name in ('paid_by', 'shared_by'):
+        m2m_field = GroupExpense._meta.get_field(field_name)
+        Split, through = m2m_field.related_model, m2m_field.remote_field.through
+        links = through.objects.using(db_alias).filter(**{m2m_field.m2m_reverse_field_name(): OuterRef('pk')})
+        expense_name = m2m_field.m2m_field_name()
+        bounds = Split.objects.using(db_alias).aggregate(first_id=Min('id'), last_id=Max('id'))
+        if bounds['first_id'] is None:
+            continue
+        for start in range(bounds['first_id'], bounds['last_id'] + 1, CHUNK_SIZE):
+            with transaction.atomic(using=db_alias):
+                (Split.objects.using(db_alias)
+                 .filter(id__gte=start, id__lt=start + CHUNK_SIZE, expense__isnull=True)
+                 .update(expense_id=Subquery(links.values(f'{expense_name}_id')[:1]),
+                         group_id=Subquery(links.values(f'{expense_name}__group_id')[:1])))
+
+
+class Migration(migrations.Migration):
+    # every chunk is committed on its own: no transaction spanning the whole backfill
+    atomic = False
+
+    dependencies = [
+        ('splitwise', '0008_split_expense_group'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_split_expense_group, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.1.1 on 2026-10-18 04:37
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('splitwise', '0009_backfill_split_expense_group'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='expensepaidby',
+            name='expense',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='splitwise.groupexpense'),
+        ),
+        migrations.AlterField(
+            model_name='expensesharedby',
+            name='expense',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='splitwise.groupexpense'),
+        ),
+        migrations.RemoveIndex(
+            model_name='expensepaidby',
+            name='paidby_user_covering_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='expensesharedby',
+            name='sharedby_user_covering_idx',
+        ),
+        migrations.AddIndex(
+            model_name='expensepaidby',
+            index=models.Index(fields=['user', 'id', 'amount', 'expense'], name='paidby_user_covering_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='expensepaidby',
+            index=models.Index(fields=['group', 'user', 'amount'], name='paidby_group_covering_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='expensesharedby',
+            index=models.Index(fields=['user', 'id', 'amount', 'expense'], name='sharedby_user_covering_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='expensesharedby',
+            index=models.Index(fields=['group', 'user', 'amount'], name='sharedby_group_covering_idx'),
+        ),
+    ]
@@ -1,66 +1,156 @@
-from django.db import models
-from django.contrib.auth.models import AbstractUser
-
-
-class BaseModel(models.Model):
-    created_at = models.DateTimeField(auto_now_add=True)
-    updated_at = models.DateTimeField(auto_now=True)
-
-    class Meta:
-        abstract = True
-
-
-class User(AbstractUser):
-    # expense_groups: m : m relation
-    # paid: 1 : m relation
-    # owe: 1 : m relation
-    pass
-
-
-class Expense(BaseModel):
-    amount = models.DecimalField(max_digits=7, decimal_places=2)
-    title = models.CharField(max_length=32)
-    description = models.CharField(max_length=128)
-    created_by = models.ForeignKey(User, on_delete=models.DO_NOTHING,
-                                   related_name='created_expenses')
-
-
-class UserExpense(Expense):
-    paid_by = models.ForeignKey(User, on_delete=models.DO_NOTHING, related_name='paid')
-    paid_to = models.ForeignKey(User, on_delete=models.DO_NOTHING, related_name='owe')
-
-
-class Group(BaseModel):
-    name = models.CharField(max_length=32)
-    members = models.ManyToManyField(User, related_name='expense_groups')
-    # expenses: 1 : m relation
-    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, related_name='created_groups', null=True)
-
-
-class ExpensePaidBy(BaseModel):
-    amount = models.DecimalField(max_digits=7, decimal_places=2)
-    user = models.ForeignKey(User, on_delete=models.DO_NOTHING)
-
-
-class ExpenseSharedBy(BaseModel):
-    amount = models.DecimalField(max_digits=7, decimal_places=2)
-    user = models.ForeignKey(User, on_delete=models.DO_NOTHING)
-
-
-"""
-Difference between ManyToManyField and ManyToManyRel:
-- Use ManyToManyField to specify the relation
-  -- ManyToManyRel is used internally by Django to implement the ManyToManyField relation
-
-- Ref: Stackoverflow
-  -- https://stackoverflow.com/questions/67158034/difference-between-djangos-manytomanyfield-and-manytomanyrel
-- Ref: Doc
-  -- https://docs.djangoproject.com/en/5.1/topics/db/examples/many_to_many/
-
-"""
-
-
-class GroupExpense(Expense):
-    group = models.ForeignKey(Group, on_delete=models.CASCADE, related_name='expenses')
-    paid_by = models.ManyToManyField(ExpensePaidBy, related_name='group_expense')
-    shared_by = models.ManyToManyField(ExpenseSharedBy, related_name='group_expense')
+from django.db import models
+from django.contrib.auth.models import AbstractUser
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+from rest_framework.utils.encoders import JSONEncoder
+from .enums import JobStatus
+
+
+class BaseModel(models.Model):
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        abstract = True
+
+
+class User(AbstractUser):
+    # expense_groups: m : m relation
+    # paid: 1 : m relation
+    # owe: 1 : m relation
+    pass
+
+
+class Expense(BaseModel):
+    amount = models.DecimalField(max_digits=7, decimal_places=2)
+    title = models.CharField(max_length=32)
+    description = models.CharField(max_length=128)
+    created_by = models.ForeignKey(User, on_delete=models.DO_NOTHING,
+                                   related_name='created_expenses')
+
+
+class UserExpense(Expense):
+    paid_by = models.ForeignKey(User, on_delete=models.DO_NOTHING, related_name='paid')
+    paid_to = models.ForeignKey(User, on_delete=models.DO_NOTHING, related_name='owe')
+
+    class Meta:
+        indexes = [
+            # the expenses of a user (paid_by = user OR paid_to = user): each side of the OR is read from an index
+            # covering the whole row of this table, the joined parent (Expense) is then looked up by its pk
+            models.Index(fields=['paid_by', 'paid_to', 'expense_ptr'], name='userexp_paid_by_covering_idx'),
+            models.Index(fields=['paid_to', 'paid_by', 'expense_ptr'], name='userexp_paid_to_covering_idx'),
+        ]
+
+
+class Group(BaseModel):
+    name = models.CharField(max_length=32)
+    members = models.ManyToManyField(User, related_name='expense_groups')
+    # expenses: 1 : m relation
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, related_name='created_groups', null=True)
+    # bumped on every change of the expenses or the members of the group: keys its cached settlements
+    ledger_version = models.PositiveIntegerField(default=0)
+
+
+class ExpensePaidBy(BaseModel):
+    amount = models.DecimalField(max_digits=7, decimal_places=2)
+    user = models.ForeignKey(User, on_delete=models.DO_NOTHING)
+    # denormalized from the GroupExpense.paid_by link: the splits of a group or of an expense are read from this
+    # table alone, without joining the M2M through table. NULL only for a split linked to no expense
+    expense = models.ForeignKey('GroupExpense', on_delete=models.CASCADE, related_name='+', null=True)
+    group = models.ForeignKey(Group, on_delete=models.CASCADE, related_name='+', null=True, db_index=False)
+
+    class Meta:
+        indexes = [
+            # the splits of a user (the expense feed): id, amount & expense are read from the index, not from the table
+            models.Index(fields=['user', 'id', 'amount', 'expense'], name='paidby_user_covering_idx'),
+            # the splits of a group (the balance sheet, the expense list)
+            models.Index(fields=['group', 'user', 'amount'], name='paidby_group_covering_idx'),
+        ]
+
+
+class ExpenseSharedBy(BaseModel):
+    amount = models.DecimalField(max_digits=7, decimal_places=2)
+    user = models.ForeignKey(User, on_delete=models.DO_NOTHING)
+    # denormalized from the GroupExpense.shared_by link (see ExpensePaidBy)
+    expense = models.ForeignKey('GroupExpense', on_delete=models.CASCADE, related_name='+', null=True)
+    group = models.ForeignKey(Group, on_delete=models.CASCADE, related_name='+', null=True, db_index=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'id', 'amount', 'expense'], name='sharedby_user_covering_idx'),
+            models.Index(fields=['group', 'user', 'amount'], name='sharedby_group_covering_idx'),
+        ]
+
+
+"""
+Difference between ManyToManyField and ManyToManyRel:
+- Use ManyToManyField to specify the relation
+  -- ManyToManyRel is used internally by Django to implement the ManyToManyField relation
+
+- Ref: Stackoverflow
+  -- https://stackoverflow.com/questions/67158034/difference-between-djangos-manytomanyfield-and-manytomanyrel
+- Ref: Doc
+  -- https://docs.djangoproject.com/en/5.1/topics/db/examples/many_to_many/
+
+"""
+
+
+class GroupExpense(Expense):
+    group = models.ForeignKey(Group, on_delete=models.CASCADE, related_name='expenses')
+    paid_by = models.ManyToManyField(ExpensePaidBy, related_name='group_expense')
+    shared_by = models.ManyToManyField(ExpenseSharedBy, related_name='group_expense')
+
+    class Meta:
+        indexes = [
+            # the expense list of a group, in the pk order: read in the index order, without a sort
+            models.Index(fields=['group', 'expense_ptr'], name='groupexp_group_ptr_idx'),
+        ]
+
+
+class GroupBalance(BaseModel):
+    """
+    Materialized ledger of the net balance of every user participating in the group expenses.
+    - +ve balance: the user should receive the amount
+    - -ve balance: the user owes the amount
+
+    Maintained incrementally by '.ledgers.GroupBalanceLedger' whenever a group expense is created or deleted
+    """
+    group = models.ForeignKey(Group, on_delete=models.CASCADE, related_name='balances')
+    user = models.ForeignKey(User, on_delete=models.DO_NOTHING, related_name='group_balances')
+    balance = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    class Meta:
+        unique_together = ['group', 'user']
+        indexes = [
+            # the balance sheet of a group (see GroupBalanceLedger.get_balance_sheet): read from the index alone,
+            # ordered by user
+            models.Index(fields=['group', 'user', 'balance'], name='groupbal_group_covering_idx'),
+        ]
+
+
+class Job(BaseModel):
+    """
+    A unit of background work, queued in the database: see '.jobs.JobQueue' and the 'run_job_worker' command.
+    - name: the task to run (see JobQueue.tasks), with the JSON payload as its input
+    - run_after: the job is not claimed before (e.g. the backoff before a retry)
+    - locked_by / locked_at: the claim of the worker running the job
+    """
+    name = models.CharField(max_length=64)
+    payload = models.JSONField(default=dict, encoder=DjangoJSONEncoder)
+    status = models.CharField(max_length=16, choices=[(job_status.value, job_status.name) for job_status in JobStatus],
+                              default=JobStatus.QUEUED.value)
+    result = models.JSONField(null=True, encoder=JSONEncoder)  # encoded as the API renders (e.g. the Decimals)
+    error = models.TextField(blank=True, default='')
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=1)
+    run_after = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=64, blank=True, default='')
+    locked_at = models.DateTimeField(null=True)
+    finished_at = models.DateTimeField(null=True)
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, related_name='jobs', null=True)
+
+    class Meta:
+        indexes = [
+            # the claim query of the workers: the due jobs of a status, oldest first
+            models.Index(fields=['status', 'run_after'], name='job_status_run_after_idx'),
+        ]
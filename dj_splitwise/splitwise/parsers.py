@@ -0,0 +1,33 @@
+import json
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+
+
+class NDJSONParser(BaseParser):
+    """
+    Newline delimited JSON: one JSON document per line, blank lines are ignored.
+    The stream is parsed line by line, hence a large import is never held twice in memory as text.
+
+    Ref: https://github.com/ndjson/ndjson-spec
+    """
+    media_type = 'application/x-ndjson'
+
+    # Overridden
+    def parse(self, stream, media_type=None, parser_context=None) -> list:
+        """
+        Raises ParseError on the first malformed line
+
+        :return: A list of the parsed documents
+        """
+        encoding = (parser_context or {}).get('encoding', settings.DEFAULT_CHARSET)
+        documents = []
+        for line_num, line in enumerate(stream, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                documents.append(json.loads(line.decode(encoding)))
+            except (ValueError, UnicodeDecodeError) as e:
+                raise ParseError(f'NDJSON parse error at line {line_num} - {e}')
+        return documents
@@ -0,0 +1,313 @@
+import heapq
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import datetime
+from decimal import Decimal
+from operator import itemgetter
+from typing import Iterable, Iterator, List, Optional, Tuple
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection
+from django.db.models import Case, F, Q, QuerySet, Value, When
+from django.db.models.functions import Round
+from rest_framework.exceptions import ValidationError
+from .enums import Query
+from .models import User, UserExpense, Group, ExpensePaidBy, ExpenseSharedBy
+from .utils import BalanceSheet
+
+# decimal places of the split amounts; the sums are computed in minor units
+DECIMAL_PLACES = ExpensePaidBy._meta.get_field('amount').decimal_places
+
+
+class BalanceQuery:
+    """
+    Net balance aggregation pushed into the database.
+    The paid (+ve) and shared (-ve) splits are combined with a UNION ALL and summed per user
+    by a single GROUP BY statement, hence only one row per user is transferred.
+
+    Every split is rounded to minor units before summing, so that the sum is exact on every backend
+    (SQLite returns the SUM of a decimal column as a float).
+    """
+
+    @classmethod
+    def signed_splits(cls, **filters) -> QuerySet:
+        """
+        :param filters: Lookups applicable to both ExpensePaidBy and ExpenseSharedBy
+        :return: A UNION ALL queryset of (participant_id, minor_units); -ve minor_units indicates owed amount
+        """
+        scale = 10 ** DECIMAL_PLACES
+        paid = (ExpensePaidBy.objects.filter(**filters)
+                .annotate(participant_id=F('user_id'), minor_units=Round(F('amount') * scale))
+                .values_list('participant_id', 'minor_units'))
+        shared = (ExpenseSharedBy.objects.filter(**filters)
+                  .annotate(participant_id=F('user_id'), minor_units=-Round(F('amount') * scale))
+                  .values_list('participant_id', 'minor_units'))
+        return paid.union(shared, all=True)
+
+    @classmethod
+    def sum_by_user(cls, **filters) -> List[Tuple[int, int]]:
+        """
+        :param filters: Lookups applicable to both ExpensePaidBy and ExpenseSharedBy
+        :return: A list of (user_id, net balance in minor units) ordered by user_id; zero balances are dropped
+        """
+        sql, params = cls.signed_splits(**filters).query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT participant_id, SUM(minor_units) FROM ({sql}) AS splits '
+                           f'GROUP BY participant_id HAVING SUM(minor_units) <> 0 ORDER BY participant_id', params)
+            return [(user_id, int(minor_units)) for user_id, minor_units in cursor.fetchall()]
+
+    @classmethod
+    def group_balance_sheet(cls, group_id: int) -> BalanceSheet:
+        """
+        :param group_id: The target group
+        :return: The balance sheet of the users participating in the group expenses
+        """
+        user_balances = cls.sum_by_user(group_id=group_id)
+        return BalanceSheet([user_id for user_id, _ in user_balances],
+                            [balance for _, balance in user_balances], DECIMAL_PLACES)
+
+    @classmethod
+    def user_balance(cls, user_id: int) -> Decimal:
+        """
+        :param user_id: The target user
+        :return: The net balance of the user across all the group expenses; -ve balance indicates owed amount
+        """
+        user_balances = cls.sum_by_user(user_id=user_id)
+        minor_units = user_balances[0][1] if user_balances else 0
+        return Decimal(minor_units).scaleb(-DECIMAL_PLACES)
+
+
+class ExpenseFeedQuery:
+    """
+    The expense history of a user as a single UNION ALL of the user expenses and the group expense splits,
+    ordered latest first by the keyset (created_at, expense_id, entry_kind, entry_id).
+    A page is fetched by filtering on the keyset of the last row of the previous page (cursor)
+    instead of an offset, hence every page costs the same however long the history is.
+    """
+    USER_EXPENSE, PAID, SHARED = 0, 1, 2  # entry_kind
+    FIELDS = ['expense_id', 'expense_amount', 'expense_title', 'expense_description',
+              'expense_created_at', 'expense_created_by', 'entry_kind', 'entry_id']
+    KEYSET = ['expense_created_at', 'expense_id', 'entry_kind', 'entry_id']
+
+    @classmethod
+    def keyset_before(cls, cursor: tuple) -> Q:
+        """
+        :param cursor: The keyset values of the last row already seen
+        :return: A filter selecting the rows coming after the cursor in the (descending) feed order
+        """
+        condition = Q()
+        for i in reversed(range(len(cls.KEYSET))):
+            equal_prefix = Q(**{field: value for field, value in zip(cls.KEYSET[:i], cursor[:i])})
+            condition = (equal_prefix & Q(**{f'{cls.KEYSET[i]}__lt': cursor[i]})) | condition
+        return condition
+
+    @classmethod
+    def encode_cursor(cls, row: dict) -> str:
+        """
+        :param row: The last row of a page
+        :return: An opaque cursor pointing right after the row
+        """
+        keyset = [row[field] for field in cls.KEYSET]
+        keyset[0] = keyset[0].isoformat()
+        return urlsafe_b64encode(json.dumps(keyset).encode()).decode()
+
+    @classmethod
+    def decode_cursor(cls, cursor: str) -> tuple:
+        """
+        Raises ValidationError if the cursor is malformed
+
+        :param cursor: A cursor given by 'encode_cursor()'
+        :return: The keyset values
+        """
+        try:
+            created_at, *ids = json.loads(urlsafe_b64decode(cursor.encode()))
+            if len(ids) != len(cls.KEYSET) - 1 or not all(isinstance(_id, int) for _id in ids):
+                raise ValueError(cursor)
+            return datetime.fromisoformat(created_at), *ids
+        except (ValueError, TypeError):
+            raise ValidationError('Invalid cursor!')
+
+    @classmethod
+    def user_expenses(cls, user: User) -> QuerySet:
+        return (UserExpense.objects.filter(Q(paid_by=user) | Q(paid_to=user))
+                .annotate(expense_id=F('id'),
+                          # -ve amount indicates owed amount
+                          expense_amount=Case(When(paid_to_id=user.id, then=-F('amount')), default=F('amount')),
+                          expense_title=F('title'),
+                          expense_description=F('description'),
+                          expense_created_at=F('created_at'),
+                          expense_created_by=F('created_by__username'),
+                          entry_kind=Value(cls.USER_EXPENSE),
+                          entry_id=F('id')))
+
+    @classmethod
+    def group_expense_splits(cls, model, user: User, entry_kind: int) -> QuerySet:
+        """
+        :param model: ExpensePaidBy or ExpenseSharedBy
+        :param user: The target user
+        :param entry_kind: PAID or SHARED
+        """
+        amount = F('amount') if entry_kind == cls.PAID else -F('amount')  # -ve amount indicates owed amount
+        # NOTE: 'expense_id' is the column of the 'expense' FK: selected as it is, not annotated
+        return (model.objects.filter(user=user, expense__isnull=False)
+                .annotate(expense_amount=amount,
+                          expense_title=F('expense__title'),
+                          expense_description=F('expense__description'),
+                          expense_created_at=F('expense__created_at'),
+                          expense_created_by=F('expense__created_by__username'),
+                          entry_kind=Value(entry_kind),
+                          entry_id=F('id')))
+
+    @classmethod
+    def get_querysets(cls, user: User, query: Query) -> List[QuerySet]:
+        """
+        :return: The querysets making up the feed of the given type
+        """
+        querysets = []
+        if query in (Query.ALL, Query.USER_EXPENSE):
+            querysets.append(cls.user_expenses(user))
+        if query in (Query.ALL, Query.GROUP_EXPENSE):
+            querysets.append(cls.group_expense_splits(ExpensePaidBy, user, cls.PAID))
+            querysets.append(cls.group_expense_splits(ExpenseSharedBy, user, cls.SHARED))
+        return querysets
+
+    @classmethod
+    def get_page(cls, user: User, query: Query, cursor: tuple = None, limit: int = 50) -> List[dict]:
+        """
+        :param user: The user requesting the feed
+        :param query: The type of the expenses to include
+        :param cursor: The keyset values of the last row of the previous page; None for the first page
+        :param limit: Max num of rows in the page
+        :return: A list of dicts with the keys in FIELDS, latest first
+        """
+        return list(cls.get_page_queryset(user, query, cursor=cursor, limit=limit))
+
+    @classmethod
+    def get_page_queryset(cls, user: User, query: Query, cursor: tuple = None, limit: int = 50) -> QuerySet:
+        """
+        :return: The unevaluated page (see 'get_page()'), e.g. to be read with 'async for'
+        """
+        querysets = cls.get_querysets(user, query)
+        if cursor is not None:
+            querysets = [queryset.filter(cls.keyset_before(cursor)) for queryset in querysets]
+        querysets = [queryset.values(*cls.FIELDS) for queryset in querysets]
+        feed = querysets[0].union(*querysets[1:], all=True) if len(querysets) > 1 else querysets[0]
+        return feed.order_by(*[f'-{field}' for field in cls.KEYSET])[:limit]
+
+    @classmethod
+    def iterate(cls, user: User, query: Query, chunk_size: int = 2_000) -> Iterator[dict]:
+        """
+        The whole history, oldest first, for an export. Every queryset is read through its own server-side cursor,
+        'chunk_size' rows at a time, and the time-ordered streams are merged lazily (heapq.merge):
+        the memory stays constant however long the history is.
+
+        :param user: The user requesting the history
+        :param query: The type of the expenses to include
+        :param chunk_size: Num of rows fetched from the database at a time, per queryset
+        :return: An iterator of dicts with the keys in FIELDS, ordered by KEYSET
+        """
+        streams = [queryset.values(*cls.FIELDS).order_by(*cls.KEYSET).iterator(chunk_size=chunk_size)
+                   for queryset in cls.get_querysets(user, query)]
+        return heapq.merge(*streams, key=itemgetter(*cls.KEYSET))
+
+
+class GroupMemberQuery:
+    """
+    The member ids of a group as a set: the admin (created_by) is treated as a member.
+    The set is fetched from the M2M through table with a single query and cached on the group obj,
+    hence checking any num of users against the same group obj costs at most one query.
+
+    Optionally (settings.GROUP_MEMBERS_CACHE), the set is also kept in the Django cache across requests, keyed by
+    the ledger version of the group: bumped on every membership change, hence a set read before a change can only be
+    stored under a version no longer looked up (no delete racing with a concurrent reader's set).
+    NOTE: the version must be read before the members
+    """
+    CACHE_ATTR = '_member_ids'
+
+    @staticmethod
+    def get_shared_cache():
+        """
+        :return: The Django cache shared across requests, or None if disabled
+        """
+        if not settings.GROUP_MEMBERS_CACHE['ENABLED']:
+            return None
+        return caches[settings.GROUP_MEMBERS_CACHE['CACHE_ALIAS']]
+
+    @staticmethod
+    def get_cache_key(group_id: int, ledger_version: int) -> str:
+        return f'splitwise:group_members:{group_id}:{ledger_version}'
+
+    @classmethod
+    def get_cached_member_ids(cls, group_id: int, ledger_version: int) -> Optional[frozenset]:
+        """
+        :param group_id: The target group
+        :param ledger_version: The current ledger version of the group
+        :return: The member ids from the shared cache, or None if disabled or not cached
+        """
+        shared_cache = cls.get_shared_cache()
+        if shared_cache is None:
+            return None
+        return shared_cache.get(cls.get_cache_key(group_id, ledger_version))
+
+    @classmethod
+    def get_member_ids(cls, group: Group) -> frozenset:
+        """
+        :param group: The target group
+        :return: The ids of the group members, including the group admin
+        """
+        member_ids = getattr(group, cls.CACHE_ATTR, None)
+        if member_ids is None:
+            member_ids = cls.get_cached_member_ids(group.id, group.ledger_version)
+        if member_ids is None:
+            member_ids = set(Group.members.through.objects.filter(group_id=group.id).values_list('user_id', flat=True))
+            if group.created_by_id is not None:
+                member_ids.add(group.created_by_id)
+            member_ids = frozenset(member_ids)
+            shared_cache = cls.get_shared_cache()
+            if shared_cache is not None:
+                shared_cache.set(cls.get_cache_key(group.id, group.ledger_version), member_ids,
+                                 settings.GROUP_MEMBERS_CACHE['TIMEOUT'])
+        setattr(group, cls.CACHE_ATTR, member_ids)
+        return member_ids
+
+    @classmethod
+    async def aget_member_ids(cls, group: Group) -> frozenset:
+        """
+        The async twin of 'get_member_ids()', for the async views
+        """
+        member_ids = getattr(group, cls.CACHE_ATTR, None)
+        shared_cache = cls.get_shared_cache()
+        if member_ids is None and shared_cache is not None:
+            member_ids = await shared_cache.aget(cls.get_cache_key(group.id, group.ledger_version))
+        if member_ids is None:
+            member_ids = {user_id async for user_id in (Group.members.through.objects.filter(group_id=group.id)
+                                                        .values_list('user_id', flat=True))}
+            if group.created_by_id is not None:
+                member_ids.add(group.created_by_id)
+            member_ids = frozenset(member_ids)
+            if shared_cache is not None:
+                await shared_cache.aset(cls.get_cache_key(group.id, group.ledger_version), member_ids,
+                                        settings.GROUP_MEMBERS_CACHE['TIMEOUT'])
+        setattr(group, cls.CACHE_ATTR, member_ids)
+        return member_ids
+
+    @classmethod
+    def invalidate(cls, group: Group) -> None:
+        """
+        Drops the member ids cached on the group obj; must be called after changing its members.
+        NOTE: the shared cache needs no delete: the change bumps the ledger version keying it
+        """
+        group.__dict__.pop(cls.CACHE_ATTR, None)
+
+    @classmethod
+    def is_member(cls, group: Group, user_id: int) -> bool:
+        return user_id in cls.get_member_ids(group)
+
+    @classmethod
+    def are_members(cls, group: Group, user_ids: Iterable[int]) -> bool:
+        """
+        :param group: The target group
+        :param user_ids: The users to check
+        :return: True if every given user is a member (or the admin) of the group
+        """
+        return cls.get_member_ids(group).issuperset(user_ids)
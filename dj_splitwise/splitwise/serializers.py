@@ -1,233 +1,482 @@
-from rest_framework import serializers
-from .models import User, UserExpense, Expense, Group, GroupExpense
-from .models import ExpensePaidBy, ExpenseSharedBy
-import functools
-from rest_framework.exceptions import ValidationError
-from typing import List
-from collections import OrderedDict
-
-
-class UserSerializer(serializers.ModelSerializer):
-    class Meta:
-        model = User
-        fields = '__all__'
-        extra_kwargs = {
-            'password': {'write_only': True}
-        }
-
-    # Overridden
-    def create(self, validated_data) -> User:
-        user = User.objects.create(**validated_data)
-        user.set_password(validated_data['password'])
-        user.save()
-        return user
-
-    # Overridden
-    def to_representation(self, instance):
-        instance_dict = super().to_representation(instance)
-        # returning only the non-empty attributes
-        return OrderedDict(filter(lambda attr_val_pair: True if attr_val_pair[1] else False, instance_dict.items()))
-
-
-class UserExpenseSerializer(serializers.ModelSerializer):
-    class Meta:
-        model = UserExpense
-        fields = '__all__'
-        read_only_fields = ['paid_by', 'created_by']
-
-
-class ExpenseSerializer(serializers.ModelSerializer):
-    class Meta:
-        model = Expense
-        fields = '__all__'
-
-
-"""
-Serializer relations:
-
-Ref: DOC
-- https://www.django-rest-framework.org/api-guide/relations/
-  -- Album, Track models example
-    --- 'unique_together' attribute in serializer Meta class
-"""
-
-
-class GroupSerializer(serializers.ModelSerializer):
-    # ** NOTE: 'members' is a ManyToMany related field
-    # Option 1: serialize the related field as a list of nested obj
-    # members = UserSerializer(many=True, required=False)  # Using the target obj serializer
-    # Option 2: serialize the related field as a list of primary keys
-    members = serializers.PrimaryKeyRelatedField(many=True, queryset=User.objects.all(), required=False)
-
-    class Meta:
-        model = Group
-        fields = '__all__'
-        # read_only_fields = ['members']
-
-
-class ExpensePaidBySerializer(serializers.ModelSerializer):
-    user = serializers.PrimaryKeyRelatedField(queryset=User.objects.all(), required=True)
-
-    class Meta:
-        model = ExpensePaidBy
-        fields = '__all__'
-
-
-class ExpenseSharedBySerializer(serializers.ModelSerializer):
-    user = serializers.PrimaryKeyRelatedField(queryset=User.objects.all(), required=True)
-
-    class Meta:
-        model = ExpenseSharedBy
-        fields = '__all__'
-
-
-class GroupExpenseSerializer(serializers.ModelSerializer):
-    paid_by = ExpensePaidBySerializer(many=True, required=True)  # Nested Serializer
-    shared_by = ExpenseSharedBySerializer(many=True, required=True)  # Nested Serializer
-
-    class Meta:
-        model = GroupExpense
-        fields = '__all__'
-        read_only_fields = ['created_by', 'group']  # Taken care by Auth
-        unique_together = ['group', 'id']
-
-    def is_valid_expense(self, validated_data: dict):
-        """
-
-        :param validated_data: A dict representing the expense data
-        :return: True if the expense amount is eq to the total amount paid and total amount shared
-        """
-        expense_amt = validated_data.get('amount', 0)
-        total_amt_paid = functools.reduce(lambda _sum, paid: _sum + paid.get('amount', 0),
-                                          validated_data.get('paid_by'), 0)
-        total_amt_shared = functools.reduce(lambda _sum, shared: _sum + shared.get('amount', 0),
-                                            validated_data.get('shared_by'), 0)
-        print(':: LOG :: GroupExpenseSerializer :: is_valid_expense()')
-        print('Expense Amount:', expense_amt)
-        print('Total Amount Paid:', total_amt_paid)
-        print('Total Amount Shared:', total_amt_shared)
-        print(':: LOG :: END')
-        return expense_amt == total_amt_paid == total_amt_shared
-
-    def are_all_members(self, group: Group, participant_data: List[dict]):
-        for participant in participant_data:
-            user = participant['user']
-            if not (user.id == group.created_by_id or
-                    group.members.filter(pk=user.id).exists()):
-                return False
-        return True
-
-    """
-    Writable Nested Serializer:
-    - *** The `.create()` method does not support writable nested fields by default.
-      -- Write an explicit `.create()` method for serializer `splitwise.serializers.GroupExpenseSerializer`,
-    or set `read_only=True` on nested serializer fields.
-    - Ref: https://www.django-rest-framework.org/topics/writable-nested-serializers/#writable-nested-serializers
-    
-    Create and update Django rest framework nested serializers:
-    - Ref: https://django.cowhite.com/blog/create-and-update-django-rest-framework-nested-serializers/
-    
-    *** NOTE:
-    - add(), create(), remove(), clear(), and set() all apply database changes immediately
-    for all types of related fields. In other words, there is no need to call save() on either end of the relationship.
-    - Ref: https://docs.djangoproject.com/en/2.1/ref/models/relations/#django.db.models.fields.related.RelatedManager.set
-    """
-
-    # Overridden
-    def create(self, validated_data: dict) -> GroupExpense:
-        if not self.is_valid_expense(validated_data):
-            raise ValidationError('Expense amount should be equal to the total amount paid and total amount shared')
-        group = validated_data['group']
-        paid_by_data = validated_data.pop('paid_by')
-        shared_by_data = validated_data.pop('shared_by')
-        if not self.are_all_members(group, paid_by_data) or not self.are_all_members(group, shared_by_data):
-            raise ValidationError('All the participants in the expense must be members of the group')
-        group_expense = GroupExpense.objects.create(**validated_data)
-        # create all ExpensePaidBy
-        for paid_by in paid_by_data:
-            # ** Getting below error:
-            """
-            TypeError:
-            Direct assignment to the reverse side of a many-to-many set is prohibited. Use group_expense.set() instead.
-            
-            My Understanding:
-            - The one who is pointing (defined the relation) needs to know the other side
-            and hence the other side must be created first.
-              -- Here, the other sides are ExpensePaidBy and ExpenseSharedBy
-            """
-            # ExpensePaidBy.objects.create(group_expense=group_expense, **paid_by)  # TypeError
-            group_expense.paid_by.add(ExpensePaidBy.objects.create(**paid_by))  # WORKS
-        # create all ExpenseSharedBy
-        for shared_by in shared_by_data:
-            group_expense.shared_by.add(ExpenseSharedBy.objects.create(**shared_by))
-        return group_expense
-
-
-class QueryUserExpenseSerializer(serializers.Serializer):
-    expense_id = serializers.IntegerField(source='id')
-    expense_amount = serializers.SerializerMethodField()
-    title = serializers.CharField()
-    description = serializers.CharField()
-    created_at = serializers.DateTimeField()
-    created_by = serializers.StringRelatedField(read_only=True)
-
-    # NOTE: serializer is able to automatically map the field to its corresponding method
-    # as long as the method name follows the pattern: 'get_<field_name>'
-    def get_expense_amount(self, instance):
-        user = self.context.get('requested_by')
-        if not user:
-            raise ValidationError('Missing context! User context is required.')
-        if instance.paid_to_id == user.id:
-            return -instance.amount
-        return instance.amount
-
-    # Overridden
-    def to_representation(self, instance):
-        representation = super().to_representation(instance)
-        expense_amount = representation.get('expense_amount', 0)
-        # ensuring expense_amount is a decimal field
-        representation['expense_amount'] = (serializers.DecimalField(max_digits=7, decimal_places=2)
-                                            .to_representation(expense_amount))
-        return representation
-
-
-class QueryGroupExpenseSerializer(serializers.Serializer):
-    expense_id = serializers.IntegerField(source='group_expense.first.id')
-    expense_amount = serializers.SerializerMethodField()
-    title = serializers.CharField(source='group_expense.first.title')
-    description = serializers.CharField(source='group_expense.first.description')
-    created_at = serializers.DateTimeField(source='group_expense.first.created_at')
-    created_by = serializers.StringRelatedField(source='group_expense.first.created_by')
-
-    def get_expense_amount(self, instance):
-        is_owed = self.context.get('is_owed')
-        if is_owed is None:
-            raise ValidationError('Missing context! Expense type is required.')
-        if is_owed:
-            return -instance.amount
-        return instance.amount
-
-    # Overridden
-    def to_representation(self, instance):
-        representation = super().to_representation(instance)
-        # ensuring expense_amount is a decimal field
-        expense_amount = representation.get('expense_amount', 0)
-        representation['expense_amount'] = (serializers.DecimalField(max_digits=7, decimal_places=2)
-                                            .to_representation(expense_amount))
-        return representation
-
-
-# TEST CLASSES
-"""
-LEARNINGS:
-
-Q. I want to populate value from a ManyToManyField in a CharField serializer in DRF.
-- https://sl.bing.net/fNVpviFSAUK
-
-Core arguments in serializer fields - DRF:
-- https://www.geeksforgeeks.org/core-arguments-in-serializer-fields-django-rest-framework/
-
-Q. Populating a serializer decimal field sourced from a custom method defined in the serializer itself
-- https://sl.bing.net/dhVvfIivkoC
-
-"""
+from django.db import connection, transaction
+from django.db.models import QuerySet
+from rest_framework import serializers
+from .ledgers import GroupBalanceLedger
+from .queries import GroupMemberQuery
+from .models import User, UserExpense, Expense, Group, GroupExpense
+from .models import ExpensePaidBy, ExpenseSharedBy, Job
+import functools
+import logging
+from rest_framework.exceptions import ValidationError
+from typing import Iterable, List, Tuple
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+class UserSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = User
+        fields = '__all__'
+        extra_kwargs = {
+            'password': {'write_only': True}
+        }
+
+    # Overridden
+    def create(self, validated_data) -> User:
+        user = User.objects.create(**validated_data)
+        user.set_password(validated_data['password'])
+        user.save()
+        return user
+
+    # Overridden
+    def to_representation(self, instance):
+        instance_dict = super().to_representation(instance)
+        # returning only the non-empty attributes
+        return OrderedDict(filter(lambda attr_val_pair: True if attr_val_pair[1] else False, instance_dict.items()))
+
+
+class UserExpenseSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = UserExpense
+        fields = '__all__'
+        read_only_fields = ['paid_by', 'created_by']
+
+
+class ExpenseSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Expense
+        fields = '__all__'
+
+
+"""
+Serializer relations:
+
+Ref: DOC
+- https://www.django-rest-framework.org/api-guide/relations/
+  -- Album, Track models example
+    --- 'unique_together' attribute in serializer Meta class
+"""
+
+
+class GroupSerializer(serializers.ModelSerializer):
+    # ** NOTE: 'members' is a ManyToMany related field
+    # Option 1: serialize the related field as a list of nested obj
+    # members = UserSerializer(many=True, required=False)  # Using the target obj serializer
+    # Option 2: serialize the related field as a list of primary keys
+    members = serializers.PrimaryKeyRelatedField(many=True, queryset=User.objects.all(), required=False)
+
+    class Meta:
+        model = Group
+        exclude = ['ledger_version']  # internal
+        # read_only_fields = ['members']
+
+
+class ParticipantField(serializers.PrimaryKeyRelatedField):
+    """
+    A user primary key field which looks up the users preloaded by 'ParticipantListSerializer' before querying
+    """
+    users = None  # user_id -> User, set by the parent ParticipantListSerializer
+
+    # Overridden
+    def to_internal_value(self, data):
+        if self.users is not None and not isinstance(data, bool):
+            try:
+                user = self.users.get(int(data))
+            except (TypeError, ValueError):
+                user = None
+            if user is not None:
+                return user
+        return super().to_internal_value(data)  # unknown user: raises the usual validation error
+
+
+class ParticipantListSerializer(serializers.ListSerializer):
+    """
+    Resolves the users of all the participants with a single query, instead of one query per participant
+    """
+
+    @staticmethod
+    def get_user_ids(data) -> set:
+        """
+        :param data: The raw participant data, expected to be a list of dicts
+        :return: The user ids to preload; malformed entries are skipped and reported later by the child serializer
+        """
+        user_ids = set()
+        for participant in data if isinstance(data, list) else []:
+            try:
+                user_ids.add(int(participant['user']))
+            except (KeyError, TypeError, ValueError):
+                pass
+        return user_ids
+
+    # Overridden
+    def to_internal_value(self, data):
+        user_field = self.child.fields['user']
+        if user_field.users is not None:  # already preloaded by the caller, e.g. for a batch of expenses
+            return super().to_internal_value(data)
+        user_field.users = User.objects.in_bulk(self.get_user_ids(data))
+        try:
+            return super().to_internal_value(data)
+        finally:
+            user_field.users = None
+
+
+class ExpensePaidBySerializer(serializers.ModelSerializer):
+    user = ParticipantField(queryset=User.objects.all(), required=True)
+
+    class Meta:
+        model = ExpensePaidBy
+        exclude = ['expense', 'group']  # set from the expense (see GroupExpenseSerializer.create_splits)
+        list_serializer_class = ParticipantListSerializer
+
+
+class ExpenseSharedBySerializer(serializers.ModelSerializer):
+    user = ParticipantField(queryset=User.objects.all(), required=True)
+
+    class Meta:
+        model = ExpenseSharedBy
+        exclude = ['expense', 'group']  # set from the expense (see GroupExpenseSerializer.create_splits)
+        list_serializer_class = ParticipantListSerializer
+
+
+class GroupExpenseSerializer(serializers.ModelSerializer):
+    paid_by = ExpensePaidBySerializer(many=True, required=True)  # Nested Serializer
+    shared_by = ExpenseSharedBySerializer(many=True, required=True)  # Nested Serializer
+
+    class Meta:
+        model = GroupExpense
+        fields = '__all__'
+        read_only_fields = ['created_by', 'group']  # Taken care by Auth
+        unique_together = ['group', 'id']
+
+    def is_valid_expense(self, validated_data: dict):
+        """
+
+        :param validated_data: A dict representing the expense data
+        :return: True if the expense amount is eq to the total amount paid and total amount shared
+        """
+        expense_amt = validated_data.get('amount', 0)
+        total_amt_paid = functools.reduce(lambda _sum, paid: _sum + paid.get('amount', 0),
+                                          validated_data.get('paid_by'), 0)
+        total_amt_shared = functools.reduce(lambda _sum, shared: _sum + shared.get('amount', 0),
+                                            validated_data.get('shared_by'), 0)
+        logger.debug('is_valid_expense: amount=%s paid=%s shared=%s', expense_amt, total_amt_paid, total_amt_shared)
+        return expense_amt == total_amt_paid == total_amt_shared
+
+    def are_all_members(self, group: Group, participant_data: List[dict]):
+        """
+        :param group: The group of the expense
+        :param participant_data: A list of dicts representing the participants (ExpensePaidBy, ExpenseSharedBy)
+        :return: True if every participant is a member (or the admin) of the group
+        """
+        # the member ids are fetched once and cached on the group obj (see GroupMemberQuery)
+        return GroupMemberQuery.are_members(group, {participant['user'].id for participant in participant_data})
+
+    """
+    Writable Nested Serializer:
+    - *** The `.create()` method does not support writable nested fields by default.
+      -- Write an explicit `.create()` method for serializer `splitwise.serializers.GroupExpenseSerializer`,
+    or set `read_only=True` on nested serializer fields.
+    - Ref: https://www.django-rest-framework.org/topics/writable-nested-serializers/#writable-nested-serializers
+    
+    Create and update Django rest framework nested serializers:
+    - Ref: https://django.cowhite.com/blog/create-and-update-django-rest-framework-nested-serializers/
+    
+    *** NOTE:
+    - add(), create(), remove(), clear(), and set() all apply database changes immediately
+    for all types of related fields. In other words, there is no need to call save() on either end of the relationship.
+    - Ref: https://docs.djangoproject.com/en/2.1/ref/models/relations/#django.db.models.fields.related.RelatedManager.set
+    """
+
+    def check_expense(self, group: Group, validated_data: dict) -> None:
+        """
+        Raises ValidationError if the amounts do not add up or any participant is not a member of the group
+
+        :param group: The group of the expense
+        :param validated_data: A dict representing the expense data
+        :return: None
+        """
+        if not self.is_valid_expense(validated_data):
+            raise ValidationError('Expense amount should be equal to the total amount paid and total amount shared')
+        if not self.are_all_members(group, validated_data['paid_by'] + validated_data['shared_by']):
+            raise ValidationError('All the participants in the expense must be members of the group')
+
+    # Overridden
+    def create(self, validated_data: dict) -> GroupExpense:
+        group = validated_data['group']
+        self.check_expense(group, validated_data)
+        paid_by_data = validated_data.pop('paid_by')
+        shared_by_data = validated_data.pop('shared_by')
+        with transaction.atomic():  # a failed write never leaves half an expense behind
+            group_expense = GroupExpense.objects.create(**validated_data)
+            self.create_splits([(group_expense, paid_by_data, shared_by_data)])
+            # keeping the group balance ledger in sync with the expense
+            deltas = GroupBalanceLedger.get_deltas(
+                [(paid_by['user'].id, paid_by['amount']) for paid_by in paid_by_data],
+                [(shared_by['user'].id, shared_by['amount']) for shared_by in shared_by_data])
+            GroupBalanceLedger.apply(group.id, deltas)
+        return group_expense
+
+    @classmethod
+    def create_splits(cls, expense_splits: List[Tuple[GroupExpense, List[dict], List[dict]]]) -> None:
+        """
+        Creates the ExpensePaidBy and ExpenseSharedBy of the given group expenses and links them, using
+        a constant number of INSERTs: one bulk_create for each split model and for each M2M through model.
+        A split is given its expense and group (denormalized FKs) along with the M2M link.
+        Must be called inside a transaction.
+
+        ** NOTE: Setting the reverse side of the M2M is prohibited:
+        - ExpensePaidBy.objects.create(group_expense=group_expense, **paid_by)  # TypeError
+          -- Direct assignment to the reverse side of a many-to-many set is prohibited.
+        - The one who is pointing (defined the relation) needs to know the other side
+        and hence the other side must be created first.
+          -- Here, the other sides are ExpensePaidBy and ExpenseSharedBy
+
+        :param expense_splits: A list of (group_expense, paid_by_data, shared_by_data)
+        :return: None
+        """
+        for model, m2m_field, index in ((ExpensePaidBy, GroupExpense.paid_by, 1),
+                                        (ExpenseSharedBy, GroupExpense.shared_by, 2)):
+            split_objs = [model(**split, expense=splits[0], group_id=splits[0].group_id)
+                          for splits in expense_splits for split in splits[index]]
+            if connection.features.can_return_rows_from_bulk_insert:
+                split_objs = model.objects.bulk_create(split_objs)  # sets the pk of every obj
+            else:
+                for split_obj in split_objs:
+                    split_obj.save()
+            through = m2m_field.through
+            # linking by ids (attnames): cheaper to build than assigning the related objs
+            expense_attname = through._meta.get_field(m2m_field.field.m2m_field_name()).attname
+            split_attname = through._meta.get_field(m2m_field.field.m2m_reverse_field_name()).attname
+            through.objects.bulk_create([through(**{expense_attname: split_obj.expense_id, split_attname: split_obj.pk})
+                                         for split_obj in split_objs])
+
+
+class QueryUserExpenseSerializer(serializers.Serializer):
+    expense_id = serializers.IntegerField(source='id')
+    expense_amount = serializers.SerializerMethodField()
+    title = serializers.CharField()
+    description = serializers.CharField()
+    created_at = serializers.DateTimeField()
+    created_by = serializers.StringRelatedField(read_only=True)
+
+    # NOTE: serializer is able to automatically map the field to its corresponding method
+    # as long as the method name follows the pattern: 'get_<field_name>'
+    def get_expense_amount(self, instance):
+        user = self.context.get('requested_by')
+        if not user:
+            raise ValidationError('Missing context! User context is required.')
+        if instance.paid_to_id == user.id:
+            return -instance.amount
+        return instance.amount
+
+    # Overridden
+    def to_representation(self, instance):
+        representation = super().to_representation(instance)
+        expense_amount = representation.get('expense_amount', 0)
+        # ensuring expense_amount is a decimal field
+        representation['expense_amount'] = (serializers.DecimalField(max_digits=7, decimal_places=2)
+                                            .to_representation(expense_amount))
+        return representation
+
+
+class QueryGroupExpenseSerializer(serializers.Serializer):
+    expense_id = serializers.IntegerField(source='expense.id')
+    expense_amount = serializers.SerializerMethodField()
+    title = serializers.CharField(source='expense.title')
+    description = serializers.CharField(source='expense.description')
+    created_at = serializers.DateTimeField(source='expense.created_at')
+    created_by = serializers.StringRelatedField(source='expense.created_by')
+
+    @staticmethod
+    def prefetch(queryset: QuerySet) -> QuerySet:
+        """
+        Fetches the GroupExpense (and its creator) of every row along with it: joined through the 'expense' FK,
+        no extra query
+        """
+        return queryset.select_related('expense__created_by')
+
+    def get_expense_amount(self, instance):
+        is_owed = self.context.get('is_owed')
+        if is_owed is None:
+            raise ValidationError('Missing context! Expense type is required.')
+        if is_owed:
+            return -instance.amount
+        return instance.amount
+
+    # Overridden
+    def to_representation(self, instance):
+        representation = super().to_representation(instance)
+        # ensuring expense_amount is a decimal field
+        expense_amount = representation.get('expense_amount', 0)
+        representation['expense_amount'] = (serializers.DecimalField(max_digits=7, decimal_places=2)
+                                            .to_representation(expense_amount))
+        return representation
+
+
+class QueryExpenseFeedSerializer(serializers.Serializer):
+    """Serializes the rows of '.queries.ExpenseFeedQuery' with the same keys as the query serializers above"""
+    expense_id = serializers.IntegerField()
+    expense_amount = serializers.DecimalField(max_digits=7, decimal_places=2)
+    title = serializers.CharField(source='expense_title')
+    description = serializers.CharField(source='expense_description')
+    created_at = serializers.DateTimeField(source='expense_created_at')
+    created_by = serializers.CharField(source='expense_created_by')
+
+
+class ValuesRepresentation:
+    """
+    Builds the representation of a serializer straight from a values() row, for the hot read paths:
+    the field machinery of Serializer.to_representation() is run once per serializer instead of once per row.
+    - the plain fields are represented by the field itself, e.g. the decimals as strings
+    - the primary key related fields are read as the raw fk id from the row
+    - the nested serializers are skipped: filled in by the caller
+    NOTE: The timezone of the datetime fields is resolved once, hence build it per request
+    """
+
+    RAW, NESTED = 'raw', 'nested'
+
+    def __init__(self, serializer: serializers.Serializer):
+        # (field_name, source, to_representation | RAW | NESTED), in the order of the serializer fields
+        self.fields = []
+        for field_name, field in serializer.fields.items():
+            if field.write_only:
+                continue
+            if isinstance(field, serializers.BaseSerializer):
+                self.fields.append((field_name, field.source, self.NESTED))
+            elif isinstance(field, serializers.PrimaryKeyRelatedField):
+                self.fields.append((field_name, field.source, self.RAW))
+            else:
+                if isinstance(field, serializers.DateTimeField) and not hasattr(field, 'timezone'):
+                    # instead of a lookup of the current timezone (context local) for every value
+                    field.timezone = field.default_timezone()
+                self.fields.append((field_name, field.source, field.to_representation))
+
+    @property
+    def sources(self) -> List[str]:
+        """
+        :return: The fields to select with values()
+        """
+        return [source for _, source, to_representation in self.fields if to_representation is not self.NESTED]
+
+    def to_representation(self, row: dict, **nested) -> dict:
+        """
+        :param row: A values() row selecting 'sources'
+        :param nested: The representation of the nested fields, by field name
+        :return: The representation, the keys ordered as in the serializer
+        """
+        representation = {}
+        for field_name, source, to_representation in self.fields:
+            if to_representation is self.NESTED:
+                representation[field_name] = nested[field_name]
+                continue
+            value = row[source]
+            representation[field_name] = value if value is None or to_representation is self.RAW \
+                else to_representation(value)
+        return representation
+
+
+class GroupExpenseListReader:
+    """
+    The fast read path of the group expense list: the same JSON as GroupExpenseSerializer(queryset, many=True)
+    in three queries whatever the num of expenses (values() for the expenses, then one query per split relation),
+    instead of two queries per expense and the ModelSerializer field machinery per row and per split.
+    The expenses and their splits are ordered by id.
+    """
+    SPLIT_RELATIONS = (('paid_by', ExpensePaidBy), ('shared_by', ExpenseSharedBy))
+
+    @classmethod
+    def get_representations(cls) -> Tuple[ValuesRepresentation, dict]:
+        """
+        :return: (the representation of the expense, {field_name: the representation of the split})
+        """
+        serializer = GroupExpenseSerializer()
+        return (ValuesRepresentation(serializer),
+                {field_name: ValuesRepresentation(serializer.fields[field_name].child)
+                 for field_name, _ in cls.SPLIT_RELATIONS})
+
+    @classmethod
+    def get_querysets(cls, group_id: int) -> Tuple[QuerySet, dict]:
+        """
+        :return: (the expense rows, {field_name: the split rows})
+        """
+        expense_representation, split_representations = cls.get_representations()
+        # NOTE: 'pk' (expense_ptr) rather than the inherited 'id': the same order, read from the (group, pk) index
+        expenses = (GroupExpense.objects.filter(group_id=group_id)
+                    .order_by('pk')
+                    .values(*expense_representation.sources))
+        # reaching the splits by their (denormalized) group: no IN (...) list of expense ids, no join
+        splits = {field_name: (model.objects.filter(group_id=group_id)
+                               .order_by('id')
+                               .values('expense', *split_representations[field_name].sources))
+                  for field_name, model in cls.SPLIT_RELATIONS}
+        return expenses, splits
+
+    @classmethod
+    def build(cls, expense_rows: Iterable[dict], split_rows: dict) -> List[dict]:
+        """
+        :param expense_rows: The rows of the expense queryset
+        :param split_rows: {field_name: the rows of the split queryset}
+        :return: The representation of every expense
+        """
+        expense_representation, split_representations = cls.get_representations()
+        splits = {}  # field_name -> expense_id -> list of split representations
+        for field_name, rows in split_rows.items():
+            split_representation = split_representations[field_name]
+            by_expense = splits[field_name] = {}
+            for row in rows:
+                by_expense.setdefault(row['expense'], []).append(split_representation.to_representation(row))
+        return [expense_representation.to_representation(
+                    row, **{field_name: splits[field_name].get(row['id'], []) for field_name in splits})
+                for row in expense_rows]
+
+    @classmethod
+    def read(cls, group_id: int) -> List[dict]:
+        """
+        :param group_id: The target group
+        :return: The representation of every expense of the group
+        """
+        expenses, splits = cls.get_querysets(group_id)
+        return cls.build(expenses, splits)
+
+    @classmethod
+    async def aread(cls, group_id: int) -> List[dict]:
+        """
+        The async twin of 'read()', for the async views
+        """
+        expenses, splits = cls.get_querysets(group_id)
+        split_rows = {field_name: [row async for row in queryset] for field_name, queryset in splits.items()}
+        return cls.build([row async for row in expenses], split_rows)
+
+
+class JobSerializer(serializers.ModelSerializer):
+    """
+    The status of a background job (see jobs.JobQueue)
+    """
+    error = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Job
+        fields = ['id', 'name', 'status', 'attempts', 'max_attempts', 'result', 'error', 'created_at', 'updated_at',
+                  'run_after', 'finished_at']
+
+    def get_error(self, instance: Job) -> str:
+        # the last line of the traceback: the exception, without the internals of the server
+        lines = instance.error.strip().splitlines()
+        return lines[-1] if lines else ''
+
+
+# TEST CLASSES
+"""
+LEARNINGS:
+
+Q. I want to populate value from a ManyToManyField in a CharField serializer in DRF.
+- https://sl.bing.net/fNVpviFSAUK
+
+Core arguments in serializer fields - DRF:
+- https://www.geeksforgeeks.org/core-arguments-in-serializer-fields-django-rest-framework/
+
+Q. Populating a serializer decimal field sourced from a custom method defined in the serializer itself
+- https://sl.bing.net/dhVvfIivkoC
+
+"""
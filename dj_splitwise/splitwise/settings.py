@@ -1,140 +1,246 @@
-"""
-Django settings for splitwise project.
-
-Generated by 'django-admin startproject' using Django 5.1.1.
-
-For more information on this file, see
-https://docs.djangoproject.com/en/5.1/topics/settings/
-
-For the full list of settings and their values, see
-https://docs.djangoproject.com/en/5.1/ref/settings/
-"""
-
-from pathlib import Path
-from datetime import timedelta
-
-# Build paths inside the project like this: BASE_DIR / 'subdir'.
-BASE_DIR = Path(__file__).resolve().parent.parent
-
-
-# Quick-start development settings - unsuitable for production
-# See https://docs.djangoproject.com/en/5.1/howto/deployment/checklist/
-
-# SECURITY WARNING: keep the secret key used in production secret!
-SECRET_KEY = 'django-insecure-tnqp+^6lh5nf5s7=^f)#8(6ldhgx4cg(5z2=ei=n85x1iween&'
-
-# SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
-
-ALLOWED_HOSTS = []
-
-
-# Application definition
-
-INSTALLED_APPS = [
-    'django.contrib.admin',
-    'django.contrib.auth',
-    'django.contrib.contenttypes',
-    'django.contrib.sessions',
-    'django.contrib.messages',
-    'django.contrib.staticfiles',
-    'rest_framework',
-    'splitwise',
-    'rest_framework_simplejwt',
-]
-
-MIDDLEWARE = [
-    'django.middleware.security.SecurityMiddleware',
-    'django.contrib.sessions.middleware.SessionMiddleware',
-    'django.middleware.common.CommonMiddleware',
-    'django.middleware.csrf.CsrfViewMiddleware',
-    'django.contrib.auth.middleware.AuthenticationMiddleware',
-    'django.contrib.messages.middleware.MessageMiddleware',
-    'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    'splitwise.middlewares.ExceptionMiddleware',
-]
-
-ROOT_URLCONF = 'splitwise.urls'
-
-TEMPLATES = [
-    {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
-        'DIRS': [],
-        'APP_DIRS': True,
-        'OPTIONS': {
-            'context_processors': [
-                'django.template.context_processors.debug',
-                'django.template.context_processors.request',
-                'django.contrib.auth.context_processors.auth',
-                'django.contrib.messages.context_processors.messages',
-            ],
-        },
-    },
-]
-
-WSGI_APPLICATION = 'splitwise.wsgi.application'
-
-
-# Database
-# https://docs.djangoproject.com/en/5.1/ref/settings/#databases
-
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
-}
-
-
-# Password validation
-# https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
-
-AUTH_PASSWORD_VALIDATORS = [
-    {
-        'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
-    },
-    {
-        'NAME': 'django.contrib.auth.password_validation.MinimumLengthValidator',
-    },
-    {
-        'NAME': 'django.contrib.auth.password_validation.CommonPasswordValidator',
-    },
-    {
-        'NAME': 'django.contrib.auth.password_validation.NumericPasswordValidator',
-    },
-]
-
-
-# Internationalization
-# https://docs.djangoproject.com/en/5.1/topics/i18n/
-
-LANGUAGE_CODE = 'en-us'
-
-TIME_ZONE = 'UTC'
-
-USE_I18N = True
-
-USE_TZ = True
-
-
-# Static files (CSS, JavaScript, Images)
-# https://docs.djangoproject.com/en/5.1/howto/static-files/
-
-STATIC_URL = 'static/'
-
-# Default primary key field type
-# https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
-
-DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
-
-# Setting the custom user model as the default auth user model
-AUTH_USER_MODEL = 'splitwise.User'
-
-REST_FRAMEWORK = {
-    'DEFAULT_AUTHENTICATION_CLASSES': ['rest_framework_simplejwt.authentication.JWTAuthentication']
-}
-
-SIMPLE_JWT = {
-    'ACCESS_TOKEN_LIFETIME': timedelta(days=1),
-    'REFRESH_TOKEN_LIFETIME': timedelta(days=2),
-}
\ No newline at end of file
+"""
+Django settings for splitwise project.
+
+Generated by 'django-admin startproject' using Django 5.1.1.
+
+For more information on this file, see
+https://docs.djangoproject.com/en/5.1/topics/settings/
+
+For the full list of settings and their values, see
+https://docs.djangoproject.com/en/5.1/ref/settings/
+"""
+
+from pathlib import Path
+from datetime import timedelta
+
+# Build paths inside the project like this: BASE_DIR / 'subdir'.
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+
+# Quick-start development settings - unsuitable for production
+# See https://docs.djangoproject.com/en/5.1/howto/deployment/checklist/
+
+# SECURITY WARNING: keep the secret key used in production secret!
+SECRET_KEY = 'django-insecure-tnqp+^6lh5nf5s7=^f)#8(6ldhgx4cg(5z2=ei=n85x1iween&'
+
+# SECURITY WARNING: don't run with debug turned on in production!
+DEBUG = True
+
+ALLOWED_HOSTS = []
+
+
+# Application definition
+
+INSTALLED_APPS = [
+    'django.contrib.admin',
+    'django.contrib.auth',
+    'django.contrib.contenttypes',
+    'django.contrib.sessions',
+    'django.contrib.messages',
+    'django.contrib.staticfiles',
+    'rest_framework',
+    'splitwise',
+    'rest_framework_simplejwt',
+]
+
+MIDDLEWARE = [
+    'splitwise.middlewares.InstrumentationMiddleware',  # first: times the whole stack
+    'django.middleware.security.SecurityMiddleware',
+    'django.contrib.sessions.middleware.SessionMiddleware',
+    'django.middleware.common.CommonMiddleware',
+    'django.middleware.csrf.CsrfViewMiddleware',
+    'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'django.contrib.messages.middleware.MessageMiddleware',
+    'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'splitwise.middlewares.ExceptionMiddleware',
+    'splitwise.middlewares.ProfilingMiddleware',  # last: see its docstring
+]
+
+ROOT_URLCONF = 'splitwise.urls'
+
+TEMPLATES = [
+    {
+        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'DIRS': [],
+        'APP_DIRS': True,
+        'OPTIONS': {
+            'context_processors': [
+                'django.template.context_processors.debug',
+                'django.template.context_processors.request',
+                'django.contrib.auth.context_processors.auth',
+                'django.contrib.messages.context_processors.messages',
+            ],
+        },
+    },
+]
+
+WSGI_APPLICATION = 'splitwise.wsgi.application'
+
+
+# Database
+# https://docs.djangoproject.com/en/5.1/ref/settings/#databases
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'db.sqlite3',
+    }
+}
+
+
+# Password validation
+# https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
+
+AUTH_PASSWORD_VALIDATORS = [
+    {
+        'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
+    },
+    {
+        'NAME': 'django.contrib.auth.password_validation.MinimumLengthValidator',
+    },
+    {
+        'NAME': 'django.contrib.auth.password_validation.CommonPasswordValidator',
+    },
+    {
+        'NAME': 'django.contrib.auth.password_validation.NumericPasswordValidator',
+    },
+]
+
+
+# Internationalization
+# https://docs.djangoproject.com/en/5.1/topics/i18n/
+
+LANGUAGE_CODE = 'en-us'
+
+TIME_ZONE = 'UTC'
+
+USE_I18N = True
+
+USE_TZ = True
+
+
+# Static files (CSS, JavaScript, Images)
+# https://docs.djangoproject.com/en/5.1/howto/static-files/
+
+STATIC_URL = 'static/'
+
+# Default primary key field type
+# https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
+
+DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# Setting the custom user model as the default auth user model
+AUTH_USER_MODEL = 'splitwise.User'
+
+REST_FRAMEWORK = {
+    'DEFAULT_AUTHENTICATION_CLASSES': ['rest_framework_simplejwt.authentication.JWTAuthentication']
+}
+
+SIMPLE_JWT = {
+    'ACCESS_TOKEN_LIFETIME': timedelta(days=1),
+    'REFRESH_TOKEN_LIFETIME': timedelta(days=2),
+}
+
+# Settlement strategies
+SETTLEMENT = {
+    # the exact min-transactions search falls back to the greedy strategy beyond these bounds
+    'MIN_TRANSACTIONS_MAX_GROUP_SIZE': 20,  # users with a non-zero balance
+    'MIN_TRANSACTIONS_TIME_BUDGET': 0.05,  # seconds
+    # 'in_process': all the balance sheets are settled up in the request thread
+    # 'process_pool': the min_transactions balance sheets of OFFLOAD_MIN_GROUP_SIZE users or more are settled up
+    # in a pool of processes, by an exact search with the larger OFFLOAD_MIN_TRANSACTIONS_* bounds
+    # (see executors.ProcessPoolSettlementStrategy); n_minus_1 and greedy are always run in the request thread:
+    # O(N log N), cheaper than the round trip to a worker
+    'EXECUTION': 'in_process',
+    'OFFLOAD_MIN_GROUP_SIZE': 21,  # users: beyond MIN_TRANSACTIONS_MAX_GROUP_SIZE, the request thread settles greedy
+    'OFFLOAD_MIN_TRANSACTIONS_MAX_GROUP_SIZE': 30,
+    'OFFLOAD_MIN_TRANSACTIONS_TIME_BUDGET': 1.0,  # seconds
+    'OFFLOAD_MAX_WORKERS': 2,  # processes
+    'OFFLOAD_MAX_QUEUED': 4,  # settlements waiting for a worker; beyond, they fall back to greedy in-process
+    'OFFLOAD_TIMEOUT': 2.0,  # seconds to wait for a worker; then falls back to greedy in-process
+    'OFFLOAD_MP_CONTEXT': 'spawn',  # the workers do not inherit the threads & connections of the server process
+}
+
+# Cached settle up results, keyed by (group_id, strategy, ledger_version): see caches.SettlementCache
+SETTLEMENT_CACHE = {
+    'BACKEND': 'lru',  # 'lru': local memory of the process | 'django': the Django cache (CACHE_ALIAS) | None
+    'MAX_ENTRIES': 1024,  # lru
+    'CACHE_ALIAS': 'default',  # django
+    'TIMEOUT': 3600,  # seconds, django
+}
+
+# Batch import of group expenses
+EXPENSE_IMPORT = {
+    'MAX_ITEMS': 10_000,  # expenses per request
+    'CHUNK_SIZE': 500,  # expenses per transaction
+}
+
+# Streaming export of the expense history of a user (see exporters.ExpenseHistoryExporter)
+EXPENSE_EXPORT = {
+    'CHUNK_SIZE': 2_000,  # rows fetched from the database (per cursor) and written to the response at a time
+}
+
+# Background jobs, queued in the database (see jobs.JobQueue): run by 'manage.py run_job_worker'
+JOBS = {
+    'CONCURRENCY': 2,  # threads (or processes, see the worker's --mode process) of a worker
+    'POLL_INTERVAL': 1.0,  # seconds an idle worker waits before polling the queue again
+    'MAX_ATTEMPTS': 3,  # runs of a failing job, unless its task sets it
+    'RETRY_BACKOFF': 5.0,  # seconds before the first retry, doubled on every further attempt
+    'HEARTBEAT_INTERVAL': 30.0,  # seconds between two refreshes of the claim (locked_at) of a running job
+    'LOCK_TIMEOUT': 120,  # seconds without a heartbeat: the job is considered lost (its worker died) and re-queued
+    'EXPORT_DIR': BASE_DIR / 'exports',  # the files of the export jobs
+}
+
+# Cross-request cache of the group member ids (see queries.GroupMemberQuery)
+# NOTE: the entries are keyed by the ledger version of the group, read from the DB: a membership change is seen at
+# once by every server process, whatever the cache; a cache shared by the processes (e.g. Redis) shares the entries
+GROUP_MEMBERS_CACHE = {
+    'ENABLED': False,
+    'CACHE_ALIAS': 'default',
+    'TIMEOUT': 300,  # seconds
+}
+
+# Logging: one logger per subsystem, e.g. set 'splitwise.strategies' to DEBUG to trace the settlements only
+# https://docs.djangoproject.com/en/5.1/topics/logging/
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'verbose': {'format': '{asctime} {levelname} {name} {message}', 'style': '{'},
+    },
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler', 'formatter': 'verbose'},
+    },
+    'loggers': {
+        'splitwise': {'handlers': ['console'], 'level': 'INFO', 'propagate': False},
+        'splitwise.permissions': {'level': 'INFO'},
+        'splitwise.serializers': {'level': 'INFO'},
+        'splitwise.strategies': {'level': 'INFO'},
+        'splitwise.urls': {'level': 'INFO'},
+        'splitwise.views': {'level': 'INFO'},
+        'splitwise.viewsets': {'level': 'INFO'},
+    },
+}
+
+# Non-blocking logging: the handlers of the given loggers are run by a background thread (see instrumentation.py)
+LOGGING_QUEUE = {
+    'ENABLED': False,
+    'LOGGERS': ['splitwise'],
+}
+
+# Request instrumentation (see middlewares.InstrumentationMiddleware)
+INSTRUMENTATION = {
+    'SERVER_TIMING': True,  # the 'Server-Timing' response header
+    'METRICS': True,  # the in-process metrics registry, scraped in the Prometheus text format at 'metrics/'
+    'METRICS_TOKEN': None,  # if set, the scrape must send 'Authorization: Bearer <token>'; if not, admins only
+}
+
+# On-demand profiling of a single request by an admin (see middlewares.ProfilingMiddleware)
+PROFILING = {
+    'ENABLED': True,
+    'HEADER': 'X-Profile',  # value: pstats | text | collapsed
+    'QUERY_PARAM': '_profile',  # same values as the header
+    'OUTPUT_DIR': None,  # None: the profile is returned inline instead of the response
+    'SAMPLING_INTERVAL': 0.001,  # seconds, for the collapsed stacks
+    'TEXT_LIMIT': 50,  # num of functions in the text stats
+}
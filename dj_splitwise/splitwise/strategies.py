@@ -1,85 +1,245 @@
-from typing import List
-from .utils import Transaction
-from .utils import heap_push, heap_pop, is_smaller_balance
-from .utils import validate_balance_sheet
-
-
-class NMinusOneSettlementStrategy:
-    def settle_up(self, balance_sheet: dict) -> List[Transaction]:
-        """
-        Gives a list of transactions, when executed will settle-up every user participating
-        in the shared expenses.
-        It will always suggest (N - 1) transactions for a group of N users
-
-        :param balance_sheet: A dict of user to balance mapping; -ve balance indicated expense owed
-        :return: List[Transaction]
-        """
-        print(':: LOG :: NMinusOneSettlementStrategy | settle_up ::')
-        validate_balance_sheet(balance_sheet)
-        print(':: balance_sheet | before ::', balance_sheet)
-        N = len(balance_sheet)  # num of users participating in the expenses
-        user_ids = list(balance_sheet.keys())
-        transactions = list()
-        for n in range(N - 1):
-            amount = balance_sheet.get(user_ids[n])
-            amount_next = balance_sheet.get(user_ids[n + 1])
-            if amount > 0:  # nth user should receive the amount from (n + 1)th user
-                amount_next += amount
-                balance_sheet[user_ids[n + 1]] = amount_next
-                transaction = Transaction(_from=user_ids[n + 1], to=user_ids[n], amount=amount)
-            elif amount < 0:  # nth user should pay the amount to the (n + 1)th user
-                amount_next += amount  # amount is already -ve
-                balance_sheet[user_ids[n + 1]] = amount_next
-                transaction = Transaction(_from=user_ids[n], to=user_ids[n + 1], amount=-amount)
-            else:  # nth user is already settled: No transaction
-                pass
-            # nth user will be settled
-            balance_sheet[user_ids[n]] = 0
-            if amount > 0 or amount < 0:
-                transactions.append(transaction)
-        else:
-            balance_sheet[user_ids[-1]] = 0  # Last user will be settled itself if the first (N-1) users are settled
-        print(':: balance_sheet | after ::', balance_sheet)
-        print(':: Transactions ::', *transactions, sep='\n:: ')
-        return transactions
-
-
-class GreedySettlementStrategy:
-    """
-    Based on the idea: Settle bigger transactions first
-    """
-    def settle_up(self, balance_sheet: dict):
-        """
-        Gives a list of transactions based on greedy technique: settle-up bigger transactions first
-        :param balance_sheet: A dict of user to balance amount mapping
-        :return: List[Transaction]
-        """
-        print(':: LOG :: GreedySettlementStrategy | settle_up ::')
-        validate_balance_sheet(balance_sheet)
-        # step 1: split the balance sheet into two parts:
-        # i) the users who paid
-        # ii) the users who owed
-        # The basic idea is: the money should flow from the user who owed to the user who paid
-        group_paid = []
-        group_owed = []
-        for user_id, balance in balance_sheet.items():
-            if balance > 0:  # paid
-                heap_push((user_id, -balance), group_paid, comparator=is_smaller_balance)
-            elif balance < 0:  # owed
-                heap_push((user_id, balance), group_owed, comparator=is_smaller_balance)
-        # step 2: settle-up bigger transactions
-        transactions = list()
-        while group_paid and group_owed:
-            user_id_1, balance_paid = heap_pop(group_paid)
-            user_id_2, balance_owed = heap_pop(group_owed)
-            trn_amount = min(abs(balance_paid), abs(balance_owed))
-            balance_owed += trn_amount
-            balance_paid = -balance_paid - trn_amount  # Note: In max_heap, balance_paid was stored as -ve val
-            if balance_paid > 0:
-                heap_push((user_id_1, -balance_paid), group_paid, comparator=is_smaller_balance)
-            if balance_owed < 0:
-                heap_push((user_id_2, balance_owed), group_owed, comparator=is_smaller_balance)
-            # prepare the transaction
-            transactions.append(Transaction(user_id_2, user_id_1, trn_amount))
-        print(':: Transactions ::', *transactions, sep='\n:: ')
-        return transactions
+import logging
+from time import perf_counter
+from typing import List, Union
+from .utils import Transaction, BalanceSheet
+from .utils import SettlementQueue
+from .utils import validate_balance_sheet
+
+logger = logging.getLogger(__name__)
+
+
+class NMinusOneSettlementStrategy:
+    def settle_up(self, balance_sheet: Union[dict, BalanceSheet]) -> List[Transaction]:
+        """
+        Gives a list of transactions, when executed will settle-up every user participating
+        in the shared expenses.
+        It will always suggest (N - 1) transactions for a group of N users
+
+        :param balance_sheet: A dict (or BalanceSheet) of user to balance mapping; -ve balance indicated expense owed
+        :return: List[Transaction]
+        """
+        sheet = BalanceSheet.of(balance_sheet)
+        validate_balance_sheet(sheet)
+        logger.debug('NMinusOneSettlementStrategy: balance_sheet=%s', sheet)
+        N = len(sheet)  # num of users participating in the expenses
+        user_ids = sheet.user_ids
+        balances = list(sheet.balances)  # in minor units
+        transactions = list()
+        for n in range(N - 1):
+            amount = balances[n]
+            if amount > 0:  # nth user should receive the amount from (n + 1)th user
+                balances[n + 1] += amount
+                transactions.append(Transaction(_from=user_ids[n + 1], to=user_ids[n],
+                                                amount=sheet.to_decimal(amount)))
+            elif amount < 0:  # nth user should pay the amount to the (n + 1)th user
+                balances[n + 1] += amount  # amount is already -ve
+                transactions.append(Transaction(_from=user_ids[n], to=user_ids[n + 1],
+                                                amount=sheet.to_decimal(-amount)))
+            # nth user will be settled
+            balances[n] = 0
+        if N:
+            balances[-1] = 0  # Last user will be settled itself if the first (N-1) users are settled
+        logger.debug('NMinusOneSettlementStrategy: users=%d transactions=%d', N, len(transactions))
+        return transactions
+
+
+class GreedySettlementStrategy:
+    """
+    Based on the idea: Settle bigger transactions first
+    """
+    def settle_up(self, balance_sheet: Union[dict, BalanceSheet]) -> List[Transaction]:
+        """
+        Gives a list of transactions based on greedy technique: settle-up bigger transactions first
+        :param balance_sheet: A dict (or BalanceSheet) of user to balance amount mapping
+        :return: List[Transaction]
+        """
+        sheet = BalanceSheet.of(balance_sheet)
+        validate_balance_sheet(sheet)
+        # step 1: split the balance sheet into two parts:
+        # i) the users who paid
+        # ii) the users who owed
+        # The basic idea is: the money should flow from the user who owed to the user who paid
+        group_paid = SettlementQueue((user_id, balance) for user_id, balance in sheet.items() if balance > 0)
+        group_owed = SettlementQueue((user_id, -balance) for user_id, balance in sheet.items() if balance < 0)
+        # step 2: settle-up bigger transactions
+        transactions = list()
+        while group_paid and group_owed:
+            user_id_1, balance_paid = group_paid.peek()
+            user_id_2, balance_owed = group_owed.peek()
+            trn_amount = min(balance_paid, balance_owed)
+            # the remaining balance (if any) goes back to the queue in the same sift as the pop
+            if balance_paid > trn_amount:
+                group_paid.replace(user_id_1, balance_paid - trn_amount)
+            else:
+                group_paid.pop()
+            if balance_owed > trn_amount:
+                group_owed.replace(user_id_2, balance_owed - trn_amount)
+            else:
+                group_owed.pop()
+            # prepare the transaction
+            transactions.append(Transaction(user_id_2, user_id_1, sheet.to_decimal(trn_amount)))
+        logger.debug('GreedySettlementStrategy: users=%d transactions=%d', len(sheet), len(transactions))
+        return transactions
+
+
+class MinTransactionSettlementStrategy:
+    """
+    Based on the idea: If the N users of a group can be split into K subsets with a zero-sum balance each,
+    the group can be settled with (N - K) transactions. Maximizing K minimizes the number of transactions.
+
+    Finding K is exponential, hence the exact search is bounded by the group size and a time budget.
+    Beyond those bounds, it falls back to the GreedySettlementStrategy.
+    """
+    def __init__(self, max_group_size: int = 20, time_budget: float = 0.05):
+        """
+        :param max_group_size: Max number of users (with a non-zero balance) to run the exact search for
+        :param time_budget: Max time (in seconds) to spend in the exact search
+        """
+        self.max_group_size = max_group_size
+        self.time_budget = time_budget
+
+    def settle_up(self, balance_sheet: Union[dict, BalanceSheet]) -> List[Transaction]:
+        """
+        Gives the minimum list of transactions, when executed will settle-up every user in the group
+        :param balance_sheet: A dict (or BalanceSheet) of user to balance amount mapping
+        :return: List[Transaction]
+        """
+        sheet = BalanceSheet.of(balance_sheet)
+        validate_balance_sheet(sheet)
+        # step 1: the users with exactly opposite balances settle with each other
+        # NOTE: there is always an optimal partition having such a pair as one of its subsets
+        transactions = list()
+        unmatched = {}  # balance -> [user_id, ...]
+        for user_id, balance in sheet.items():
+            if balance == 0:
+                continue
+            matches = unmatched.get(-balance)
+            if matches:
+                other_user_id = matches.pop()
+                if balance > 0:
+                    transactions.append(Transaction(other_user_id, user_id, sheet.to_decimal(balance)))
+                else:
+                    transactions.append(Transaction(user_id, other_user_id, sheet.to_decimal(-balance)))
+            else:
+                unmatched.setdefault(balance, []).append(user_id)
+        user_balances = [(user_id, balance) for balance, user_ids in unmatched.items() for user_id in user_ids]
+        # step 2: partition the remaining users into the max number of zero-sum subsets
+        try:
+            if len(user_balances) > self.max_group_size:
+                raise TimeoutError('Too many users for the exact settlement')
+            subsets = self.partition(user_balances, deadline=perf_counter() + self.time_budget)
+        except TimeoutError as e:
+            logger.info('MinTransactionSettlementStrategy: falling back to greedy: %s (users=%d)', e,
+                        len(user_balances))
+            remaining_sheet = BalanceSheet([user_id for user_id, _ in user_balances],
+                                           [balance for _, balance in user_balances], sheet.decimal_places)
+            return transactions + GreedySettlementStrategy().settle_up(remaining_sheet)
+        # step 3: settle every subset on its own: at most (size - 1) transactions per subset
+        for subset in subsets:
+            transactions.extend(self.settle_subset(subset, sheet))
+        return transactions
+
+    def partition(self, user_balances: List[tuple], deadline: float) -> List[List[tuple]]:
+        """
+        Splits the users into the max number of subsets having a zero-sum balance.
+        Raises TimeoutError if the deadline is crossed.
+
+        :param user_balances: A list of (user_id, balance in minor units); the balances must sum up to zero
+        :param deadline: The perf_counter() value to give up at
+        :return: A list of subsets, each subset being a list of (user_id, balance)
+        """
+        N = len(user_balances)
+        if N == 0:
+            return []
+        full_mask = (1 << N) - 1
+        # candidate subsets indexed by their lowest bit: every search step settles the lowest remaining user
+        candidates = {}
+        for mask in self.minimal_zero_sum_masks([balance for _, balance in user_balances], deadline):
+            if mask != full_mask:
+                candidates.setdefault(mask & -mask, []).append(mask)
+        memo = {}  # mask -> (max num of subsets, first subset)
+
+        def max_subsets(mask: int) -> int:
+            if mask in memo:
+                return memo[mask][0]
+            if perf_counter() > deadline:
+                raise TimeoutError('Exceeded the time budget of the exact settlement')
+            upper_bound = bin(mask).count('1') // 2  # every subset has at least 2 users
+            best_count, best_subset = 1, mask  # the whole remaining set is itself zero-sum
+            for subset in candidates.get(mask & -mask, ()):
+                if best_count == upper_bound:
+                    break
+                if subset & mask == subset and subset != mask:
+                    count = 1 + max_subsets(mask ^ subset)
+                    if count > best_count:
+                        best_count, best_subset = count, subset
+            memo[mask] = (best_count, best_subset)
+            return best_count
+
+        max_subsets(full_mask)
+        subsets = []
+        mask = full_mask
+        while mask:
+            subset = memo[mask][1] if mask in memo else mask
+            subsets.append([user_balances[i] for i in range(N) if subset >> i & 1])
+            mask ^= subset
+        return subsets
+
+    def minimal_zero_sum_masks(self, balances: list, deadline: float) -> List[int]:
+        """
+        Finds every subset of the balances which sums up to zero and has no smaller zero-sum subset in it.
+        NOTE: every subset of an optimal partition is minimal, otherwise splitting it would give one more subset
+
+        :param balances: A list of non-zero balances in minor units
+        :param deadline: The perf_counter() value to give up at
+        :return: A list of bitmasks over the indices of the balances, smaller subsets first
+        """
+        def subset_sums(items: List[tuple]) -> List[tuple]:
+            sums = [(0, 0)]
+            for bit, balance in items:
+                sums += [(_sum + balance, mask | bit) for _sum, mask in sums]
+                if perf_counter() > deadline:
+                    raise TimeoutError('Exceeded the time budget of the exact settlement')
+            return sums[1:]  # excluding the empty subset
+
+        # a zero-sum subset has to take the paid amount from one side and the owed amount from the other
+        paid = [(1 << i, balance) for i, balance in enumerate(balances) if balance > 0]
+        owed = [(1 << i, -balance) for i, balance in enumerate(balances) if balance < 0]
+        smaller_side, larger_side = sorted([paid, owed], key=len)
+        sums_smaller_side = {}
+        for _sum, mask in subset_sums(smaller_side):
+            sums_smaller_side.setdefault(_sum, []).append(mask)
+        zero_sum_masks = [mask | other_mask for _sum, mask in subset_sums(larger_side)
+                          for other_mask in sums_smaller_side.get(_sum, ())]
+        zero_sum_masks.sort(key=lambda mask: bin(mask).count('1'))
+        minimal_masks = []
+        for mask in zero_sum_masks:
+            if perf_counter() > deadline:
+                raise TimeoutError('Exceeded the time budget of the exact settlement')
+            if not any(minimal_mask & mask == minimal_mask for minimal_mask in minimal_masks):
+                minimal_masks.append(mask)
+        return minimal_masks
+
+    def settle_subset(self, user_balances: List[tuple], sheet: BalanceSheet) -> List[Transaction]:
+        """
+        Settles a zero-sum subset of users: every transaction settles at least one user,
+        hence at most (size - 1) transactions
+
+        :param user_balances: A list of (user_id, balance in minor units) summing up to zero
+        :param sheet: The balance sheet the subset belongs to
+        :return: List[Transaction]
+        """
+        group_paid = [[user_id, balance] for user_id, balance in user_balances if balance > 0]
+        group_owed = [[user_id, -balance] for user_id, balance in user_balances if balance < 0]
+        transactions = list()
+        i = j = 0
+        while i < len(group_paid) and j < len(group_owed):
+            trn_amount = min(group_paid[i][1], group_owed[j][1])
+            transactions.append(Transaction(group_owed[j][0], group_paid[i][0], sheet.to_decimal(trn_amount)))
+            group_paid[i][1] -= trn_amount
+            group_owed[j][1] -= trn_amount
+            if group_paid[i][1] == 0:
+                i += 1
+            if group_owed[j][1] == 0:
+                j += 1
+        return transactions
@@ -0,0 +1,469 @@
+import os
+import random
+import tempfile
+from decimal import Decimal
+from django.conf import settings
+from django.utils import timezone
+from django.test import SimpleTestCase, TestCase, override_settings
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+from .executors import ProcessPoolSettlementStrategy, SettlementProcessPool, fell_back
+from .ledgers import GroupBalanceLedger
+from .models import Expense, ExpensePaidBy, ExpenseSharedBy, Group, GroupBalance, GroupExpense, User
+from .strategies import MinTransactionSettlementStrategy
+
+
+class GroupTestCase(TestCase):
+    """
+    A group of two members (the admin and a member), and an API client authenticated as the admin
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='payer', password='x')
+        self.other = User.objects.create_user(username='sharer', password='x')
+        self.group = Group.objects.create(name='trip', created_by=self.user)
+        self.group.members.add(self.user, self.other)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    @staticmethod
+    def expense_payload(paid_by: list, shared_by: list, title: str = 'expense') -> dict:
+        """
+        :param paid_by: (user, amount) pairs
+        :param shared_by: (user, amount) pairs
+        :param title: The expense title
+        :return: The request body creating the expense
+        """
+        amount = sum((Decimal(amt) for _, amt in paid_by), Decimal(0))
+        return {
+            'title': title, 'description': 'test', 'amount': str(amount),
+            'paid_by': [{'user': user.id, 'amount': str(amt)} for user, amt in paid_by],
+            'shared_by': [{'user': user.id, 'amount': str(amt)} for user, amt in shared_by],
+        }
+
+    def add_expense(self, paid_by: list, shared_by: list, title: str = 'expense') -> dict:
+        """
+        :return: The created expense, as returned by the API (see 'expense_payload()')
+        """
+        response = self.client.post(f'/expense/group/{self.group.id}/',
+                                    self.expense_payload(paid_by, shared_by, title), format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        return response.json()
+
+
+class QueryGroupExpenseQueryCountTest(GroupTestCase):
+    """
+    The group expense feed (GET user/expense/?query=group_expense) runs a fixed num of queries, however many
+    splits the user has: no query per row
+    """
+    NUM_QUERIES = 2  # the paid splits, the shared splits: each joined with its expense and creator
+
+    def add_expenses(self, count: int) -> None:
+        """
+        Adds expenses paid by the user and shared with the other member: a paid and a shared split of the user each
+        """
+        for i in range(count):
+            self.add_expense([(self.user, '10.00')], [(self.user, '5.00'), (self.other, '5.00')], title=f'expense {i}')
+
+    def get_feed(self, num_splits: int) -> None:
+        with self.assertNumQueries(self.NUM_QUERIES):
+            response = self.client.get('/user/expense/', {'query': 'group_expense'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), num_splits)
+
+    def test_query_count_does_not_grow_with_rows(self):
+        rows = 5
+        self.add_expenses(rows)
+        self.get_feed(2 * rows)
+        self.add_expenses(2 * rows)  # 3 * rows in total
+        self.get_feed(2 * 3 * rows)
+
+
+@override_settings(GROUP_MEMBERS_CACHE={'ENABLED': False, 'CACHE_ALIAS': 'default', 'TIMEOUT': 300})
+class GroupContextQueryCountTest(GroupTestCase):
+    """
+    With the shared member cache disabled, the group of a group-scoped request is loaded once, and the ledger
+    version (the key of the shared cache) is never read on its own
+    """
+
+    def setUp(self):
+        super().setUp()
+        for i in range(3):
+            self.add_expense([(self.user, '10.00')], [(self.other, '10.00')], title=f'expense {i}')
+
+    def test_group_expense_list(self):
+        # the group, its members, the paid splits, the shared splits, the expenses
+        with self.assertNumQueries(5):
+            response = self.client.get(f'/expense/group/{self.group.id}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), 3)
+
+    def test_settle_up(self):
+        # the group, its members, the ledger balances
+        with self.assertNumQueries(3):
+            response = self.client.get(f'/expense/group/{self.group.id}/settle_up/')
+        self.assertEqual(response.status_code, 200)
+
+
+class GroupBalanceLedgerTest(GroupTestCase):
+    """
+    The ledger matches the balances recomputed from the expense history after every kind of expense write
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.third = User.objects.create_user(username='third', password='x')
+        self.group.members.add(self.third)
+
+    def assert_in_sync(self, expected: dict) -> None:
+        """
+        :param expected: A dict of user to balance (as a str) of the users with a non-zero balance
+        """
+        self.assertEqual(GroupBalanceLedger.verify(self.group), {})
+        balance_sheet = GroupBalanceLedger.get_balance_sheet(self.group.id)
+        self.assertEqual(balance_sheet, GroupBalanceLedger.compute_balance_sheet(self.group.id))
+        self.assertEqual(balance_sheet, {user.id: Decimal(balance) for user, balance in expected.items()})
+
+    def test_create_delete_import(self):
+        self.add_expense([(self.user, '90.00')], [(self.user, '30.00'), (self.other, '30.00'), (self.third, '30.00')])
+        expense = self.add_expense([(self.other, '25.50'), (self.third, '4.50')],
+                                   [(self.user, '10.00'), (self.other, '10.00'), (self.third, '10.00')])
+        self.assert_in_sync({self.user: '50.00', self.other: '-14.50', self.third: '-35.50'})
+
+        response = self.client.delete(f'/expense/group/{self.group.id}/id/{expense["id"]}/')
+        self.assertEqual(response.status_code, 200)
+        self.assert_in_sync({self.user: '60.00', self.other: '-30.00', self.third: '-30.00'})
+
+        response = self.client.post(f'/expense/group/{self.group.id}/import/', [
+            self.expense_payload([(self.other, '30.00')], [(self.user, '30.00')]),
+            self.expense_payload([(self.third, '12.00')], [(self.user, '6.00'), (self.third, '6.00')]),
+        ], format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assert_in_sync({self.user: '24.00', self.third: '-24.00'})  # other is settled: no ledger balance
+
+    def test_rebuild(self):
+        self.add_expense([(self.user, '20.00')], [(self.other, '20.00')])
+        GroupBalance.objects.filter(group=self.group, user=self.other).update(balance=Decimal('-5.00'))
+        self.assertEqual(GroupBalanceLedger.verify(self.group), {self.other.id: (Decimal('-5.00'), Decimal('-20.00'))})
+        version = GroupBalanceLedger.get_version(self.group.id)
+        self.assertEqual(GroupBalanceLedger.rebuild(self.group), {self.user.id: Decimal('20.00'),
+                                                                 self.other.id: Decimal('-20.00')})
+        self.assert_in_sync({self.user: '20.00', self.other: '-20.00'})
+        self.assertEqual(GroupBalanceLedger.get_version(self.group.id), version + 1)
+
+    def test_version_bumps_on_member_changes(self):
+        outsider = User.objects.create_user(username='outsider', password='x')
+        version = GroupBalanceLedger.get_version(self.group.id)
+        response = self.client.patch(f'/user/group/{self.group.id}/', {'members': [outsider.id]}, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(GroupBalanceLedger.get_version(self.group.id), version + 1)
+        response = self.client.delete(f'/user/group/{self.group.id}/', {'members': [outsider.id]}, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(GroupBalanceLedger.get_version(self.group.id), version + 2)
+        self.assertNotIn(outsider.id, self.group.members.values_list('id', flat=True))
+
+
+@override_settings(EXPENSE_IMPORT={'MAX_ITEMS': 10_000, 'CHUNK_SIZE': 50})
+class GroupExpenseImportTest(GroupTestCase):
+    """
+    A mixed batch (valid and invalid expenses) imported over several chunks
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.third = User.objects.create_user(username='third', password='x')
+        self.outsider = User.objects.create_user(username='outsider', password='x')
+        self.group.members.add(self.third)
+
+    def build_item(self, index: int) -> dict:
+        members = [self.user, self.other, self.third]
+        payer = members[index % 3]
+        if index % 10 == 3:  # invalid: the splits do not add up to the amount
+            item = self.expense_payload([(payer, '9.00')], [(self.user, '3.00'), (self.other, '3.00')])
+        elif index % 10 == 7:  # invalid: a participant is not a member
+            item = self.expense_payload([(payer, '8.00')], [(self.outsider, '8.00')])
+        else:
+            amount = 100 * (index + 1)  # cents
+            sharers = members if index % 2 else members[:2]
+            shares = [amount // len(sharers)] * len(sharers)
+            shares[0] += amount - sum(shares)  # the first sharer takes the remainder
+            item = self.expense_payload([(payer, Decimal(amount).scaleb(-2))],
+                                        [(user, Decimal(share).scaleb(-2)) for user, share in zip(sharers, shares)])
+        item['title'] = f'import {index}'
+        return item
+
+    def test_mixed_batch(self):
+        items = [self.build_item(index) for index in range(207)]
+        response = self.client.post(f'/expense/group/{self.group.id}/import/', items, format='json')
+        self.assertEqual(response.status_code, 207, response.content)  # multi-status: some are invalid
+        result = response.json()
+        invalid = [index for index in range(207) if index % 10 in (3, 7)]
+        self.assertEqual([error['index'] for error in result['errors']], invalid)
+        self.assertEqual([created['index'] for created in result['created']],
+                         [index for index in range(207) if index not in invalid])
+        self.assertEqual(result['num_created'], 207 - len(invalid))
+
+        # the rows: every created expense with its own splits, pointing back at it and its group
+        group_expenses = GroupExpense.objects.in_bulk([created['id'] for created in result['created']])
+        self.assertEqual(GroupExpense.objects.filter(group=self.group).count(), result['num_created'])
+        for created in result['created']:
+            item, group_expense = items[created['index']], group_expenses[created['id']]
+            self.assertEqual((group_expense.title, group_expense.amount, group_expense.created_by_id),
+                             (item['title'], Decimal(item['amount']), self.user.id))
+            for field_name, split_model in (('paid_by', ExpensePaidBy), ('shared_by', ExpenseSharedBy)):
+                expected = sorted((split['user'], Decimal(split['amount'])) for split in item[field_name])
+                splits = getattr(group_expense, field_name)
+                self.assertEqual(sorted(splits.values_list('user_id', 'amount')), expected)
+                self.assertEqual(sorted(split_model.objects.filter(expense=group_expense, group=self.group)
+                                        .values_list('user_id', 'amount')), expected)
+        self.assertEqual(ExpensePaidBy.objects.count(), sum(len(items[c['index']]['paid_by'])
+                                                            for c in result['created']))
+        self.assertEqual(ExpenseSharedBy.objects.count(), sum(len(items[c['index']]['shared_by'])
+                                                              for c in result['created']))
+
+        # the ledger
+        self.assertEqual(GroupBalanceLedger.verify(self.group), {})
+        expected = {}
+        for created in result['created']:
+            for split in items[created['index']]['paid_by']:
+                expected[split['user']] = expected.get(split['user'], 0) + Decimal(split['amount'])
+            for split in items[created['index']]['shared_by']:
+                expected[split['user']] = expected.get(split['user'], 0) - Decimal(split['amount'])
+        self.assertEqual(GroupBalanceLedger.get_balance_sheet(self.group.id),
+                         {user_id: balance for user_id, balance in expected.items() if balance != 0})
+
+
+class ExpenseFeedPaginationTest(GroupTestCase):
+    """
+    The keyset pagination of the expense feed (GET user/expense/?limit=...&cursor=...)
+    """
+
+    def setUp(self):
+        super().setUp()
+        for i in range(7):  # a paid and a shared row each: same expense id, same created_at
+            self.add_expense([(self.user, '10.00')], [(self.user, '4.00'), (self.other, '6.00')], title=f'group {i}')
+        for i in range(5):
+            response = self.client.post('/expense/user/', {'title': f'user {i}', 'description': 'test',
+                                                           'amount': '3.00', 'paid_to': self.other.id})
+            self.assertEqual(response.status_code, 201, response.content)
+        # all but the latest 2 expenses share the same created_at: the pages have to be split within the ties
+        expense_ids = list(Expense.objects.order_by('id').values_list('id', flat=True))
+        Expense.objects.filter(id__in=expense_ids[:-2]).update(created_at=timezone.now() - timezone.timedelta(days=1))
+
+    @staticmethod
+    def entry(row: dict) -> tuple:
+        return row['expense_id'], row['expense_amount']
+
+    def walk(self, limit: int) -> list:
+        """
+        :return: The rows of all the pages, following the next links
+        """
+        rows, url, params = [], '/user/expense/', {'limit': limit}
+        while url:
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, 200)
+            page = response.json()
+            self.assertLessEqual(len(page['results']), limit)
+            rows.extend(page['results'])
+            url, params = page['next'], None
+        return rows
+
+    def test_pages_have_no_duplicates_or_gaps(self):
+        unpaginated = self.client.get('/user/expense/').json()
+        self.assertEqual(len(unpaginated), 2 * 7 + 5)
+        for limit in (1, 2, 3, 5, 19, 50):
+            rows = self.walk(limit)
+            entries = [self.entry(row) for row in rows]
+            self.assertEqual(len(entries), len(set(entries)), f'duplicates with limit={limit}')
+            self.assertEqual(set(entries), {self.entry(row) for row in unpaginated}, f'gaps with limit={limit}')
+            self.assertEqual([row['created_at'] for row in rows],
+                             sorted((row['created_at'] for row in rows), reverse=True))
+
+    def test_unpaginated_response_is_unchanged(self):
+        response = self.client.get('/user/expense/')
+        self.assertEqual(response.status_code, 200)
+        rows = response.json()
+        self.assertIsInstance(rows, list)  # neither limit nor cursor: the whole history, not a page
+        self.assertEqual(len(rows), 2 * 7 + 5)
+        self.assertEqual(set(rows[0].keys()),
+                         {'expense_id', 'expense_amount', 'title', 'description', 'created_at', 'created_by'})
+        self.assertEqual([row['created_at'] for row in rows],
+                         sorted((row['created_at'] for row in rows), reverse=True))
+        # the same rows, as served by the paginated feed
+        paginated = self.walk(limit=4)
+        self.assertEqual(sorted(rows, key=self.entry), sorted(paginated, key=self.entry))
+
+
+class SettlementTestMixin:
+
+    def assert_settles(self, balance_sheet: dict, transactions: list) -> None:
+        """
+        Asserts that executing the transactions brings every balance of the sheet to zero
+        """
+        balances = dict(balance_sheet)
+        for transaction in transactions:
+            self.assertGreater(transaction.amount, 0)
+            balances[transaction._from] = balances.get(transaction._from, 0) + transaction.amount
+            balances[transaction.to] = balances.get(transaction.to, 0) - transaction.amount
+        self.assertEqual({user_id: balance for user_id, balance in balances.items() if balance != 0}, {})
+
+    @staticmethod
+    def random_balance_sheet(rng: random.Random, num_users: int) -> dict:
+        """
+        :return: A dict of user to balance mapping (small amounts: many zero-sum subsets), summing up to zero
+        """
+        while True:
+            balances = [rng.choice([-1, 1]) * rng.randint(1, 6) * 5 for _ in range(num_users - 1)]
+            if sum(balances) != 0:
+                balances.append(-sum(balances))
+                return {user_id: Decimal(balance) for user_id, balance in enumerate(balances, start=1)}
+
+    @staticmethod
+    def min_num_transactions(balances: list) -> int:
+        """
+        Brute force: the N users need (N - K) transactions, K being the max number of blocks of a partition of
+        the users whose blocks all sum up to zero. Tries every partition.
+
+        :param balances: The non-zero balances
+        """
+        def max_blocks(items: list, blocks: list) -> int:
+            if not items:
+                return len(blocks) if all(sum(block) == 0 for block in blocks) else 0
+            head, tail = items[0], items[1:]
+            best = max_blocks(tail, blocks + [[head]])
+            for i in range(len(blocks)):
+                best = max(best, max_blocks(tail, blocks[:i] + [blocks[i] + [head]] + blocks[i + 1:]))
+            return best
+        return len(balances) - max_blocks(balances, [])
+
+
+class MinTransactionSettlementStrategyTest(SettlementTestMixin, SimpleTestCase):
+
+    def test_min_num_of_transactions(self):
+        rng = random.Random(7)
+        for _ in range(200):
+            balance_sheet = self.random_balance_sheet(rng, rng.randint(2, 8))
+            transactions = MinTransactionSettlementStrategy().settle_up(balance_sheet)
+            self.assert_settles(balance_sheet, transactions)
+            self.assertEqual(len(transactions), self.min_num_transactions(list(balance_sheet.values())),
+                             balance_sheet)
+
+    def test_fallback_beyond_max_group_size(self):
+        balance_sheet = self.random_balance_sheet(random.Random(11), 12)
+        with self.assertLogs('splitwise.strategies', 'INFO') as logs:
+            transactions = MinTransactionSettlementStrategy(max_group_size=4).settle_up(balance_sheet)
+        self.assertIn('falling back to greedy: Too many users', logs.output[0])
+        self.assert_settles(balance_sheet, transactions)
+
+    def test_fallback_beyond_time_budget(self):
+        balance_sheet = self.random_balance_sheet(random.Random(11), 12)
+        with self.assertLogs('splitwise.strategies', 'INFO') as logs:
+            transactions = MinTransactionSettlementStrategy(time_budget=-1).settle_up(balance_sheet)
+        self.assertIn('falling back to greedy: Exceeded the time budget', logs.output[0])
+        self.assert_settles(balance_sheet, transactions)
+
+
+@override_settings(SETTLEMENT={**settings.SETTLEMENT, 'OFFLOAD_MAX_WORKERS': 1, 'OFFLOAD_MAX_QUEUED': 0})
+class ProcessPoolSettlementStrategyTest(SettlementTestMixin, SimpleTestCase):
+    """
+    The min-transactions settlement offloaded to a (real) pool of one worker
+    """
+
+    def setUp(self):
+        self.balance_sheet = self.random_balance_sheet(random.Random(3), 8)
+        self.addCleanup(SettlementProcessPool.reset)
+
+    def get_strategy(self, timeout: float = 30) -> ProcessPoolSettlementStrategy:
+        return ProcessPoolSettlementStrategy(MinTransactionSettlementStrategy(), MinTransactionSettlementStrategy(),
+                                             min_group_size=2, timeout=timeout)
+
+    def test_offloaded(self):
+        strategy = self.get_strategy()
+        transactions = strategy.settle_up(self.balance_sheet)
+        self.assertFalse(fell_back(strategy))
+        self.assert_settles(self.balance_sheet, transactions)
+        self.assertEqual(len(transactions), self.min_num_transactions(list(self.balance_sheet.values())))
+
+    def test_fallback_on_saturated_pool(self):
+        self.get_strategy().settle_up(self.balance_sheet)  # starts the pool
+        self.assertTrue(SettlementProcessPool.slots.acquire(blocking=False))  # taking the only slot
+        try:
+            strategy = self.get_strategy()
+            with self.assertLogs('splitwise.executors', 'WARNING') as logs:
+                transactions = strategy.settle_up(self.balance_sheet)
+        finally:
+            SettlementProcessPool.slots.release()
+        self.assertIn('the pool is saturated', logs.output[0])
+        self.assertTrue(fell_back(strategy))
+        self.assert_settles(self.balance_sheet, transactions)
+
+    def test_fallback_on_timeout(self):
+        strategy = self.get_strategy(timeout=0)
+        with self.assertLogs('splitwise.executors', 'WARNING'):
+            transactions = strategy.settle_up(self.balance_sheet)
+        self.assertTrue(fell_back(strategy))
+        self.assert_settles(self.balance_sheet, transactions)
+
+
+class PrometheusMetricsAccessTest(TestCase):
+    """
+    The metrics endpoint is never public: the scraper's token if one is set, the admins otherwise
+    """
+
+    def setUp(self):
+        self.admin = User.objects.create_user(username='admin', password='x', is_staff=True)
+        self.user = User.objects.create_user(username='user', password='x')
+
+    def get_metrics(self, authorization: str = None) -> int:
+        headers = {'Authorization': authorization} if authorization else {}
+        return self.client.get('/metrics/', headers=headers).status_code
+
+    def test_admins_only_without_token(self):
+        self.assertEqual(self.get_metrics(), 403)
+        self.assertEqual(self.get_metrics(f'Bearer {AccessToken.for_user(self.user)}'), 403)
+        self.assertEqual(self.get_metrics('Bearer not-a-jwt'), 403)
+        self.assertEqual(self.get_metrics(f'Bearer {AccessToken.for_user(self.admin)}'), 200)
+        self.client.force_login(self.admin)
+        self.assertEqual(self.get_metrics(), 200)
+
+    @override_settings(INSTRUMENTATION={**settings.INSTRUMENTATION, 'METRICS_TOKEN': 'scrape-token'})
+    def test_token(self):
+        self.assertEqual(self.get_metrics(), 401)
+        self.assertEqual(self.get_metrics('Bearer wrong-token'), 401)
+        self.assertEqual(self.get_metrics(f'Bearer {AccessToken.for_user(self.admin)}'), 401)
+        self.assertEqual(self.get_metrics('Bearer scrape-token'), 200)
+
+
+class ProfilingMiddlewareTest(TestCase):
+    """
+    Profiling a request never changes its response, even if the view raises
+    """
+
+    def setUp(self):
+        self.output_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.output_dir.cleanup)
+        self.admin = User.objects.create_user(username='admin', password='x', is_staff=True)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.admin)}')
+
+    def get(self, path: str, output_format: str = None):
+        headers = {'X-Profile': output_format} if output_format else {}
+        with self.settings(PROFILING={**settings.PROFILING, 'OUTPUT_DIR': self.output_dir.name}):
+            return self.client.get(path, headers=headers)
+
+    def test_profiled_response_is_unchanged(self):
+        for path in ('/user/expense/?query=bogus',  # the view raises: handled by ExceptionMiddleware
+                     '/user/expense/?query=all'):
+            unprofiled = self.get(path)
+            for output_format in ('pstats', 'text', 'collapsed'):
+                profiled = self.get(path, output_format)
+                self.assertEqual((profiled.status_code, profiled.content),
+                                 (unprofiled.status_code, unprofiled.content), f'{path} {output_format}')
+                self.assertTrue(os.path.isfile(os.path.join(self.output_dir.name, profiled['X-Profile-File'])))
+        self.assertEqual(unprofiled.status_code, 200)
+        self.assertEqual(self.get('/user/expense/?query=bogus').status_code, 400)
+
+    def test_inline_profile(self):
+        response = self.client.get('/user/expense/?query=bogus', headers={'X-Profile': 'text'})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'cumulative', response.content)
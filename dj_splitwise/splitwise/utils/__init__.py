@@ -1,3 +1,3 @@
-from .classes import Transaction
-from .functions import build_balance_sheet, heap_push, heap_pop, is_smaller_balance
-from .functions import validate_balance_sheet
+from .classes import Transaction, SettlementQueue, BalanceSheet
+from .functions import build_balance_sheet, heap_push, heap_pop, is_smaller_balance
+from .functions import validate_balance_sheet
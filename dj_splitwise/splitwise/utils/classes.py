@@ -1,18 +1,136 @@
-from decimal import Decimal
-
-
-class Transaction:
-    def __init__(self, _from: int, to: int, amount: Decimal):
-        self._from = _from
-        self.to = to
-        self.amount = amount
-
-    def to_dict(self):
-        return {
-            '_from': self._from,
-            'to': self.to,
-            'amount': self.amount
-        }
-
-    def __str__(self):
-        return f'Transaction[user(id={self._from}) -> user(id={self.to})] = {self.amount}'
+import heapq
+from array import array
+from decimal import Decimal
+from typing import Iterable, Union
+from rest_framework.exceptions import ValidationError
+
+
+class Transaction:
+    def __init__(self, _from: int, to: int, amount: Decimal):
+        self._from = _from
+        self.to = to
+        self.amount = amount
+
+    def to_dict(self):
+        return {
+            '_from': self._from,
+            'to': self.to,
+            'amount': self.amount
+        }
+
+    def __str__(self):
+        return f'Transaction[user(id={self._from}) -> user(id={self.to})] = {self.amount}'
+
+
+class SettlementQueue:
+    """
+    Priority queue of (user_id, amount) pairs, the largest amount first.
+    Backed by heapq: the entries are stored as (-amount, user_id) key tuples, hence compared in C.
+    Ties are broken by the smaller user_id.
+    """
+    def __init__(self, user_amounts: Iterable[tuple] = ()):
+        """
+        :param user_amounts: (user_id, amount) pairs; the heap is built in-place in O(n)
+        """
+        self.heap = [(-amount, user_id) for user_id, amount in user_amounts]
+        heapq.heapify(self.heap)
+
+    def push(self, user_id: int, amount) -> None:
+        heapq.heappush(self.heap, (-amount, user_id))
+
+    def pop(self) -> tuple:
+        amount, user_id = heapq.heappop(self.heap)
+        return user_id, -amount
+
+    def peek(self) -> tuple:
+        amount, user_id = self.heap[0]
+        return user_id, -amount
+
+    def replace(self, user_id: int, amount) -> None:
+        """Pops the largest amount and pushes the given pair with a single sift"""
+        heapq.heapreplace(self.heap, (-amount, user_id))
+
+    def __len__(self):
+        return len(self.heap)
+
+
+class BalanceSheet:
+    """
+    Compact balance sheet: parallel arrays of the user ids and their balances in minor units (e.g. cents).
+    The Decimal balances are converted to integers once, hence the settlement strategies work on plain ints
+    and convert back to Decimal only while emitting the transactions.
+
+    Supports the read-only part of the dict interface: keys(), values(), items() and len()
+    """
+    def __init__(self, user_ids: Iterable[int] = (), balances: Iterable[int] = (), decimal_places: int = 2):
+        """
+        :param user_ids: The user ids
+        :param balances: The balance of each user (same order as user_ids) in minor units
+        :param decimal_places: Number of decimal places of the major unit
+        """
+        self.user_ids = array('q', user_ids)
+        self.balances = array('q', balances)
+        self.decimal_places = decimal_places
+
+    @classmethod
+    def from_dict(cls, balance_sheet: dict, decimal_places: int = 2) -> 'BalanceSheet':
+        """
+        :param balance_sheet: A dict of user to Decimal balance mapping
+        :param decimal_places: Number of decimal places of the balances
+        :return: BalanceSheet
+        """
+        balances = array('q')
+        for balance in balance_sheet.values():
+            minor_units = Decimal(balance).scaleb(decimal_places)
+            if minor_units != minor_units.to_integral_value():
+                raise ValidationError(f'Invalid balance sheet! Balance {balance} has more than '
+                                      f'{decimal_places} decimal places')
+            balances.append(int(minor_units))
+        return cls(balance_sheet.keys(), balances, decimal_places)
+
+    @classmethod
+    def of(cls, balance_sheet: Union[dict, 'BalanceSheet']) -> 'BalanceSheet':
+        """Returns the given balance sheet as a BalanceSheet, converting it if it is a dict"""
+        if isinstance(balance_sheet, BalanceSheet):
+            return balance_sheet
+        return cls.from_dict(balance_sheet)
+
+    def pack(self) -> tuple:
+        """
+        :return: A compact picklable form of the sheet, e.g. to send it to another process:
+        (raw bytes of the user ids, raw bytes of the balances, decimal places)
+        """
+        return self.user_ids.tobytes(), self.balances.tobytes(), self.decimal_places
+
+    @classmethod
+    def unpack(cls, packed: tuple) -> 'BalanceSheet':
+        """Returns the BalanceSheet of the given 'pack()' output"""
+        user_ids, balances, decimal_places = packed
+        sheet = cls(decimal_places=decimal_places)
+        sheet.user_ids.frombytes(user_ids)
+        sheet.balances.frombytes(balances)
+        return sheet
+
+    def to_decimal(self, minor_units: int) -> Decimal:
+        return Decimal(minor_units).scaleb(-self.decimal_places)
+
+    def to_minor_units(self, amount: Decimal) -> int:
+        return int(amount.scaleb(self.decimal_places))
+
+    def to_dict(self) -> dict:
+        return {user_id: self.to_decimal(balance) for user_id, balance in self.items()}
+
+    def keys(self):
+        return self.user_ids
+
+    def values(self):
+        return self.balances
+
+    def items(self):
+        return zip(self.user_ids, self.balances)
+
+    def __len__(self):
+        return len(self.user_ids)
+
+    def __str__(self):
+        return str(self.to_dict())
@@ -1,83 +1,103 @@
-from rest_framework.views import APIView
-from rest_framework.generics import ListAPIView, RetrieveUpdateDestroyAPIView
-from rest_framework.request import Request
-from rest_framework.response import Response
-from rest_framework import status
-from .models import User, Expense, UserExpense, Group
-from .serializers import UserSerializer, ExpenseSerializer, UserExpenseSerializer
-from .permissions import IsOwner, IsGroupAdmin
-from rest_framework.permissions import IsAdminUser
-from django.contrib.auth.hashers import make_password
-from django.shortcuts import get_object_or_404
-
-
-class ProfileAPIView(APIView):
-    """
-    This is an example of how you should not handle permissions.
-    - Though the 'permission_classes' is overridden, but it is not being called
-
-    Check '.viewsets.ProfileViewSet'
-    """
-    queryset = User.objects.all()  # Not overridden: parent has no such attribute
-    serializer_class = UserSerializer  # Not overridden
-    permission_classes = [IsOwner]
-
-    def get(self, request: Request) -> Response:
-        user = self.queryset.get(pk=request.user.id)
-        return Response(data=UserSerializer(user).data, status=status.HTTP_200_OK)
-
-    def patch(self, request: Request) -> Response:
-        deserialized = UserSerializer(data=request.data, partial=True)
-        if not deserialized.is_valid():
-            return Response(data=deserialized.errors, status=status.HTTP_400_BAD_REQUEST)
-        instance = request.user
-        if 'password' in deserialized.validated_data:
-            print(':: LOG :: ProfileAPIView :: patch | password :: before', deserialized.validated_data['password'])
-            deserialized.validated_data['password'] = make_password(deserialized.validated_data['password'])
-            print(':: LOG :: ProfileAPIView :: patch | password :: after', deserialized.validated_data['password'])
-        instance = deserialized.update(instance, deserialized.validated_data)
-        return Response(data=UserSerializer(instance).data, status=status.HTTP_200_OK)
-
-    def get_object(self):  # Not overridden
-        pass
-
-
-class UserListAPIView(ListAPIView):
-    queryset = User.objects.all()
-    serializer_class = UserSerializer
-    permission_classes = [IsAdminUser]
-
-
-class UserRetrieveUpdateDestroyAPIView(RetrieveUpdateDestroyAPIView):
-    queryset = User.objects.all()
-    serializer_class = UserSerializer
-    permission_classes = [IsAdminUser]
-
-    def perform_update(self, serializer):
-        if 'password' in serializer.validated_data:  # Updating Password
-            print(':: LOG :: UserRetrieveUpdateDestroyAPIView :: perform_update | password')
-            print(':: Compare :: self.get_object() is serializer.instance ::', self.get_object() is serializer.instance)
-            print(':: LOG :: self.get_object() ::', self.get_object())
-            print(':: LOG :: serializer.instance ::', serializer.instance)
-            # serializer.instance.set_password(serializer.validated_data['password'])  # DOESN'T WORK THIS WAY
-            serializer.save(password=make_password(serializer.validated_data['password']))
-        else:
-            serializer.save()
-
-
-class ExpenseListAPIView(ListAPIView):
-    queryset = Expense.objects.all()
-    serializer_class = ExpenseSerializer
-    permission_classes = [IsAdminUser]
-
-
-class UserExpenseListAPIView(ListAPIView):
-    queryset = UserExpense.objects.all()
-    serializer_class = UserExpenseSerializer
-
-
-class AddGroupMemberAPIView(APIView):
-    queryset = Group.objects.all()
-    permission_classes = [IsGroupAdmin]
-
-
+import logging
+from rest_framework.views import APIView
+from rest_framework.generics import ListAPIView, RetrieveUpdateDestroyAPIView
+from rest_framework.request import Request
+from rest_framework.response import Response
+from rest_framework import status
+from .models import User, Expense, UserExpense, Group
+from .serializers import UserSerializer, ExpenseSerializer, UserExpenseSerializer
+from .permissions import IsOwner, IsGroupAdmin, is_staff_request
+from rest_framework.permissions import IsAdminUser
+from django.contrib.auth.hashers import make_password
+from django.shortcuts import get_object_or_404
+from django.conf import settings
+from django.http import HttpRequest, HttpResponse
+from django.utils.crypto import constant_time_compare
+from django.views.decorators.http import require_GET
+from .instrumentation import MetricsRegistry
+
+logger = logging.getLogger(__name__)
+
+
+class ProfileAPIView(APIView):
+    """
+    This is an example of how you should not handle permissions.
+    - Though the 'permission_classes' is overridden, but it is not being called
+
+    Check '.viewsets.ProfileViewSet'
+    """
+    queryset = User.objects.all()  # Not overridden: parent has no such attribute
+    serializer_class = UserSerializer  # Not overridden
+    permission_classes = [IsOwner]
+
+    def get(self, request: Request) -> Response:
+        user = self.queryset.get(pk=request.user.id)
+        return Response(data=UserSerializer(user).data, status=status.HTTP_200_OK)
+
+    def patch(self, request: Request) -> Response:
+        deserialized = UserSerializer(data=request.data, partial=True)
+        if not deserialized.is_valid():
+            return Response(data=deserialized.errors, status=status.HTTP_400_BAD_REQUEST)
+        instance = request.user
+        if 'password' in deserialized.validated_data:
+            deserialized.validated_data['password'] = make_password(deserialized.validated_data['password'])
+            logger.info('ProfileAPIView: password changed: user=%s', instance.id)  # never logging the password
+        instance = deserialized.update(instance, deserialized.validated_data)
+        return Response(data=UserSerializer(instance).data, status=status.HTTP_200_OK)
+
+    def get_object(self):  # Not overridden
+        pass
+
+
+class UserListAPIView(ListAPIView):
+    queryset = User.objects.all()
+    serializer_class = UserSerializer
+    permission_classes = [IsAdminUser]
+
+
+class UserRetrieveUpdateDestroyAPIView(RetrieveUpdateDestroyAPIView):
+    queryset = User.objects.all()
+    serializer_class = UserSerializer
+    permission_classes = [IsAdminUser]
+
+    def perform_update(self, serializer):
+        if 'password' in serializer.validated_data:  # Updating Password
+            logger.info('UserRetrieveUpdateDestroyAPIView: password changed: user=%s', serializer.instance.id)
+            # NOTE: self.get_object() is not serializer.instance: every call fetches a new obj
+            # serializer.instance.set_password(serializer.validated_data['password'])  # DOESN'T WORK THIS WAY
+            serializer.save(password=make_password(serializer.validated_data['password']))
+        else:
+            serializer.save()
+
+
+class ExpenseListAPIView(ListAPIView):
+    queryset = Expense.objects.all()
+    serializer_class = ExpenseSerializer
+    permission_classes = [IsAdminUser]
+
+
+class UserExpenseListAPIView(ListAPIView):
+    queryset = UserExpense.objects.all()
+    serializer_class = UserExpenseSerializer
+
+
+class AddGroupMemberAPIView(APIView):
+    queryset = Group.objects.all()
+    permission_classes = [IsGroupAdmin]
+
+
+@require_GET
+def prometheus_metrics(request: HttpRequest) -> HttpResponse:
+    """
+    The scrape endpoint of the in-process metrics registry: never public, the view names and timings leak
+    the shape of the traffic.
+    A plain Django view: the Prometheus scraper does not authenticate with JWT, hence it sends the static token of
+    settings.INSTRUMENTATION['METRICS_TOKEN']; if no token is set, the endpoint is open to the admins only (is_staff)
+    """
+    token = settings.INSTRUMENTATION['METRICS_TOKEN']
+    if token:
+        if not constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}'):
+            return HttpResponse(status=status.HTTP_401_UNAUTHORIZED)
+    elif not is_staff_request(request):
+        return HttpResponse(status=status.HTTP_403_FORBIDDEN)
+    return HttpResponse(MetricsRegistry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
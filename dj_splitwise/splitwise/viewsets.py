@@ -1,330 +1,549 @@
-from django.db.models import F, Q
-from django.shortcuts import get_object_or_404
-from rest_framework import status
-from rest_framework.decorators import action
-from rest_framework.permissions import IsAuthenticated
-from rest_framework.request import Request
-from rest_framework.response import Response
-from rest_framework.viewsets import ModelViewSet, ViewSet
-
-from .enums import Query, SettlementType
-from .factories import SettlementStrategyFactory
-from .models import User, UserExpense, Group, GroupExpense, ExpensePaidBy, ExpenseSharedBy
-from .permissions import IsGroupAdmin, IsGroupAdminOrMember, IsGroupAdminOrExpenseCreator, HasGroupAccess
-from .serializers import ExpenseSerializer
-from .serializers import QueryUserExpenseSerializer, QueryGroupExpenseSerializer
-from .serializers import UserSerializer, UserExpenseSerializer, GroupSerializer, GroupExpenseSerializer
-from .utils import build_balance_sheet
-
-
-class CreateUserViewSet(ModelViewSet):
-    queryset = User.objects.all()
-    serializer_class = UserSerializer
-
-
-class UserExpenseViewSet(ModelViewSet):
-    queryset = UserExpense.objects.all()
-    serializer_class = UserExpenseSerializer
-    permission_classes = [IsAuthenticated]
-
-    # Overridden
-    def perform_create(self, serializer):
-        # Added additional info while saving the instance
-        serializer.save(paid_by=self.request.user, created_by=self.request.user)
-
-
-class GroupViewSet(ModelViewSet):
-    queryset = Group.objects.all()
-    serializer_class = GroupSerializer
-    # NOTE: IsGroupAdmin is an object level permission
-    permission_classes = [IsAuthenticated, IsGroupAdmin]
-
-    # Overridden
-    def perform_create(self, serializer):
-        serializer.save(created_by=self.request.user)
-
-    """
-    CUSTOM ACTIONS:
-    
-    'detail' argument:
-    - True: indicates the specified action is for a single instance of the resource
-    - False: indicated the specified action is applicable to the entire resource collection
-    
-    Ref: https://djangocentral.com/how-to-use-action-decorator-in-django-rest-framework/#:~:text=In%20Django%20Rest%20Framework%2C%20the%20detail%20argument%20in,or%20to%20the%20entire%20resource%20collection%20%28list%20view%29.
-    """
-
-    @action(methods=['patch'], detail=True)
-    def add_member(self, request: Request, pk: int) -> Response:
-        deserialized = GroupSerializer(data=request.data, partial=True)
-        if not deserialized.is_valid():
-            return Response(data=deserialized.errors, status=status.HTTP_400_BAD_REQUEST)
-        group = self.get_object()  # returns the resource obj identified by the lookup field 'pk'
-        members = deserialized.validated_data.get('members', [])
-        # users = [get_object_or_404(User, pk=user_id) for user_id in members]
-        # group.members.add(*users)  # Adding multiple users
-        group.members.add(*members)
-        group.save()
-        return Response(data=GroupSerializer(group).data, status=status.HTTP_200_OK)
-
-    @action(methods=['put'], detail=True)
-    def update_name(self, request: Request, pk: int) -> Response:
-        deserialized = GroupSerializer(data=request.data)
-        if not deserialized.is_valid():
-            return Response(data=deserialized.errors, status=status.HTTP_400_BAD_REQUEST)
-        group = self.get_object()  # group instance identified by 'pk'
-        group.name = deserialized.validated_data['name']
-        group.save()
-        return Response(data=GroupSerializer(group).data, status=status.HTTP_200_OK)
-
-    @action(methods=['delete'], detail=True)
-    def remove_member(self, request: Request, pk: int) -> Response:
-        print(':: LOG :: GroupViewSet | remove_member is called ...')
-        deserialized = self.get_serializer(data=request.data, partial=True)
-        if not deserialized.is_valid():
-            return Response(data=deserialized.errors, status=status.HTTP_400_BAD_REQUEST)
-        instance = self.get_object()
-        users = deserialized.validated_data.get('members', [])
-        instance.members.remove(*users)  # breaking the association with the group
-        return Response(data={
-            'removed_members': [user.id for user in users],
-            'group': self.get_serializer(instance).data
-        }, status=status.HTTP_200_OK)
-
-    # Overridden
-    def get_permissions(self):
-        if self.action == 'retrieve':
-            permission_classes = [HasGroupAccess]
-        else:
-            permission_classes = GroupViewSet.permission_classes
-        return [permission() for permission in permission_classes]
-
-
-class ListCreateGroupExpenseViewSet(ModelViewSet):
-    queryset = GroupExpense.objects.all()
-    serializer_class = GroupExpenseSerializer
-    permission_classes = [IsGroupAdminOrMember]
-
-    """
-    LEARNING:
-    - The view obj (self) has access to both 'request' and 'group_id' owing to the below attributes it posses:
-      -- self.request
-      -- self.kwargs['group_id']
-    
-    Ref: Stackoverflow: Django REST Framework viewset per-action permissions
-    - https://stackoverflow.com/questions/19313314/django-rest-framework-viewset-per-action-permissions
-    
-    Ref: Object level permissions
-    - https://www.django-rest-framework.org/api-guide/permissions/#:~:text=If%20you%27re%20writing%20your%20own%20views%20and%20want,the%20point%20at%20which%20you%27ve%20retrieved%20the%20object.
-    
-    """
-
-    # Overridden
-    def create(self, request: Request, group_id: int) -> Response:
-        print(':: LOG :: GroupExpenseViewSet | create :: group_id:', self.kwargs['group_id'])
-        deserialized = self.serializer_class(data=request.data)
-        if not deserialized.is_valid():
-            return Response(data=deserialized.errors, status=status.HTTP_400_BAD_REQUEST)
-        # Passing additional data to the save: they will become part of the validated_data (check BaseSerializer)
-        group_expense = deserialized.save(created_by=request.user, group=get_object_or_404(Group, pk=group_id))
-        return Response(data=GroupExpenseSerializer(group_expense).data, status=status.HTTP_201_CREATED)
-
-    # Overridden
-    def perform_create(self, serializer):  # *** IS NOT BEING EXECUTED BECAUSE WE HAVE OVERRIDDEN serializer.create()
-        print(':: LOG :: GroupExpenseViewSet :: perform_create')
-        group_id = self.kwargs['group_id']
-        group = get_object_or_404(Group, pk=group_id)
-        print('group_id:', group.id)
-        print(':: LOG :: END')
-        serializer.save(created_by=self.request.user, group=group)
-
-    # Overridden
-    def list(self, request, group_id: int) -> Response:
-        queryset = self.queryset.filter(group_id=group_id)
-        return Response(data=GroupExpenseSerializer(queryset, many=True).data, status=status.HTTP_200_OK)
-
-
-class RetrieveUpdateDestroyGroupExpenseViewSet(ModelViewSet):
-    queryset = GroupExpense.objects.all()
-    serializer_class = GroupExpenseSerializer
-
-    # permission_classes = [IsGroupAdminOrMember]
-
-    # Overridden
-    def retrieve(self, request, group_id: int, pk: int) -> Response:
-        # ** NOTE: filter() is expected to yield multiple records and hence use 'many=True' in the serializer
-        # .filter(group_id=group_id, pk=pk)  # many=True
-        group_expense = get_object_or_404(self.get_queryset(), group_id=group_id, pk=pk)
-        return Response(data=self.get_serializer(group_expense, many=False).data, status=status.HTTP_200_OK)
-
-    """
-    LEARNING:
-    - django.core.exceptions.ImproperlyConfigured: Cannot use the @action decorator on the following methods,
-    as they are existing routes: destroy
-    """
-
-    # ** NOT ALLOWED: existing route
-    # @action(methods=['delete'], detail=True, permission_classes=[IsGroupAdminOrMember])
-    # Overridden
-    def destroy(self, request, group_id: int, pk: int) -> Response:
-        pass
-
-    """
-    *** ISSUE:
-    - Permission class specified in the @action decorator is not being checked
-    - Stackoverflow:
-      -- https://stackoverflow.com/questions/60114466/django-drf-permission-classes-not-working/78998672#78998672
-    
-    READ MORE:
-    - ViewSets:
-      - https://www.django-rest-framework.org/api-guide/viewsets/
-    
-    """
-
-    # @action decorator is currently dormant
-    # @action(methods=['delete'], detail=True, permission_classes=[IsAuthenticated])
-    def del_expense(self, request: Request, group_id: int, pk: int) -> Response:
-        print(':: LOG :: RetrieveUpdateDestroyGroupExpenseViewSet | del_expense ::')
-        # group_expense = get_object_or_404(self.get_queryset(), group_id=group_id, pk=pk)
-        # print(':: self.get_object():', self.get_object())  # Uses default lookup field 'pk' to get the target object
-        # *** NOTE: calling self.get_object() will automatically trigger the permission class (if any) for object access
-        # - The permission class must override 'has_object_permission()'
-        group_expense = self.get_object()
-        group_expense.delete()  # *** CAUSES DB INTEGRITY ISSUE: Unable to handle deletion of related objects
-        return Response(data={'deleted': True, 'group_expense': self.get_serializer(group_expense).data},
-                        status=status.HTTP_200_OK)
-
-    """
-    LEARNING:
-    - Q. How to handle delete for a Model having ManyToMany relations in Django?
-      -- https://sl.bing.net/kaNLjcrqhGu
-    
-    """
-
-    def del_exp_related(self, request: Request, group_id: int, pk: int) -> Response:
-        instance = self.get_object()  # will return the target obj if the user has the required permissions
-        self.perform_destroy(instance)
-        # NOTE: Using ExpenseSerializer because the instance is now deleted and does not point to any group
-        return Response(data={'deleted': True, 'group_expense': ExpenseSerializer(instance).data},
-                        status=status.HTTP_200_OK)
-
-    # Overridden
-    def perform_destroy(self, instance):
-        # Deleting all the ManyToMany related fields associated with the group expense
-        paid_by = instance.paid_by.all()
-        for expense_paid_by in paid_by:
-            expense_paid_by.delete()
-        shared_by = instance.shared_by.all()
-        for expense_shared_by in shared_by:
-            expense_shared_by.delete()
-        # finally deleting the target
-        instance.delete()
-
-    # Overridden
-    def get_permissions(self):
-        if self.action == 'del_exp_related':  # 'del_expense':
-            permission_classes = [IsGroupAdminOrMember, IsGroupAdminOrExpenseCreator]
-        else:
-            permission_classes = [IsGroupAdminOrMember]
-        return [permission() for permission in permission_classes]
-
-
-class ProfileViewSet(ModelViewSet):
-    queryset = User.objects.all()
-    serializer_class = UserSerializer
-    permission_classes = [IsAuthenticated]
-
-    # Overridden
-    def get_queryset(self):
-        queryset = super().get_queryset()  # Ensuring queryset is refreshed; read doc str
-        return queryset.filter(id=self.request.user.id)
-
-    # Overridden
-    def get_object(self):
-        return self.get_queryset().first()
-
-
-class QueryExpenseViewSet(ViewSet):
-    permission_classes = [IsAuthenticated]
-
-    def query_user_expense(self, user: User):
-        return UserExpense.objects.filter(Q(paid_by=user) | Q(paid_to=user))
-
-    def query_group_expense_paid_by(self, user: User):
-        return ExpensePaidBy.objects.filter(user=user)
-
-    def query_group_expense_shared_by(self, user: User):
-        return ExpenseSharedBy.objects.filter(user=user)
-
-    def get_user_expense(self, user: User):
-        queryset = self.query_user_expense(user).order_by('created_at')
-        serialized = QueryUserExpenseSerializer(queryset, many=True, context={'requested_by': user})
-        return serialized.data
-
-    def get_group_expense(self, user: User):
-        queryset_1 = self.query_group_expense_paid_by(user).order_by('group_expense__created_at')
-        serialized_1 = QueryGroupExpenseSerializer(queryset_1, many=True, context={'is_owed': False})
-        queryset_2 = self.query_group_expense_shared_by(user).order_by('group_expense__created_at')
-        serialized_2 = QueryGroupExpenseSerializer(queryset_2, many=True, context={'is_owed': True})
-        return serialized_1.data + serialized_2.data
-
-    @action(methods=['get'], detail=False)
-    def get_expense(self, request: Request):
-        query = (request.query_params.get('query', 'all')).strip().lower()
-        query_type = Query(query)
-        if query_type == Query.USER_EXPENSE:
-            expense_data = self.get_user_expense(request.user)
-        elif query_type == Query.GROUP_EXPENSE:
-            expense_data = self.get_group_expense(request.user)
-        else:
-            expense_data = self.get_user_expense(request.user) + self.get_group_expense(request.user)
-        expense_data.sort(key=lambda data: data['created_at'], reverse=True)
-        return Response(data=expense_data, status=status.HTTP_200_OK)
-
-    def get_owed(self, request: Request):
-        pass
-
-
-class GroupSettleUpViewSet(ViewSet):
-    permission_classes = [IsGroupAdminOrMember]
-
-    def settle_up(self, request: Request, group_id: int) -> Response:
-        fields = ['user', 'expense_amount']
-        queryset_paid = (ExpensePaidBy.objects.filter(group_expense__group__id=group_id)
-                         .annotate(expense_amount=F('amount'))
-                         .values_list(*fields))
-        queryset_shared = (ExpenseSharedBy.objects.filter(group_expense__group__id=group_id)
-                           .annotate(expense_amount=-F('amount'))  # -ve sign indicates owed amount
-                           .values_list(*fields))
-        balance_sheet = build_balance_sheet(*queryset_paid, *queryset_shared)
-        # print(':: LOG :: GroupSettleUpViewSet | settle_up ::')
-        # print(':: balance_sheet ::', balance_sheet)
-        query_strategy = request.query_params.get('strategy', SettlementType.N_MINUS_1.value)
-        settlement_strategy = SettlementStrategyFactory.get_by_name(query_strategy)
-        transactions = settlement_strategy.settle_up(balance_sheet)
-        return Response(data=[transaction.to_dict() for transaction in transactions], status=status.HTTP_200_OK)
-
-
-"""
-LEARNINGS:
-
-Q. How to create a custom column in QuerySet in DRF?
-- https://www.bing.com/search?q=How+to+create+a+custom+column+in+QuerySet+in+DRF&qs=n&form=QBRE&sp=-1&ghc=1&lq=0&pq=how+to+create+a+custom+column+in+queryset+in+dr&sc=0-47&sk=&cvid=DF8CDD997C9D4D7381E092F9392BC245&ghsh=0&ghacc=0&ghpl=
-
-Passing context to the serializer while serializing queryset
-- https://sl.bing.net/hzT3Pyini56
-
-Combining QuerySet from two different base models
-- https://www.bing.com/search?pglt=163&q=How+to+combine+results+from+two+different+base+models+in+DRF&cvid=79f10d0898e849299d2846ebbe58470e&gs_lcrp=EgZjaHJvbWUyBggAEEUYOdIBCDcxMDNqMGoxqAIAsAIA&FORM=ANNTA1&PC=U531
-
-Q. How to make querysets returned from two different base models compatible for union?
-- https://www.bing.com/search?q=How+to+make+querysets+returned+from+two+different+base+models+compatible+for+union&qs=n&form=QBRE&sp=-1&ghc=1&lq=1&pq=how+to+make+querysets+returned+from+two+different+base+models+compatible+for+union&sc=1-82&sk=&cvid=E445EAB5C0664D1A97757B12BEC39728&ghsh=0&ghacc=0&ghpl=&showconv=0
-- https://docs.djangoproject.com/en/5.1/ref/models/querysets/#union
-
-Serializing 'values_list' in Django
-- https://sl.bing.net/eR1oAIpEHYG
-
-Q object in Django
-- https://www.bing.com/search?pglt=163&q=Q+in+Django&cvid=d363b05d76c04777ba26a628f1f7fd65&gs_lcrp=EgZjaHJvbWUyBggAEEUYOTIGCAEQABhAMgYIAhAAGEAyBggDEAAYQDIGCAQQABhAMgYIBRAAGEAyBggGEAAYQDIGCAcQRRg8MgYICBBFGDzSAQg2MjQ5ajBqMagCCLACAQ&FORM=ANNTA1&PC=U531
-- https://www.scaler.com/topics/django/q-objects-and-f-objects/
-
-"""
+import logging
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.http import FileResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from rest_framework import status
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.parsers import JSONParser
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.request import Request
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+from rest_framework.viewsets import ModelViewSet, ViewSet
+
+from .caches import SettlementCache
+from .conditionals import ConditionalGet
+from .contexts import GroupContext
+from .exporters import ExpenseHistoryExporter
+from .enums import JobStatus, Query, SettlementType
+from .executors import fell_back
+from .factories import SettlementStrategyFactory
+from .importers import GroupExpenseImporter
+from .instrumentation import Trace
+from .jobs import JobQueue, get_export_path
+from .ledgers import GroupBalanceLedger
+from .models import User, UserExpense, Group, GroupExpense, ExpensePaidBy, ExpenseSharedBy, Job
+from .parsers import NDJSONParser
+from .permissions import IsGroupAdmin, IsGroupAdminOrMember, IsGroupAdminOrExpenseCreator, HasGroupAccess
+from .queries import ExpenseFeedQuery, GroupMemberQuery
+from .serializers import ExpenseSerializer, GroupExpenseListReader, JobSerializer
+from .serializers import QueryUserExpenseSerializer, QueryGroupExpenseSerializer, QueryExpenseFeedSerializer
+from .serializers import UserSerializer, UserExpenseSerializer, GroupSerializer, GroupExpenseSerializer
+
+logger = logging.getLogger(__name__)
+
+
+def is_background(request: Request) -> bool:
+    """
+    :return: True if the request asks for the work to be queued as a background job: '?background=1'
+    """
+    return request.query_params.get('background', '').strip().lower() in ('1', 'true', 'yes')
+
+
+def job_accepted(request: Request, job: Job) -> Response:
+    """
+    :return: 202 Accepted, pointing to the status endpoint of the queued job
+    """
+    status_url = request.build_absolute_uri(f'/jobs/{job.id}/')
+    return Response(data={'job_id': job.id, 'status': job.status, 'status_url': status_url},
+                    status=status.HTTP_202_ACCEPTED, headers={'Location': status_url})
+
+
+class CreateUserViewSet(ModelViewSet):
+    queryset = User.objects.all()
+    serializer_class = UserSerializer
+
+
+class UserExpenseViewSet(ModelViewSet):
+    queryset = UserExpense.objects.all()
+    serializer_class = UserExpenseSerializer
+    permission_classes = [IsAuthenticated]
+
+    # Overridden
+    def perform_create(self, serializer):
+        # Added additional info while saving the instance
+        serializer.save(paid_by=self.request.user, created_by=self.request.user)
+
+
+class GroupViewSet(ModelViewSet):
+    queryset = Group.objects.all()
+    serializer_class = GroupSerializer
+    # NOTE: IsGroupAdmin is an object level permission
+    permission_classes = [IsAuthenticated, IsGroupAdmin]
+
+    # Overridden
+    def perform_create(self, serializer):
+        serializer.save(created_by=self.request.user)
+
+    """
+    CUSTOM ACTIONS:
+    
+    'detail' argument:
+    - True: indicates the specified action is for a single instance of the resource
+    - False: indicated the specified action is applicable to the entire resource collection
+    
+    Ref: https://djangocentral.com/how-to-use-action-decorator-in-django-rest-framework/#:~:text=In%20Django%20Rest%20Framework%2C%20the%20detail%20argument%20in,or%20to%20the%20entire%20resource%20collection%20%28list%20view%29.
+    """
+
+    @action(methods=['patch'], detail=True)
+    def add_member(self, request: Request, pk: int) -> Response:
+        deserialized = GroupSerializer(data=request.data, partial=True)
+        if not deserialized.is_valid():
+            return Response(data=deserialized.errors, status=status.HTTP_400_BAD_REQUEST)
+        group = self.get_object()  # returns the resource obj identified by the lookup field 'pk'
+        members = deserialized.validated_data.get('members', [])
+        # users = [get_object_or_404(User, pk=user_id) for user_id in members]
+        # group.members.add(*users)  # Adding multiple users
+        with transaction.atomic():  # the version keying the cached member ids moves along with the members
+            group.members.add(*members)
+            GroupBalanceLedger.bump_version(group.id)
+        GroupMemberQuery.invalidate(group)
+        # NOTE: not saving all the fields: the in-memory ledger_version is stale now
+        group.save(update_fields=['updated_at'])
+        return Response(data=GroupSerializer(group).data, status=status.HTTP_200_OK)
+
+    @action(methods=['put'], detail=True)
+    def update_name(self, request: Request, pk: int) -> Response:
+        deserialized = GroupSerializer(data=request.data)
+        if not deserialized.is_valid():
+            return Response(data=deserialized.errors, status=status.HTTP_400_BAD_REQUEST)
+        group = self.get_object()  # group instance identified by 'pk'
+        group.name = deserialized.validated_data['name']
+        group.save(update_fields=['name', 'updated_at'])  # never overwriting the ledger_version
+        return Response(data=GroupSerializer(group).data, status=status.HTTP_200_OK)
+
+    @action(methods=['delete'], detail=True)
+    def remove_member(self, request: Request, pk: int) -> Response:
+        deserialized = self.get_serializer(data=request.data, partial=True)
+        if not deserialized.is_valid():
+            return Response(data=deserialized.errors, status=status.HTTP_400_BAD_REQUEST)
+        instance = self.get_object()
+        users = deserialized.validated_data.get('members', [])
+        with transaction.atomic():  # the version keying the cached member ids moves along with the members
+            instance.members.remove(*users)  # breaking the association with the group
+            GroupBalanceLedger.bump_version(instance.id)
+        GroupMemberQuery.invalidate(instance)
+        return Response(data={
+            'removed_members': [user.id for user in users],
+            'group': self.get_serializer(instance).data
+        }, status=status.HTTP_200_OK)
+
+    # Overridden
+    def retrieve(self, request: Request, pk: int) -> Response:
+        group = self.get_object()  # checks HasGroupAccess
+        # the name is versioned by updated_at, the members by ledger_version (bumped on every membership change)
+        etag = ConditionalGet.make_etag('group', group.id, group.updated_at, group.ledger_version)
+        if ConditionalGet.is_fresh(request, etag):
+            return ConditionalGet.not_modified(etag)  # sparing the members query & the serialization
+        return Response(data=self.get_serializer(group).data, status=status.HTTP_200_OK,
+                        headers=ConditionalGet.get_headers(etag))
+
+    # Overridden
+    def get_permissions(self):
+        if self.action == 'retrieve':
+            permission_classes = [HasGroupAccess]
+        else:
+            permission_classes = GroupViewSet.permission_classes
+        return [permission() for permission in permission_classes]
+
+
+class ListCreateGroupExpenseViewSet(ModelViewSet):
+    queryset = GroupExpense.objects.all()
+    serializer_class = GroupExpenseSerializer
+    permission_classes = [IsGroupAdminOrMember]
+
+    """
+    LEARNING:
+    - The view obj (self) has access to both 'request' and 'group_id' owing to the below attributes it posses:
+      -- self.request
+      -- self.kwargs['group_id']
+    
+    Ref: Stackoverflow: Django REST Framework viewset per-action permissions
+    - https://stackoverflow.com/questions/19313314/django-rest-framework-viewset-per-action-permissions
+    
+    Ref: Object level permissions
+    - https://www.django-rest-framework.org/api-guide/permissions/#:~:text=If%20you%27re%20writing%20your%20own%20views%20and%20want,the%20point%20at%20which%20you%27ve%20retrieved%20the%20object.
+    
+    """
+
+    # Overridden
+    def create(self, request: Request, group_id: int) -> Response:
+        deserialized = self.serializer_class(data=request.data)
+        if not deserialized.is_valid():
+            return Response(data=deserialized.errors, status=status.HTTP_400_BAD_REQUEST)
+        # Passing additional data to the save: they will become part of the validated_data (check BaseSerializer)
+        # the group (and its member ids) already loaded by the permission check
+        group_expense = deserialized.save(created_by=request.user, group=GroupContext.of(request, group_id).group)
+        with Trace(logger, 'serialize', metric='serializer'):
+            data = GroupExpenseSerializer(group_expense).data
+        return Response(data=data, status=status.HTTP_201_CREATED)
+
+    # Overridden
+    def perform_create(self, serializer):  # *** IS NOT BEING EXECUTED BECAUSE WE HAVE OVERRIDDEN serializer.create()
+        group_id = self.kwargs['group_id']
+        group = get_object_or_404(Group, pk=group_id)
+        serializer.save(created_by=self.request.user, group=group)
+
+    # Overridden
+    def list(self, request, group_id: int) -> Response:
+        # the expenses of a group are versioned by its ledger_version: bumped on every expense create & delete
+        etag = ConditionalGet.make_etag('group-expenses', group_id, GroupContext.of(request, group_id).ledger_version)
+        if ConditionalGet.is_fresh(request, etag):
+            return ConditionalGet.not_modified(etag)
+        # NOTE: the serializer time includes the queries run while serializing
+        with Trace(logger, 'serialize', metric='serializer'):
+            # the values() based equivalent of GroupExpenseSerializer(queryset, many=True).data
+            data = GroupExpenseListReader.read(group_id)
+        return Response(data=data, status=status.HTTP_200_OK, headers=ConditionalGet.get_headers(etag))
+
+
+class ImportGroupExpenseViewSet(ViewSet):
+    permission_classes = [IsGroupAdminOrMember]
+    parser_classes = [JSONParser, NDJSONParser]
+
+    def bulk_import(self, request: Request, group_id: int) -> Response:
+        """
+        Accepts a list of group expenses (the same payload as 'ListCreateGroupExpenseViewSet.create' for each):
+        - JSON: a list, or {"expenses": [...]}
+        - NDJSON: one expense per line
+
+        The valid expenses are created and the invalid ones are reported by their index in the batch:
+        201 if all the expenses are created, 207 if only some of them, 400 if none
+        - Query Param: background = 1: queues the import as a job instead (202), the result is that of the job
+        """
+        items = request.data
+        if isinstance(items, dict):
+            items = items.get('expenses')
+        if not isinstance(items, list) or not items:
+            raise ValidationError('Expected a non-empty list of expenses')
+        max_items = settings.EXPENSE_IMPORT['MAX_ITEMS']
+        if len(items) > max_items:
+            raise ValidationError(f'At most {max_items} expenses can be imported in a single request')
+        if is_background(request):
+            return job_accepted(request, JobQueue.enqueue('import_expenses', {'group_id': group_id, 'items': items},
+                                                          created_by=request.user))
+        group = GroupContext.of(request, group_id).group
+        with Trace(logger, 'bulk_import', group=group_id, items=len(items)) as trace:
+            result = GroupExpenseImporter.run(group, request.user, items, settings.EXPENSE_IMPORT['CHUNK_SIZE'])
+            trace.fields.update(created=result['num_created'], errors=len(result['errors']))
+        if not result['errors']:
+            status_code = status.HTTP_201_CREATED
+        elif result['num_created']:
+            status_code = status.HTTP_207_MULTI_STATUS
+        else:
+            status_code = status.HTTP_400_BAD_REQUEST
+        return Response(data=result, status=status_code)
+
+
+class RetrieveUpdateDestroyGroupExpenseViewSet(ModelViewSet):
+    queryset = GroupExpense.objects.all()
+    serializer_class = GroupExpenseSerializer
+
+    # permission_classes = [IsGroupAdminOrMember]
+
+    # Overridden
+    def retrieve(self, request, group_id: int, pk: int) -> Response:
+        # ** NOTE: filter() is expected to yield multiple records and hence use 'many=True' in the serializer
+        # .filter(group_id=group_id, pk=pk)  # many=True
+        # a group expense is never updated in place: updated_at versions it (and its splits)
+        updated_at = get_object_or_404(self.get_queryset().values_list('updated_at', flat=True),
+                                       group_id=group_id, pk=pk)
+        etag = ConditionalGet.make_etag('group-expense', pk, updated_at)
+        if ConditionalGet.is_fresh(request, etag):
+            return ConditionalGet.not_modified(etag)
+        group_expense = get_object_or_404(self.get_queryset(), group_id=group_id, pk=pk)
+        with Trace(logger, 'serialize', metric='serializer'):
+            data = self.get_serializer(group_expense, many=False).data
+        return Response(data=data, status=status.HTTP_200_OK, headers=ConditionalGet.get_headers(etag))
+
+    """
+    LEARNING:
+    - django.core.exceptions.ImproperlyConfigured: Cannot use the @action decorator on the following methods,
+    as they are existing routes: destroy
+    """
+
+    # ** NOT ALLOWED: existing route
+    # @action(methods=['delete'], detail=True, permission_classes=[IsGroupAdminOrMember])
+    # Overridden
+    def destroy(self, request, group_id: int, pk: int) -> Response:
+        pass
+
+    """
+    *** ISSUE:
+    - Permission class specified in the @action decorator is not being checked
+    - Stackoverflow:
+      -- https://stackoverflow.com/questions/60114466/django-drf-permission-classes-not-working/78998672#78998672
+    
+    READ MORE:
+    - ViewSets:
+      - https://www.django-rest-framework.org/api-guide/viewsets/
+    
+    """
+
+    # @action decorator is currently dormant
+    # @action(methods=['delete'], detail=True, permission_classes=[IsAuthenticated])
+    def del_expense(self, request: Request, group_id: int, pk: int) -> Response:
+        # group_expense = get_object_or_404(self.get_queryset(), group_id=group_id, pk=pk)
+        # print(':: self.get_object():', self.get_object())  # Uses default lookup field 'pk' to get the target object
+        # *** NOTE: calling self.get_object() will automatically trigger the permission class (if any) for object access
+        # - The permission class must override 'has_object_permission()'
+        group_expense = self.get_object()
+        group_expense.delete()  # *** CAUSES DB INTEGRITY ISSUE: Unable to handle deletion of related objects
+        return Response(data={'deleted': True, 'group_expense': self.get_serializer(group_expense).data},
+                        status=status.HTTP_200_OK)
+
+    """
+    LEARNING:
+    - Q. How to handle delete for a Model having ManyToMany relations in Django?
+      -- https://sl.bing.net/kaNLjcrqhGu
+    
+    """
+
+    def del_exp_related(self, request: Request, group_id: int, pk: int) -> Response:
+        instance = self.get_object()  # will return the target obj if the user has the required permissions
+        self.perform_destroy(instance)
+        # NOTE: Using ExpenseSerializer because the instance is now deleted and does not point to any group
+        return Response(data={'deleted': True, 'group_expense': ExpenseSerializer(instance).data},
+                        status=status.HTTP_200_OK)
+
+    # Overridden
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            # reverting the expense from the group balance ledger
+            deltas = GroupBalanceLedger.get_deltas(instance.paid_by.values_list('user_id', 'amount'),
+                                                   instance.shared_by.values_list('user_id', 'amount'), sign=-1)
+            GroupBalanceLedger.apply(instance.group_id, deltas)
+            # Deleting all the ManyToMany related fields associated with the group expense
+            paid_by = instance.paid_by.all()
+            for expense_paid_by in paid_by:
+                expense_paid_by.delete()
+            shared_by = instance.shared_by.all()
+            for expense_shared_by in shared_by:
+                expense_shared_by.delete()
+            # finally deleting the target
+            instance.delete()
+
+    # Overridden
+    def get_permissions(self):
+        if self.action == 'del_exp_related':  # 'del_expense':
+            permission_classes = [IsGroupAdminOrMember, IsGroupAdminOrExpenseCreator]
+        else:
+            permission_classes = [IsGroupAdminOrMember]
+        return [permission() for permission in permission_classes]
+
+
+class ProfileViewSet(ModelViewSet):
+    queryset = User.objects.all()
+    serializer_class = UserSerializer
+    permission_classes = [IsAuthenticated]
+
+    # Overridden
+    def get_queryset(self):
+        queryset = super().get_queryset()  # Ensuring queryset is refreshed; read doc str
+        return queryset.filter(id=self.request.user.id)
+
+    # Overridden
+    def get_object(self):
+        return self.get_queryset().first()
+
+
+class QueryExpenseViewSet(ViewSet):
+    permission_classes = [IsAuthenticated]
+    page_size = 50  # default page size of the paginated feed
+    max_page_size = 500
+
+    def query_user_expense(self, user: User):
+        return UserExpense.objects.filter(Q(paid_by=user) | Q(paid_to=user))
+
+    def query_group_expense_paid_by(self, user: User):
+        return ExpensePaidBy.objects.filter(user=user)
+
+    def query_group_expense_shared_by(self, user: User):
+        return ExpenseSharedBy.objects.filter(user=user)
+
+    def get_user_expense(self, user: User):
+        queryset = self.query_user_expense(user).order_by('created_at')
+        serialized = QueryUserExpenseSerializer(queryset, many=True, context={'requested_by': user})
+        with Trace(logger, 'serialize', metric='serializer'):
+            return serialized.data
+
+    def get_group_expense(self, user: User):
+        queryset_1 = self.query_group_expense_paid_by(user).order_by('expense__created_at')
+        queryset_1 = QueryGroupExpenseSerializer.prefetch(queryset_1)
+        serialized_1 = QueryGroupExpenseSerializer(queryset_1, many=True, context={'is_owed': False})
+        queryset_2 = self.query_group_expense_shared_by(user).order_by('expense__created_at')
+        queryset_2 = QueryGroupExpenseSerializer.prefetch(queryset_2)
+        serialized_2 = QueryGroupExpenseSerializer(queryset_2, many=True, context={'is_owed': True})
+        with Trace(logger, 'serialize', metric='serializer'):
+            return serialized_1.data + serialized_2.data
+
+    def get_expense_page(self, request: Request, query_type: Query) -> Response:
+        """
+        Cursor (keyset) paginated feed: every page is a single UNION ALL query, however long the history is
+        """
+        try:
+            limit = int(request.query_params.get('limit', self.page_size))
+        except ValueError:
+            raise ValidationError('Invalid limit!')
+        limit = max(1, min(limit, self.max_page_size))
+        cursor = request.query_params.get('cursor')
+        if cursor is not None:
+            cursor = ExpenseFeedQuery.decode_cursor(cursor)
+        rows = ExpenseFeedQuery.get_page(request.user, query_type, cursor=cursor, limit=limit + 1)
+        next_url = None
+        if len(rows) > limit:  # fetched one extra row to find out if there is a next page
+            rows = rows[:limit]
+            next_url = replace_query_param(request.build_absolute_uri(), 'cursor',
+                                           ExpenseFeedQuery.encode_cursor(rows[-1]))
+        with Trace(logger, 'serialize', metric='serializer'):
+            results = QueryExpenseFeedSerializer(rows, many=True).data
+        return Response(data={'next': next_url, 'results': results}, status=status.HTTP_200_OK)
+
+    @action(methods=['get'], detail=False)
+    def get_expense(self, request: Request):
+        query = (request.query_params.get('query', 'all')).strip().lower()
+        query_type = Query(query)
+        if 'limit' in request.query_params or 'cursor' in request.query_params:
+            return self.get_expense_page(request, query_type)
+        if query_type == Query.USER_EXPENSE:
+            expense_data = self.get_user_expense(request.user)
+        elif query_type == Query.GROUP_EXPENSE:
+            expense_data = self.get_group_expense(request.user)
+        else:
+            expense_data = self.get_user_expense(request.user) + self.get_group_expense(request.user)
+        expense_data.sort(key=lambda data: data['created_at'], reverse=True)
+        return Response(data=expense_data, status=status.HTTP_200_OK)
+
+    @action(methods=['get'], detail=False)
+    def export(self, request: Request) -> StreamingHttpResponse:
+        """
+        Streams the full history of the user, oldest first: see ExpenseHistoryExporter
+        - Query Param: query = all | user_expense | group_expense
+        - Query Param: file_type = ndjson | csv
+        - Query Param: background = 1: the file is written by a job instead (202), then served by JobViewSet.download
+        NOTE: not 'format': reserved by DRF for the renderer override
+        """
+        query_type = Query((request.query_params.get('query', 'all')).strip().lower())
+        file_type = request.query_params.get('file_type', 'ndjson').strip().lower()
+        if file_type not in ExpenseHistoryExporter.FORMATS:
+            raise ValidationError(f'Invalid file_type! Choose from {", ".join(ExpenseHistoryExporter.FORMATS)}')
+        if is_background(request):
+            return job_accepted(request, JobQueue.enqueue('export_expenses', {
+                'query': query_type.value, 'file_type': file_type}, created_by=request.user))
+        extension, content_type = ExpenseHistoryExporter.FORMATS[file_type]
+        response = StreamingHttpResponse(
+            ExpenseHistoryExporter.stream(request.user, query_type, file_type, settings.EXPENSE_EXPORT['CHUNK_SIZE']),
+            content_type=content_type)
+        response['Content-Disposition'] = (f'attachment; filename="expenses-{request.user.id}-{query_type.value}.'
+                                           f'{extension}"')
+        return response
+
+    def get_owed(self, request: Request):
+        pass
+
+
+class GroupSettleUpViewSet(ViewSet):
+    permission_classes = [IsGroupAdminOrMember]
+
+    def settle_up(self, request: Request, group_id: int) -> Response:
+        query_strategy = request.query_params.get('strategy', SettlementType.N_MINUS_1.value)
+        settlement_strategy = SettlementStrategyFactory.get_by_name(query_strategy)
+        query_strategy = query_strategy.strip().lower()
+        if is_background(request):
+            return job_accepted(request, JobQueue.enqueue('settle_up', {
+                'group_id': group_id, 'strategy': query_strategy}, created_by=request.user))
+        # NOTE: the version must be read before the ledger: a result is never cached under a newer version
+        ledger_version = GroupContext.of(request, group_id).ledger_version
+        etag = ConditionalGet.make_etag('settle-up', group_id, query_strategy, ledger_version)
+        if ConditionalGet.is_fresh(request, etag):
+            return ConditionalGet.not_modified(etag)
+        data = SettlementCache.get(group_id, query_strategy, ledger_version)
+        if data is not None:
+            logger.debug('settle_up: cache hit group=%s strategy=%s version=%s', group_id, query_strategy,
+                         ledger_version)
+            return Response(data=data, status=status.HTTP_200_OK, headers=ConditionalGet.get_headers(etag))
+        # reading the materialized ledger: one row per user instead of the full expense history
+        balance_sheet = GroupBalanceLedger.get_balance_sheet(group_id)
+        # print(':: LOG :: GroupSettleUpViewSet | settle_up ::')
+        # print(':: balance_sheet ::', balance_sheet)
+        with Trace(logger, 'settle_up', metric='strategy', group=group_id, strategy=query_strategy,
+                   users=len(balance_sheet)) as trace:
+            transactions = settlement_strategy.settle_up(balance_sheet)
+            trace.fields['transactions'] = len(transactions)
+        data = [transaction.to_dict() for transaction in transactions]
+        if fell_back(settlement_strategy):
+            # not the result of the strategy (see ProcessPoolSettlementStrategy): neither cached nor validated
+            return Response(data=data, status=status.HTTP_200_OK)
+        SettlementCache.set(group_id, query_strategy, ledger_version, data)
+        return Response(data=data, status=status.HTTP_200_OK, headers=ConditionalGet.get_headers(etag))
+
+
+class JobViewSet(ViewSet):
+    """
+    The status of the background jobs (see jobs.JobQueue) queued by the user; the admins see every job
+    """
+    permission_classes = [IsAuthenticated]
+    max_page_size = 100
+
+    def get_queryset(self):
+        queryset = Job.objects.order_by('-id')
+        if not self.request.user.is_staff:
+            queryset = queryset.filter(created_by=self.request.user)
+        return queryset
+
+    def list(self, request: Request) -> Response:
+        """
+        The latest jobs first
+        - Query Param: status = queued | running | succeeded | failed
+        """
+        queryset = self.get_queryset()
+        job_status = request.query_params.get('status')
+        if job_status is not None:
+            queryset = queryset.filter(status=JobStatus(job_status.strip().lower()).value)
+        return Response(data=JobSerializer(queryset[:self.max_page_size], many=True).data, status=status.HTTP_200_OK)
+
+    def retrieve(self, request: Request, pk: int) -> Response:
+        job = get_object_or_404(self.get_queryset(), pk=pk)
+        return Response(data=JobSerializer(job).data, status=status.HTTP_200_OK)
+
+    def download(self, request: Request, pk: int) -> FileResponse:
+        """
+        Serves the file written by a succeeded export job
+        """
+        job = get_object_or_404(self.get_queryset(), pk=pk, name='export_expenses')
+        if job.status != JobStatus.SUCCEEDED.value:
+            raise ValidationError(f'The export is not ready: {job.status}')
+        path = get_export_path(job)
+        if not path.exists():
+            raise ValidationError('The export file no longer exists')
+        return FileResponse(open(path, 'rb'), as_attachment=True, filename=job.result['file_name'],
+                            content_type=job.result['content_type'])
+
+
+"""
+LEARNINGS:
+
+Q. How to create a custom column in QuerySet in DRF?
+- https://www.bing.com/search?q=How+to+create+a+custom+column+in+QuerySet+in+DRF&qs=n&form=QBRE&sp=-1&ghc=1&lq=0&pq=how+to+create+a+custom+column+in+queryset+in+dr&sc=0-47&sk=&cvid=DF8CDD997C9D4D7381E092F9392BC245&ghsh=0&ghacc=0&ghpl=
+
+Passing context to the serializer while serializing queryset
+- https://sl.bing.net/hzT3Pyini56
+
+Combining QuerySet from two different base models
+- https://www.bing.com/search?pglt=163&q=How+to+combine+results+from+two+different+base+models+in+DRF&cvid=79f10d0898e849299d2846ebbe58470e&gs_lcrp=EgZjaHJvbWUyBggAEEUYOdIBCDcxMDNqMGoxqAIAsAIA&FORM=ANNTA1&PC=U531
+
+Q. How to make querysets returned from two different base models compatible for union?
+- https://www.bing.com/search?q=How+to+make+querysets+returned+from+two+different+base+models+compatible+for+union&qs=n&form=QBRE&sp=-1&ghc=1&lq=1&pq=how+to+make+querysets+returned+from+two+different+base+models+compatible+for+union&sc=1-82&sk=&cvid=E445EAB5C0664D1A97757B12BEC39728&ghsh=0&ghacc=0&ghpl=&showconv=0
+- https://docs.djangoproject.com/en/5.1/ref/models/querysets/#union
+
+Serializing 'values_list' in Django
+- https://sl.bing.net/eR1oAIpEHYG
+
+Q object in Django
+- https://www.bing.com/search?pglt=163&q=Q+in+Django&cvid=d363b05d76c04777ba26a628f1f7fd65&gs_lcrp=EgZjaHJvbWUyBggAEEUYOTIGCAEQABhAMgYIAhAAGEAyBggDEAAYQDIGCAQQABhAMgYIBRAAGEAyBggGEAAYQDIGCAcQRRg8MgYICBBFGDzSAQg2MjQ5ajBqMagCCLACAQ&FORM=ANNTA1&PC=U531
+- https://www.scaler.com/topics/django/q-objects-and-f-objects/
+
+"""